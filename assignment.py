@@ -0,0 +1,105 @@
+"""Assigning inspectors to bridges over a BridgeTable.
+
+The bridges are split once into the three priority tiers used by
+assign_inspectors (high, medium and low BCI bands), and each tier gets its
+own grid index searched with that tier's radius. A bridge is removed from
+its tier index as soon as it is assigned, so later inspectors never look at
+bridges that were already claimed, and whether a bridge is assigned is kept
+in a bytearray with one flag per table row.
+
+Bridges can also be split into tiers by the BCI they are projected to have
+in a given year, from the trends of their BCI histories (see bci_trends),
+to plan ahead for bridges that will soon need attention.
+"""
+
+from math import inf
+from typing import Optional
+
+from bci_index import get_bci_index
+from bci_trends import get_bci_trends
+from bridge_table import BridgeTable
+from constants import (
+    HIGH_PRIORITY_BCI, MEDIUM_PRIORITY_BCI, LOW_PRIORITY_BCI,
+    HIGH_PRIORITY_RADIUS, MEDIUM_PRIORITY_RADIUS, LOW_PRIORITY_RADIUS)
+from instrumentation import instrumented
+from spatial_index import GridIndex
+
+# (radius, lowest BCI (exclusive), highest BCI (inclusive)) of each priority
+# tier, in the order assign_inspectors works through them.
+PRIORITY_TIERS = [
+    (HIGH_PRIORITY_RADIUS, -inf, HIGH_PRIORITY_BCI),
+    (MEDIUM_PRIORITY_RADIUS, HIGH_PRIORITY_BCI, MEDIUM_PRIORITY_BCI),
+    (LOW_PRIORITY_RADIUS, MEDIUM_PRIORITY_BCI, LOW_PRIORITY_BCI)
+]
+
+
+def tier_rows(table: BridgeTable,
+              year: Optional[float] = None) -> list[list[int]]:
+    """Return, for each tier in PRIORITY_TIERS, the rows of the bridges in
+    table whose current BCI is in that tier's band, using the current BCI
+    index of table. If year is given, the bridges whose BCI projected for
+    year is in that band are returned instead.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> tier_rows(BridgeTable(THREE_BRIDGES))
+    [[], [], [0, 1, 2]]
+    >>> tier_rows(BridgeTable(THREE_BRIDGES), 2035)
+    [[], [1], [0, 2]]
+    """
+
+    if year is None:
+        index = get_bci_index(table)
+        return [index.rows_in_band(low, high)
+                for _, low, high in PRIORITY_TIERS]
+    tiers = [[] for _ in PRIORITY_TIERS]
+    for row, bci in enumerate(get_bci_trends(table).projected(year)):
+        for tier, (_, low, high) in zip(tiers, PRIORITY_TIERS):
+            if low < bci <= high:
+                tier.append(row)
+                break
+    return tiers
+
+
+@instrumented()
+def assign_from_table(table: BridgeTable, inspectors: list[list[float]],
+                      max_bridges: int,
+                      year: Optional[float] = None) -> list[list[int]]:
+    """Return the same assignment of bridges in table to inspectors as
+    assign_inspectors: each inspector in turn takes unassigned high, then
+    medium, then low priority bridges within that tier's radius, in order of
+    id, until it has max_bridges bridges. If year is given, the tiers are
+    those of the BCIs projected for year.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> assign_from_table(table, [[43.20, -80.35], [43.10, -80.15]], 1)
+    [[1], [2]]
+    >>> assign_from_table(table, [[43.20, -80.35], [45.0368, -81.34]], 2)
+    [[1, 2], [3]]
+    """
+
+    indexes = [GridIndex(table, rows=rows)
+               for rows in tier_rows(table, year)]
+    assigned = bytearray(len(table))
+    ids = table.ids
+    output = []
+    for inspector in inspectors:
+        output.append([])
+        for index, (radius, _, _) in zip(indexes, PRIORITY_TIERS):
+            if len(output[-1]) == max_bridges:
+                break
+            rows = index.rows_in_radius(inspector[0], inspector[1], radius)
+            rows.sort(key=ids.__getitem__)
+            for row in rows:
+                if len(output[-1]) == max_bridges:
+                    break
+                if not assigned[row]:
+                    assigned[row] = 1
+                    index.remove(row)
+                    output[-1].append(ids[row])
+    return output
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,113 @@
+"""Compact BCI histories with constant-time recording of new inspections.
+
+A formatted record keeps its BCIs in a list, most recent first, so
+inspect_bridges records a new score with list.insert(0, ...), which moves
+the whole history, and every score is a separate float object. A
+BciHistory reads exactly like that list (index 0 is the current BCI) but
+stores the scores oldest first in a typed array, so inserting at the front
+of the history is an append to the array, and each score takes 8 bytes.
+"""
+
+from array import array
+from typing import Iterable, Iterator, Union
+
+from bridge_table import BridgeTable
+from constants import BCIS_INDEX
+
+
+class BciHistory:
+    """A BCI history, most recent first, that behaves like a list of floats.
+
+    >>> history = BciHistory([72.3, 69.5, 70.0])
+    >>> history.insert(0, 71.9)
+    >>> history
+    [71.9, 72.3, 69.5, 70.0]
+    >>> history[0], history[-1], history[1:3], len(history)
+    (71.9, 70.0, [72.3, 69.5], 4)
+    >>> history == [71.9, 72.3, 69.5, 70.0]
+    True
+    >>> sum(history) == sum([71.9, 72.3, 69.5, 70.0])
+    True
+    """
+
+    __slots__ = ('_scores',)
+
+    def __init__(self, bcis: Iterable[float] = ()) -> None:
+        """Initialize a history with the BCIs in bcis, most recent first."""
+
+        self._scores = array('d', bcis)
+        self._scores.reverse()
+
+    def insert(self, index: int, bci: float) -> None:
+        """Insert bci before position index of the history. Inserting at
+        position 0, as a new inspection does, takes constant time. Like
+        list.insert, a negative index counts from the end and an index past
+        either end inserts at that end.
+
+        >>> history = BciHistory([72.3, 69.5, 70.0])
+        >>> history.insert(-1, 71.0)
+        >>> history.insert(10, 65.2)
+        >>> history.insert(-10, 73.4)
+        >>> history == [73.4, 72.3, 69.5, 71.0, 70.0, 65.2]
+        True
+        """
+
+        length = len(self._scores)
+        if index < 0:
+            index = max(index + length, 0)
+        self._scores.insert(length - min(index, length), bci)
+
+    def append(self, bci: float) -> None:
+        """Add bci as the oldest BCI of the history."""
+
+        self._scores.insert(0, bci)
+
+    def __getitem__(self,
+                    index: Union[int, slice]) -> Union[float, list[float]]:
+        if isinstance(index, slice):
+            return self._scores[::-1][index].tolist()
+        if index < 0:
+            index += len(self._scores)
+        if not 0 <= index < len(self._scores):
+            raise IndexError('BCI history index out of range')
+        return self._scores[len(self._scores) - 1 - index]
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __iter__(self) -> Iterator[float]:
+        return reversed(self._scores)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, BciHistory):
+            return self._scores == other._scores
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def compact_histories(table: BridgeTable) -> None:
+    """Replace the BCI list of every record in table with a BciHistory.
+
+    >>> from bridge_functions import THREE_BRIDGES, inspect_bridges
+    >>> from copy import deepcopy
+    >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+    >>> compact_histories(table)
+    >>> inspect_bridges(table, [1], '09/15/2018', 71.9)
+    >>> table.record(1)[BCIS_INDEX]
+    [71.9, 72.3, 69.5, 70.0, 70.3, 70.5, 70.7, 72.9]
+    >>> table.bcis[0]
+    71.9
+    """
+
+    for bridge in table:
+        if not isinstance(bridge[BCIS_INDEX], BciHistory):
+            bridge[BCIS_INDEX] = BciHistory(bridge[BCIS_INDEX])
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,130 @@
+"""A sorted index on the current BCI of the bridges in a BridgeTable.
+
+Threshold and band questions (BCI at most 60, between 60 and 70, ...) are
+answered with binary searches. Intersecting a band with a set of rows from
+another query, such as a radius query, checks whichever side is smaller:
+the given rows against the BCI column, or the band against the given rows.
+"""
+
+from math import inf
+from typing import Iterable, Optional
+
+from bridge_table import BridgeTable
+from sorted_index import SortedIndex
+
+
+class BciIndex:
+    """The bridges of a table sorted by current BCI. Bridges without a BCI
+    are not indexed.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> index = BciIndex(BridgeTable(THREE_BRIDGES))
+    >>> index.rows_in_band(high=72)
+    [1]
+    >>> index.rows_in_band(70, 100)
+    [0, 1, 2]
+    >>> index.filter_rows([2, 1], 72, 100)
+    [2]
+    >>> index.ids_below(72.3, [1, 3])
+    [1]
+    """
+
+    def __init__(self, table: BridgeTable) -> None:
+        """Initialize the index of the current BCIs of the bridges in
+        table.
+        """
+
+        self.table = table
+        self._index = SortedIndex.from_values(
+            bci if bci == bci else None for bci in table.bcis)
+
+    def update(self, row: int) -> None:
+        """Index the current BCI of the bridge at row of the table again.
+
+        >>> from bridge_functions import THREE_BRIDGES, inspect_bridges
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> index = get_bci_index(table)
+        >>> inspect_bridges(table, [3], '09/15/2018', 58.0)
+        >>> index.rows_in_band(high=60)
+        [2]
+        """
+
+        bci = self.table.bcis[row]
+        self._index.set(row, bci if bci == bci else None)
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the bridges at the rows that renumbered maps to -1 (see
+        bridge_table.renumbering), and renumber the others.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> index = get_bci_index(table)
+        >>> table.delete_rows([1])
+        >>> index.rows_in_band(high=80), index.ids_below(80)
+        ([0], [1])
+        """
+
+        self._index.delete_rows(renumbered)
+
+    def rows_in_band(self, low: float = -inf, high: float = inf) -> list[int]:
+        """Return the rows, in table order, of the bridges whose current BCI
+        is more than low and at most high.
+        """
+
+        return self._index.rows_between(low, high, include_low=False)
+
+    def count_in_band(self, low: float = -inf, high: float = inf) -> int:
+        """Return the number of rows rows_in_band would return."""
+
+        return self._index.count_between(low, high, include_low=False)
+
+    def filter_rows(self, rows: Iterable[int], low: float = -inf,
+                    high: float = inf) -> list[int]:
+        """Return the rows among rows, in table order, of the bridges whose
+        current BCI is more than low and at most high.
+        """
+
+        rows = list(rows)
+        if len(rows) <= self.count_in_band(low, high):
+            bcis = self.table.bcis
+            return sorted(row for row in rows if low < bcis[row] <= high)
+        wanted = set(rows)
+        return [row for row in self.rows_in_band(low, high) if row in wanted]
+
+    def ids_below(self, limit: float,
+                  bridge_ids: Optional[Iterable[int]] = None) -> list[int]:
+        """Return the ids, in table order, of the bridges whose current BCI
+        is at most limit, keeping only ids in bridge_ids if it is given.
+        """
+
+        if bridge_ids is None:
+            rows = self.rows_in_band(high=limit)
+        else:
+            rows = self.filter_rows(
+                {self.table.row_of(bridge_id) for bridge_id in bridge_ids}
+                - {-1}, high=limit)
+        ids = self.table.ids
+        return [ids[row] for row in rows]
+
+
+def get_bci_index(table: BridgeTable) -> BciIndex:
+    """Return the current BCI index of table, building it on first use. The
+    index follows later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_bci_index(table) is get_bci_index(table)
+    True
+    """
+
+    if 'bcis' not in table.derived:
+        table.derived['bcis'] = BciIndex(table)
+        table.listeners.append(table.derived['bcis'].update)
+        table.removers.append(table.derived['bcis'].delete_rows)
+    return table.derived['bcis']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
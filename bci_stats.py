@@ -0,0 +1,158 @@
+"""Cached statistics of the BCI history of every bridge in a BridgeTable.
+
+The statistics are computed for all bridges when the cache is built and
+kept in one typed array per statistic. When a bridge's record changes (for
+example through inspect_bridges) only that bridge's statistics are
+computed again.
+
+Like the other derived structures of a BridgeTable, the cache is built by
+get_bci_stats on first use rather than by load_table: the build is a pass
+over every history (about 0.5 s for 100k bridges), which a caller that
+never asks for BCI statistics should not pay, and which the first
+get_average_bci call pays once instead.
+"""
+
+from array import array
+from math import nan
+from typing import NamedTuple, Optional
+
+from bridge_table import BridgeTable, compact
+from constants import BCIS_INDEX
+
+# Number of most recent BCIs averaged into recent_mean.
+RECENT_COUNT = 3
+
+
+class BciSummary(NamedTuple):
+    """The statistics of one bridge's BCI history. Every float is nan if
+    the bridge has no BCIs.
+    """
+    mean: float
+    count: int
+    minimum: float
+    maximum: float
+    latest: float
+    recent_mean: float
+
+
+def summarize(bcis: list[float], recent: int = RECENT_COUNT) -> BciSummary:
+    """Return the statistics of the BCI history bcis, most recent first,
+    where recent_mean is the mean of the recent most recent BCIs.
+
+    >>> tuple(summarize([72.3, 69.5, 70.0, 70.3, 70.5, 70.7, 72.9]))
+    (70.88571428571429, 7, 69.5, 72.9, 72.3, 70.60000000000001)
+    >>> summarize([]).count
+    0
+    """
+
+    if not bcis:
+        return BciSummary(nan, 0, nan, nan, nan, nan)
+    latest = bcis[:recent]
+    return BciSummary(sum(bcis) / len(bcis), len(bcis), min(bcis), max(bcis),
+                      bcis[0], sum(latest) / len(latest))
+
+
+class BciStats:
+    """The statistics of the BCI histories of the bridges in a table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> stats = BciStats(BridgeTable(THREE_BRIDGES))
+    >>> list(stats.counts)
+    [7, 7, 8]
+    >>> list(stats.maximums)
+    [72.9, 73.3, 90.1]
+    >>> stats.summary(3).latest
+    85.1
+    >>> stats.summary(42)
+    """
+
+    def __init__(self, table: BridgeTable,
+                 recent: int = RECENT_COUNT) -> None:
+        """Initialize the statistics of the bridges in table, where
+        recent_mean averages the recent most recent BCIs.
+        """
+
+        self.table = table
+        self.recent = recent
+        self.means = array('d')
+        self.counts = array('q')
+        self.minimums = array('d')
+        self.maximums = array('d')
+        self.latest = array('d')
+        self.recent_means = array('d')
+        for row in range(len(table)):
+            self.update(row)
+
+    def _columns(self) -> tuple[array, ...]:
+        """Return the statistic arrays in the order of BciSummary fields."""
+
+        return (self.means, self.counts, self.minimums, self.maximums,
+                self.latest, self.recent_means)
+
+    def update(self, row: int) -> None:
+        """Compute the statistics of the bridge at row of the table again,
+        adding them if the bridge is new.
+
+        >>> from bridge_functions import THREE_BRIDGES, inspect_bridges
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> stats = get_bci_stats(table)
+        >>> inspect_bridges(table, [3], '09/15/2018', 95.0)
+        >>> stats.summary(3).maximum, stats.summary(3).count
+        (95.0, 9)
+        """
+
+        summary = summarize(self.table[row][BCIS_INDEX], self.recent)
+        if row == len(self.means):
+            for column, value in zip(self._columns(), summary):
+                column.append(value)
+        else:
+            for column, value in zip(self._columns(), summary):
+                column[row] = value
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the statistics of the bridges at the rows that renumbered
+        maps to -1 (see bridge_table.renumbering).
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> stats = get_bci_stats(table)
+        >>> table.delete_rows([1])
+        >>> list(stats.counts), stats.summary(3).latest
+        ([7, 8], 85.1)
+        """
+
+        for column in self._columns():
+            compact(column, renumbered)
+
+    def summary(self, bridge_id: int) -> Optional[BciSummary]:
+        """Return the statistics of the bridge with id bridge_id, or None if
+        there is no such bridge.
+        """
+
+        row = self.table.row_of(bridge_id)
+        if row == -1:
+            return None
+        return BciSummary(*(column[row] for column in self._columns()))
+
+
+def get_bci_stats(table: BridgeTable) -> BciStats:
+    """Return the BCI statistics of table, building them on first use. The
+    statistics follow later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_bci_stats(table) is get_bci_stats(table)
+    True
+    """
+
+    if 'bci_stats' not in table.derived:
+        table.derived['bci_stats'] = BciStats(table)
+        table.listeners.append(table.derived['bci_stats'].update)
+        table.removers.append(table.derived['bci_stats'].delete_rows)
+    return table.derived['bci_stats']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,466 @@
+"""Deterioration trends of the BCI histories of a whole inventory.
+
+The BCI histories of all bridges are held as one ragged BciSeries: a flat
+array of BCIs, a parallel array of the years they were measured in, and
+offsets where the values of bridge i are values[offsets[i]:offsets[i + 1]],
+most recent first. fit_trends fits a least-squares line through every
+bridge's history in one pass, from prefix sums of the flat arrays taken
+difference-wise at the offsets, so no per-bridge lists are built. The
+slopes give the projected BCI of each bridge at a future year and the
+projected year it falls to HIGH_PRIORITY_BCI or MEDIUM_PRIORITY_BCI.
+
+A formatted history has lost the years of its BCIs (format_bcis drops the
+empty yearly columns). read_bci_series reads them from the CSV header,
+while history_series dates a formatted history from its last inspection,
+one inspection every interval years. The interval defaults to
+INSPECTION_INTERVAL, the usual gap in the exports, and every function and
+class that dates histories takes it as a parameter.
+
+format_data keeps the current BCI column of an export in front of the
+yearly ones, and that column repeats the most recent yearly BCI, so by
+default a second BCI equal to the first is taken to be that repeat and
+left out. A table loaded from a CSV file is best fitted to the exactly
+dated histories of read_bci_series, passed as the series of BciTrends or
+get_bci_trends; an inspection after that is dated by its own date.
+"""
+
+import csv
+from array import array
+from itertools import accumulate
+from math import inf, nan
+from operator import mul
+from typing import Iterable, NamedTuple, Optional, TextIO
+
+from bridge_table import BridgeTable, compact
+from constants import (
+    BCIS_INDEX, LAST_INSPECTED_INDEX, HIGH_PRIORITY_BCI, MEDIUM_PRIORITY_BCI)
+from date_index import MISSING, year_number
+
+# Years between two inspections of a bridge, as assumed when dating a
+# formatted BCI history.
+INSPECTION_INTERVAL = 2
+
+
+class BciSeries(NamedTuple):
+    """The dated BCI histories of a sequence of bridges, as ragged arrays:
+    the BCIs of bridge i are values[offsets[i]:offsets[i + 1]], most recent
+    first, measured in the years at the same positions of years.
+    """
+    values: array
+    years: array
+    offsets: array
+
+
+class TrendFit(NamedTuple):
+    """The fitted trend of each bridge of a BciSeries: the slope in BCI per
+    year of the least-squares line through its history (nan if it has
+    fewer than two years), and its most recent BCI and the year it was
+    measured in (both nan if it has no BCIs).
+    """
+    slopes: array
+    latest: array
+    latest_years: array
+
+
+def _empty_series() -> BciSeries:
+    """Return a BciSeries of no bridges."""
+
+    return BciSeries(array('d'), array('d'), array('q', [0]))
+
+
+def read_bci_series(csv_file: TextIO) -> BciSeries:
+    """Return the BCI histories of the records of the open bridge data CSV
+    file csv_file, in file order, dated by the yearly BCI columns of its
+    header. The current BCI column is left out: it repeats the most recent
+    yearly BCI.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    reader = csv.reader(csv_file)
+    next(reader)
+    header = next(reader)
+    year_columns = [(column, float(name)) for column, name
+                    in enumerate(header)
+                    if column > BCIS_INDEX and name.strip().isdigit()]
+    series = _empty_series()
+    for record in reader:
+        for column, year in year_columns:
+            if column < len(record) and record[column] != '':
+                series.values.append(float(record[column]))
+                series.years.append(year)
+        series.offsets.append(len(series.values))
+    return series
+
+
+def _history_values(bridge: list, interval: int,
+                    repeats_current: bool = True) -> tuple[list[float],
+                                                            list[float]]:
+    """Return the BCIs of the formatted record bridge, most recent first,
+    and the years they are taken to be measured in: the year of the last
+    inspection for the current BCI and interval years earlier for each
+    older one. If repeats_current is True, the BCIs start with an export's
+    current BCI column, and a second BCI equal to it is the same score
+    again, so it is left out.
+
+    >>> bridge = [0] * 11 + ['04/13/2012', [72.3, 72.3, 69.5, 70.0]]
+    >>> _history_values(bridge, 2)
+    ([72.3, 69.5, 70.0], [2012, 2010, 2008])
+    >>> _history_values(bridge, 1, False)
+    ([72.3, 72.3, 69.5, 70.0], [2012, 2011, 2010, 2009])
+    >>> _history_values([0] * 11 + ['', [72.3]], 2)
+    ([], [])
+    """
+
+    year = year_number(bridge[LAST_INSPECTED_INDEX][-4:])
+    bcis = list(bridge[BCIS_INDEX])
+    if year == MISSING:
+        return [], []
+    if repeats_current and len(bcis) > 1 and bcis[1] == bcis[0]:
+        del bcis[1]
+    return bcis, [year - interval * age for age in range(len(bcis))]
+
+
+def history_series(bridge_data: Iterable[list],
+                   interval: int = INSPECTION_INTERVAL,
+                   repeats_current: bool = True) -> BciSeries:
+    """Return the BCI histories of the formatted records in bridge_data,
+    dated one inspection every interval years back from the last
+    inspection date of each record. Bridges without a last inspection date
+    get no BCIs. If repeats_current is True, a second BCI equal to the
+    current one is left out (see _history_values).
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> series = history_series(THREE_BRIDGES)
+    >>> list(series.offsets)
+    [0, 7, 14, 22]
+    >>> list(series.years[:3]), list(series.values[:3])
+    ([2012.0, 2010.0, 2008.0], [72.3, 69.5, 70.0])
+    """
+
+    series = _empty_series()
+    for bridge in bridge_data:
+        values, years = _history_values(bridge, interval, repeats_current)
+        series.values.extend(values)
+        series.years.extend(years)
+        series.offsets.append(len(series.values))
+    return series
+
+
+def _prefix_sums(values: Iterable[float]) -> array:
+    """Return the running sums of values, starting with 0.0.
+
+    >>> list(_prefix_sums([1.0, 2.0, 3.5]))
+    [0.0, 1.0, 3.0, 6.5]
+    """
+
+    return array('d', accumulate(values, initial=0.0))
+
+
+def fit_trends(series: BciSeries) -> TrendFit:
+    """Return the least-squares trend of every bridge of series.
+
+    >>> series = BciSeries(array('d', [60.0, 64.0, 70.0, 80.0, 50.0]),
+    ...                    array('d', [2012, 2010, 2008, 2013, 2013]),
+    ...                    array('q', [0, 3, 3, 5]))
+    >>> fit = fit_trends(series)
+    >>> list(fit.slopes)
+    [-2.5, nan, nan]
+    >>> list(fit.latest), list(fit.latest_years)
+    ([60.0, nan, 80.0], [2012.0, nan, 2013.0])
+    """
+
+    values, years, offsets = series
+    # Years are counted from the first one, so that their sums stay small
+    # and exact.
+    base = years[0] if years else 0.0
+    times = array('d', [year - base for year in years])
+    sum_t = _prefix_sums(times)
+    sum_y = _prefix_sums(values)
+    sum_tt = _prefix_sums(map(mul, times, times))
+    sum_ty = _prefix_sums(map(mul, times, values))
+    fit = TrendFit(array('d'), array('d'), array('d'))
+    for start, end in zip(offsets, offsets[1:]):
+        count = end - start
+        t = sum_t[end] - sum_t[start]
+        spread = count * (sum_tt[end] - sum_tt[start]) - t * t
+        if spread > 0:
+            fit.slopes.append((count * (sum_ty[end] - sum_ty[start])
+                               - t * (sum_y[end] - sum_y[start])) / spread)
+        else:
+            fit.slopes.append(nan)
+        fit.latest.append(values[start] if count else nan)
+        fit.latest_years.append(years[start] if count else nan)
+    return fit
+
+
+def _decline(slope: float) -> float:
+    """Return the yearly fall in BCI of a trend with slope slope. A rising
+    or unknown trend does not fall: BCIs are not projected to improve
+    without rehab.
+
+    >>> _decline(-2.5), _decline(1.0), _decline(nan)
+    (2.5, 0.0, 0.0)
+    """
+
+    return -slope if slope < 0 else 0.0
+
+
+def projected_bcis(fit: TrendFit, year: float,
+                   current: Optional[array] = None) -> array:
+    """Return the projected BCI of every bridge of fit in year: its most
+    recent BCI (or its BCI in current, if given) lowered along its trend
+    from the year that BCI was measured, and never below 0. Bridges without
+    a BCI stay nan.
+
+    >>> fit = TrendFit(array('d', [-2.5, nan, 1.0]),
+    ...                array('d', [60.0, 70.0, 80.0]),
+    ...                array('d', [2012, 2013, nan]))
+    >>> list(projected_bcis(fit, 2016))
+    [50.0, 70.0, 80.0]
+    >>> list(projected_bcis(fit, 2100, array('d', [55.0, nan, 80.0])))
+    [0.0, nan, 80.0]
+    """
+
+    if current is None:
+        current = fit.latest
+    bcis = array('d')
+    for bci, slope, measured in zip(current, fit.slopes, fit.latest_years):
+        if _decline(slope) > 0 and year > measured:
+            bcis.append(max(bci - _decline(slope) * (year - measured), 0.0))
+        else:
+            bcis.append(bci)
+    return bcis
+
+
+def crossing_years(fit: TrendFit, threshold: float,
+                   current: Optional[array] = None) -> array:
+    """Return the projected year each bridge of fit falls to threshold: the
+    year its most recent BCI (or its BCI in current, if given) was
+    measured if that BCI is at most threshold already, inf if its trend
+    does not fall, and nan if it has no BCI.
+
+    >>> fit = TrendFit(array('d', [-2.5, -1.0, 1.0, nan]),
+    ...                array('d', [65.0, 58.0, 80.0, nan]),
+    ...                array('d', [2012, 2013, 2013, nan]))
+    >>> list(crossing_years(fit, HIGH_PRIORITY_BCI))
+    [2014.0, 2013.0, inf, nan]
+    """
+
+    if current is None:
+        current = fit.latest
+    years = array('d')
+    for bci, slope, measured in zip(current, fit.slopes, fit.latest_years):
+        if bci != bci:
+            years.append(nan)
+        elif bci <= threshold:
+            years.append(measured)
+        elif _decline(slope) > 0:
+            years.append(measured + (bci - threshold) / _decline(slope))
+        else:
+            years.append(inf)
+    return years
+
+
+class BciTrends:
+    """The deterioration trends of the bridges in a table, fitted to their
+    dated histories, and projected from their current BCIs. The histories
+    are those of series if given, such as the exactly dated ones
+    read_bci_series reads from the file the table was loaded from, and
+    otherwise the formatted ones, dated as history_series dates them.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> trends = BciTrends(BridgeTable(THREE_BRIDGES))
+    >>> [round(slope, 3) for slope in trends.fit.slopes]
+    [-0.084, -0.182, -0.486]
+    >>> [round(bci, 1) for bci in trends.projected(2030)]
+    [70.8, 68.2, 76.8]
+    >>> round(trends.crossing_year(2, MEDIUM_PRIORITY_BCI), 1)
+    2020.2
+
+    A record as format_data formats it repeats its current BCI, and its
+    BCI of 2001 is taken to be from 2000 unless the series is read:
+
+    >>> from io import StringIO
+    >>> from bridge_io import load_table
+    >>> csv_text = (
+    ...     ',,LOCATION\\nID,STRUCTURE,HWY,LAT,LON,BUILT,MAJOR,MINOR,SPANS,'
+    ...     'DETAILS,LENGTH,INSPECTED,CURRENT,2013,2012,2011,2010,2009,2008,'
+    ...     '2007,2006,2005,2004,2003,2002,2001,2000\\n'
+    ...     '1 -  32/,Highway 24 Underpass,403,43.167233,-80.275567,1965,2014,'
+    ...     '2009,4,Total=64 (1)=12;(2)=19;(3)=21;(4)=12;,65,04/13/2012,72.3,,'
+    ...     '72.3,,69.5,,70,,70.3,,70.5,,70.7,72.9,\\n')
+    >>> table = load_table(StringIO(csv_text))
+    >>> list(table[0][BCIS_INDEX])
+    [72.3, 72.3, 69.5, 70.0, 70.3, 70.5, 70.7, 72.9]
+    >>> round(BciTrends(table).fit.slopes[0], 3)
+    -0.084
+    >>> series = read_bci_series(StringIO(csv_text))
+    >>> list(series.years)
+    [2012.0, 2010.0, 2008.0, 2006.0, 2004.0, 2002.0, 2001.0]
+    >>> round(BciTrends(table, series=series).fit.slopes[0], 3)
+    -0.073
+    """
+
+    def __init__(self, table: BridgeTable,
+                 interval: int = INSPECTION_INTERVAL,
+                 repeats_current: bool = True,
+                 series: Optional[BciSeries] = None) -> None:
+        """Initialize the trends of the bridges in table, fitted to series,
+        which has the histories of the bridges in table order. Without
+        series, the formatted histories are dated one inspection every
+        interval years, leaving out a second BCI equal to the current one
+        if repeats_current is True. A ValueError is raised if series does
+        not have one history per bridge.
+        """
+
+        if series is None:
+            series = history_series(table, interval, repeats_current)
+        elif len(series.offsets) != len(table) + 1:
+            raise ValueError(f'series has {len(series.offsets) - 1} '
+                             f'histories, table has {len(table)} bridges')
+        self.table = table
+        self.interval = interval
+        self.repeats_current = repeats_current
+        bounds = list(zip(series.offsets, series.offsets[1:]))
+        self._values = [series.values[start:end] for start, end in bounds]
+        self._years = [series.years[start:end] for start, end in bounds]
+        self._bcis = [tuple(bridge[BCIS_INDEX]) for bridge in table]
+        self.fit = fit_trends(series)
+
+    def update(self, row: int) -> None:
+        """Fit the trend of the bridge at row of the table again, adding it
+        if the bridge is new. BCIs added in front of the ones fitted before,
+        as inspect_bridges adds them, are dated from the last inspection
+        date, one every interval years back, and the rest of the history
+        keeps its dates.
+
+        >>> from bridge_functions import THREE_BRIDGES, inspect_bridges
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> trends = get_bci_trends(table)
+        >>> inspect_bridges(table, [2], '09/15/2014', 60.0)
+        >>> trends.fit.latest_years[1], round(trends.fit.slopes[1], 3)
+        (2014.0, -0.544)
+        >>> list(trends._years[1][:3])
+        [2014.0, 2012.0, 2010.0]
+        """
+
+        bridge = self.table[row]
+        bcis = tuple(bridge[BCIS_INDEX])
+        known = self._bcis[row] if row < len(self._bcis) else None
+        if bcis == known:
+            return
+        added = len(bcis) - len(known) if known is not None else 0
+        year = year_number(bridge[LAST_INSPECTED_INDEX][-4:])
+        if added > 0 and bcis[added:] == known and year != MISSING:
+            values = array('d', bcis[:added]) + self._values[row]
+            years = array('d', [year - self.interval * age
+                                for age in range(added)]) + self._years[row]
+        else:
+            values, years = map(array, 'dd', _history_values(
+                bridge, self.interval, self.repeats_current))
+        if known is None:
+            self._values.append(values)
+            self._years.append(years)
+            self._bcis.append(bcis)
+        else:
+            self._values[row] = values
+            self._years[row] = years
+            self._bcis[row] = bcis
+        fit = fit_trends(BciSeries(values, years,
+                                   array('q', [0, len(values)])))
+        for column, value in zip(self.fit, fit):
+            if row == len(column):
+                column.append(value[0])
+            else:
+                column[row] = value[0]
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the trends of the bridges at the rows that renumbered maps
+        to -1 (see bridge_table.renumbering).
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> trends = get_bci_trends(table)
+        >>> table.delete_rows([0])
+        >>> [round(slope, 3) for slope in trends.fit.slopes]
+        [-0.182, -0.486]
+        """
+
+        for column in (*self.fit, self._values, self._years, self._bcis):
+            compact(column, renumbered)
+
+    def projected(self, year: float) -> array:
+        """Return the projected BCI of every bridge of the table in year,
+        in table order (see projected_bcis).
+        """
+
+        return projected_bcis(self.fit, year, self.table.bcis)
+
+    def crossing_year(self, bridge_id: int, threshold: float) -> float:
+        """Return the projected year the bridge with id bridge_id falls to
+        threshold (see crossing_years), or nan if there is no such bridge.
+        """
+
+        row = self.table.row_of(bridge_id)
+        if row == -1:
+            return nan
+        single = TrendFit(*(array('d', [column[row]])
+                            for column in self.fit))
+        return crossing_years(single, threshold,
+                              array('d', [self.table.bcis[row]]))[0]
+
+    def all_crossing_years(self, threshold: float) -> array:
+        """Return the projected year every bridge of the table falls to
+        threshold, in table order.
+        """
+
+        return crossing_years(self.fit, threshold, self.table.bcis)
+
+
+def get_bci_trends(table: BridgeTable, interval: Optional[int] = None,
+                   repeats_current: Optional[bool] = None,
+                   series: Optional[BciSeries] = None) -> BciTrends:
+    """Return the BCI trends of table, fitting them on first use. The
+    trends follow later changes to table.
+
+    interval, repeats_current and series are passed to BciTrends; if
+    interval or repeats_current is None, the value the cached trends were
+    fitted with is kept (or the BciTrends default, on first use). Giving a
+    different value, or a series, fits the trends again.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_bci_trends(table) is get_bci_trends(table)
+    True
+    >>> trends = get_bci_trends(table, 1)
+    >>> trends.interval, get_bci_trends(table) is trends
+    (1, True)
+    """
+
+    trends = table.derived.get('trends')
+    if trends is not None:
+        if interval is None:
+            interval = trends.interval
+        if repeats_current is None:
+            repeats_current = trends.repeats_current
+        if series is None and (interval, repeats_current) == (
+                trends.interval, trends.repeats_current):
+            return trends
+        table.listeners.remove(trends.update)
+        table.removers.remove(trends.delete_rows)
+    if interval is None:
+        interval = INSPECTION_INTERVAL
+    if repeats_current is None:
+        repeats_current = True
+    trends = BciTrends(table, interval, repeats_current, series)
+    table.derived['trends'] = trends
+    table.listeners.append(trends.update)
+    table.removers.append(trends.delete_rows)
+    return trends
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
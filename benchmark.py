@@ -0,0 +1,278 @@
+"""Benchmarks of bridge_functions at increasing data sizes.
+
+Synthetic data files 10 and 100 times the size of bridge_data.csv (and
+1000 times, if asked for with --scales) are generated once (see
+synthetic_data) and kept in a data directory. For each size, read_data and
+format_data are timed, then every query function, inspect_bridges,
+add_rehab and assign_inspectors on the list of records and on a
+BridgeTable. The list versions are skipped above LIST_ROW_LIMIT records,
+where they take minutes per call. Each timing is the best of several runs
+of a fixed batch of calls; batches that modify the data run on a fresh copy
+of it each time, so every run starts from the same data. The first run on a
+BridgeTable, which includes building the indexes it uses, is also timed on
+its own, under the benchmark name followed by '.first'. The timings are
+saved as JSON, and two saved runs can be compared to find regressions:
+
+    python benchmark.py --scales 1 10 100 --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import time
+from copy import deepcopy
+from typing import Callable, NamedTuple, Optional
+
+import bridge_functions as bf
+from bridge_table import BridgeTable
+from constants import HIGHWAY_INDEX, ID_INDEX, LAT_INDEX, LON_INDEX
+from synthetic_data import generate
+
+DATA_FILE = 'bridge_data.csv'
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_DATA_DIR = 'benchmark_data'
+
+# Largest number of records for which the list versions are timed.
+LIST_ROW_LIMIT = 5000
+
+# Number of calls in each timed batch of queries.
+BATCH_SIZE = 20
+
+# The batches that modify the data they are called on.
+MUTATING = {'inspect_bridges', 'add_rehab'}
+
+# Inspector count and max_bridges of the timed assign_inspectors call.
+INSPECTOR_COUNT = 20
+MAX_BRIDGES = 10
+
+# A timing is a regression if it is more than this fraction slower than the
+# baseline.
+DEFAULT_TOLERANCE = 0.2
+
+
+class Regression(NamedTuple):
+    """A benchmark that got slower: its scale, name, and baseline and
+    current times in seconds.
+    """
+    scale: str
+    name: str
+    baseline: float
+    current: float
+
+
+def best_time(function: Callable, repeat: int,
+              setup: Optional[Callable[[], object]] = None) -> float:
+    """Return the shortest time in seconds of repeat calls to function. If
+    setup is given, it is called before each call, untimed, and function is
+    called with what it returns.
+
+    >>> best_time(lambda: None, 3) < 1
+    True
+    >>> best_time(lambda data: data.pop(), 3, lambda: [1]) < 1
+    True
+    """
+
+    times = []
+    for _ in range(repeat):
+        if setup is None:
+            start = time.perf_counter()
+            function()
+        else:
+            argument = setup()
+            start = time.perf_counter()
+            function(argument)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def data_path(scale: int, data_dir: str = DEFAULT_DATA_DIR) -> str:
+    """Return the path of the data file of scale times the size of
+    DATA_FILE, generating it in data_dir if it does not exist yet.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    if scale == 1:
+        return DATA_FILE
+    path = os.path.join(data_dir, f'bridge_data_x{scale}.csv')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        generate(DATA_FILE, path + '.tmp', scale)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def _query_batches(bridge_data: list[list], inspectors: list[list[float]],
+                   rng: random.Random) -> dict[str, Callable]:
+    """Return, by function name, a function making a batch of calls to that
+    function of bridge_functions, with arguments drawn with rng from
+    bridge_data. The batches are called on the data they are given.
+    """
+
+    bridges = rng.sample(bridge_data, min(BATCH_SIZE, len(bridge_data)))
+    ids = [bridge[ID_INDEX] for bridge in bridges]
+    points = [(bridge[LAT_INDEX], bridge[LON_INDEX]) for bridge in bridges]
+    highways = [bridge[HIGHWAY_INDEX] for bridge in bridges]
+    searches = ['creek', 'underpass', 'river', 'st', 'hwy. #2']
+    all_ids = [bridge[ID_INDEX] for bridge in bridge_data]
+
+    def repeat_calls(call: Callable[[object, object], object],
+                     arguments: list) -> Callable:
+        return lambda data: [call(data, argument) for argument in arguments]
+
+    return {
+        'get_bridge': repeat_calls(bf.get_bridge, ids),
+        'get_average_bci': repeat_calls(bf.get_average_bci, ids),
+        'get_total_length_on_hwy': repeat_calls(bf.get_total_length_on_hwy,
+                                                highways),
+        'get_distance_between': lambda data: [
+            bf.get_distance_between(bf.get_bridge(data, first),
+                                    bf.get_bridge(data, second))
+            for first, second in zip(ids, ids[1:])],
+        'get_closest_bridge': repeat_calls(bf.get_closest_bridge, ids),
+        'get_bridges_in_radius': repeat_calls(
+            lambda data, point: bf.get_bridges_in_radius(data, *point, 50),
+            points),
+        'get_bridges_with_bci_below': repeat_calls(
+            lambda data, limit: bf.get_bridges_with_bci_below(
+                data, all_ids, limit), [60, 70]),
+        'get_bridges_containing': repeat_calls(bf.get_bridges_containing,
+                                               searches),
+        'assign_inspectors': lambda data: bf.assign_inspectors(
+            data, inspectors, MAX_BRIDGES),
+        'assign_inspectors_nearest': lambda data: bf.assign_inspectors(
+            data, inspectors, MAX_BRIDGES, 'nearest'),
+        'inspect_bridges': repeat_calls(
+            lambda data, bridge_id: bf.inspect_bridges(
+                data, [bridge_id], '09/15/2023', 71.9), ids),
+        'add_rehab': repeat_calls(
+            lambda data, bridge_id: bf.add_rehab(
+                data, bridge_id, '09/15/2023', True), ids)
+    }
+
+
+def benchmark_file(csv_path: str, repeat: int = 3, seed: int = 0,
+                   list_row_limit: int = LIST_ROW_LIMIT) -> dict:
+    """Return the number of records in the bridge data CSV file at csv_path
+    and the best time, by benchmark name, of each benchmark on it.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    timings = {}
+
+    def read() -> list[list[str]]:
+        with open(csv_path) as csv_file:
+            return bf.read_data(csv_file)
+
+    timings['read_data'] = best_time(read, repeat)
+    format_times = []
+    for _ in range(repeat):
+        bridge_data = read()
+        start = time.perf_counter()
+        bf.format_data(bridge_data)
+        format_times.append(time.perf_counter() - start)
+    timings['format_data'] = min(format_times)
+    timings['BridgeTable'] = best_time(lambda: BridgeTable(bridge_data),
+                                       repeat)
+
+    rng = random.Random(seed)
+    inspectors = [[bridge[LAT_INDEX], bridge[LON_INDEX]] for bridge
+                  in rng.sample(bridge_data,
+                                min(INSPECTOR_COUNT, len(bridge_data)))]
+    batches = _query_batches(bridge_data, inspectors, rng)
+    versions = {'table': BridgeTable(deepcopy(bridge_data))}
+    if len(bridge_data) <= list_row_limit:
+        versions['list'] = bridge_data
+    for version, data in versions.items():
+        for name, batch in batches.items():
+            if name in MUTATING:
+                setup = lambda: deepcopy(data)
+            else:
+                setup = lambda: data
+            if version == 'table':
+                timings[f'table.{name}.first'] = best_time(batch, 1, setup)
+            timings[f'{version}.{name}'] = best_time(batch, repeat, setup)
+    return {'rows': len(bridge_data), 'timings': timings}
+
+
+def run(scales: list[int], repeat: int = 3,
+        data_dir: str = DEFAULT_DATA_DIR) -> dict:
+    """Return the benchmark results for the data files of each scale in
+    scales, with a description of the machine they ran on.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'scales': {str(scale): benchmark_file(data_path(scale, data_dir),
+                                              repeat)
+                   for scale in scales}
+    }
+
+
+def compare(baseline: dict, current: dict,
+            tolerance: float = DEFAULT_TOLERANCE) -> list[Regression]:
+    """Return the benchmarks of current that are more than tolerance (as a
+    fraction) slower than in baseline. Benchmarks missing from either are
+    ignored.
+
+    >>> old = {'scales': {'1': {'timings': {'a': 1.0, 'b': 1.0}}}}
+    >>> new = {'scales': {'1': {'timings': {'a': 1.1, 'b': 1.5, 'c': 9}}}}
+    >>> compare(old, new)
+    [Regression(scale='1', name='b', baseline=1.0, current=1.5)]
+    """
+
+    regressions = []
+    for scale, result in current['scales'].items():
+        old_timings = baseline['scales'].get(scale, {}).get('timings', {})
+        for name, seconds in result['timings'].items():
+            if (name in old_timings
+                    and seconds > old_timings[name] * (1 + tolerance)):
+                regressions.append(Regression(scale, name, old_timings[name],
+                                              seconds))
+    return regressions
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """Run the benchmarks as described by the command line arguments, and
+    return 1 if a comparison found regressions and 0 otherwise.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+',
+                        default=DEFAULT_SCALES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', metavar='BASELINE')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    options = parser.parse_args(arguments)
+
+    results = run(options.scales, options.repeat, options.data_dir)
+    with open(options.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    for scale, result in results['scales'].items():
+        print(f'x{scale} ({result["rows"]} rows)')
+        for name, seconds in result['timings'].items():
+            print(f'  {name:40} {seconds:10.4f} s')
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            regressions = compare(json.load(baseline_file), results,
+                                  options.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION x{regression.scale} {regression.name}: '
+                  f'{regression.baseline:.4f} s -> '
+                  f'{regression.current:.4f} s')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -17,8 +17,9 @@ Sharmin, and Jacqueline Smith
 
 import csv
 from copy import deepcopy
+from itertools import islice
 from math import sin, cos, asin, radians, sqrt, inf
-from typing import TextIO
+from typing import Optional, TextIO
 
 from constants import (
     ID_INDEX, NAME_INDEX, HIGHWAY_INDEX, LAT_INDEX,
@@ -30,10 +31,21 @@ from constants import (
     LOW_PRIORITY_BCI, HIGH_PRIORITY_RADIUS,
     MEDIUM_PRIORITY_RADIUS, LOW_PRIORITY_RADIUS,
     EARTH_RADIUS)
+from assignment import assign_from_table
+from bci_index import get_bci_index
+from bci_stats import get_bci_stats
+from bridge_table import BridgeTable
+from highway_stats import get_highway_aggregates
+from instrumentation import (
+    instrumented, list_rows, lookup_rows, result_rows)
+from name_index import get_name_index
+from nearest_assignment import assign_nearest_from_table
+from spatial_index import get_grid_index
 EPSILON = 0.01
 
 
 # We provide this function for you to use as a helper.
+@instrumented(result_rows)
 def read_data(csv_file: TextIO) -> list[list[str]]:
     """Read and return the contents of the open CSV file csv_file as a
     list of lists, where each inner list contains the values from one
@@ -44,7 +56,7 @@ def read_data(csv_file: TextIO) -> list[list[str]]:
     """
 
     lines = csv.reader(csv_file)
-    return list(lines)[2:]
+    return list(islice(lines, 2, None))
 
 
 # We provide this function for you to use as a helper.  This function
@@ -56,6 +68,7 @@ def read_data(csv_file: TextIO) -> list[list[str]]:
 # defined above to constuct example calls for the function that
 # returns a float. We do not test with ==; instead, we check that the
 # return value is "close enough" to the expected result.
+@instrumented()
 def calculate_distance(lat1: float, lon1: float,
                        lat2: float, lon2: float) -> float:
     """Return the distance in kilometers between the two locations defined by
@@ -109,8 +122,25 @@ THREE_BRIDGES = [
 ]
 
 
+@instrumented(lookup_rows)
+def _find_row(bridge_data: list[list], bridge_id: int) -> int:
+    """Return the row of the bridge with id bridge_id in the list of
+    records bridge_data, found by a linear search, or -1 if there is no
+    such bridge.
+
+    >>> _find_row(THREE_BRIDGES, 2), _find_row(THREE_BRIDGES, 42)
+    (1, -1)
+    """
+
+    for row, sublist in enumerate(bridge_data):
+        if sublist[ID_INDEX] == bridge_id:
+            return row
+    return -1
+
+
 # We provide the header and doctring for this function to help get you
 # started.
+@instrumented()
 def get_bridge(bridge_data: list[list], bridge_id: int) -> list:
     """Return the data for the bridge with id bridge_id from bridge data
     bridge_data. If there is no bridge with id bridge_id, return [].
@@ -124,14 +154,19 @@ def get_bridge(bridge_data: list[list], bridge_id: int) -> list:
     True
     >>> get_bridge(THREE_BRIDGES, 42)
     []
+    >>> get_bridge(BridgeTable(THREE_BRIDGES), 3)[NAME_INDEX]
+    'STOKES RIVER BRIDGE'
     """
 
-    for sublist in bridge_data:
-        if sublist[ID_INDEX] == bridge_id:
-            return sublist
-    return []
+    if isinstance(bridge_data, BridgeTable):
+        return bridge_data.record(bridge_id)
+    row = _find_row(bridge_data, bridge_id)
+    if row == -1:
+        return []
+    return bridge_data[row]
 
 
+@instrumented()
 def get_average_bci(bridge_data: list[list], bridge_id: int) -> float:
     """Return the average bci of the bridge in the bridge_data given its
     bridge_id. If no bridge is found with the given id, return 0. If no BCIs
@@ -141,19 +176,22 @@ def get_average_bci(bridge_data: list[list], bridge_id: int) -> float:
     70.88571428571429
     >>> get_average_bci(THREE_BRIDGES, 0)
     0
+    >>> get_average_bci(BridgeTable(THREE_BRIDGES), 1)
+    70.88571428571429
     """
-    total = 0
-    count = 0
-    if get_bridge(bridge_data, bridge_id) != []:
-        if get_bridge(bridge_data, bridge_id)[BCIS_INDEX] != []:
-            for num in get_bridge(bridge_data, bridge_id)[BCIS_INDEX]:
-                total += num
-                count += 1
-            return total / count
-        return total
-    return total
+    if isinstance(bridge_data, BridgeTable):
+        summary = get_bci_stats(bridge_data).summary(bridge_id)
+        if summary is None or summary.count == 0:
+            return 0
+        return summary.mean
 
+    bridge = get_bridge(bridge_data, bridge_id)
+    if bridge == [] or bridge[BCIS_INDEX] == []:
+        return 0
+    return sum(bridge[BCIS_INDEX]) / len(bridge[BCIS_INDEX])
 
+
+@instrumented(list_rows)
 def get_total_length_on_hwy(bridge_data: list[list], highway: str) -> float:
     """Return the total length of bridges in bridge_data that are on the
     highway. If there are no bridges on the given highway, return 0.
@@ -162,15 +200,20 @@ def get_total_length_on_hwy(bridge_data: list[list], highway: str) -> float:
     126.0
     >>> get_total_length_on_hwy(THREE_BRIDGES, '401')
     0.0
+    >>> get_total_length_on_hwy(BridgeTable(THREE_BRIDGES), '403')
+    126.0
     """
+    if isinstance(bridge_data, BridgeTable):
+        return get_highway_aggregates(bridge_data).stats(highway).total_length
 
     length = 0.0
     for sublist in bridge_data:
-        if sublist[HIGHWAY_INDEX] == highway:
+        if sublist[HIGHWAY_INDEX] == highway and sublist[LENGTH_INDEX] != '':
             length += sublist[LENGTH_INDEX]
     return length
 
 
+@instrumented()
 def get_distance_between(bridge1: list, bridge2: list) -> float:
     """Return the difference between the length of bridge1 and length of
     bridge2. Answer will be rounded to 3 decimal places.
@@ -186,6 +229,7 @@ def get_distance_between(bridge1: list, bridge2: list) -> float:
     # function is not required to understand.
 
 
+@instrumented(list_rows)
 def get_closest_bridge(bridge_data: list[list], bridge_id: int) -> int:
     """Return the id of the bridge in the bridge_data that is the closest to the
     bridge given its id bridge_id. The return id of the bridge cannot be the
@@ -196,20 +240,28 @@ def get_closest_bridge(bridge_data: list[list], bridge_id: int) -> int:
 
     >>> get_closest_bridge(THREE_BRIDGES, 2)
     1
+    >>> get_closest_bridge(BridgeTable(THREE_BRIDGES), 3)
+    1
     """
+    bridge = get_bridge(bridge_data, bridge_id)
+    if isinstance(bridge_data, BridgeTable):
+        if 'knn' in bridge_data.derived:
+            return bridge_data.derived['knn'].closest(bridge_id)
+        closest = get_grid_index(bridge_data).nearest(
+            bridge[LAT_INDEX], bridge[LON_INDEX], 1, True)
+        return closest[0] if closest else 0
+
     diff = 40075
     the_id = 0
     for sublist in bridge_data:
-        if (get_distance_between(sublist, get_bridge(bridge_data, bridge_id))
-            < diff
-            and get_distance_between(sublist,
-                                     get_bridge(bridge_data, bridge_id)) != 0):
-            diff = get_distance_between(sublist,
-                                        get_bridge(bridge_data, bridge_id))
+        distance = get_distance_between(sublist, bridge)
+        if distance < diff and distance != 0:
+            diff = distance
             the_id = sublist[ID_INDEX]
     return the_id
 
 
+@instrumented(list_rows)
 def get_bridges_in_radius(bridge_data: list[list], lat: float, lon: float,
                           radius: float) -> list[int]:
     """Return a list of id of briges which the distance between it and the given
@@ -217,8 +269,13 @@ def get_bridges_in_radius(bridge_data: list[list], lat: float, lon: float,
 
     >>> get_bridges_in_radius(THREE_BRIDGES, 43.10, -80.15, 50)
     [1, 2]
+    >>> get_bridges_in_radius(BridgeTable(THREE_BRIDGES), 43.10, -80.15, 50)
+    [1, 2]
 
     """
+    if isinstance(bridge_data, BridgeTable):
+        return get_grid_index(bridge_data).in_radius(lat, lon, radius)
+
     id_list = []
     for sublist in bridge_data:
         if calculate_distance(sublist[LAT_INDEX],
@@ -230,6 +287,7 @@ def get_bridges_in_radius(bridge_data: list[list], lat: float, lon: float,
     return id_list
 
 
+@instrumented(list_rows)
 def get_bridges_with_bci_below(bridge_data: list[list], bridge_ids: list[int],
                                limit: float) -> list[int]:
     """Return a new list of ids of bridges from bridge_data with their ids
@@ -238,7 +296,14 @@ def get_bridges_with_bci_below(bridge_data: list[list], bridge_ids: list[int],
 
     >>> get_bridges_with_bci_below(THREE_BRIDGES, [1, 2], 72)
     [2]
+    >>> get_bridges_with_bci_below(BridgeTable(THREE_BRIDGES), [1, 2], 72)
+    [2]
     """
+    if isinstance(bridge_data, BridgeTable):
+        return get_bci_index(bridge_data).ids_below(limit, bridge_ids)
+
+    bridge_ids = set(bridge_ids)
+
     new_list = []
     for sublist in bridge_data:
         if sublist[ID_INDEX] in bridge_ids and sublist[BCIS_INDEX][0] <= limit:
@@ -246,6 +311,7 @@ def get_bridges_with_bci_below(bridge_data: list[list], bridge_ids: list[int],
     return new_list
 
 
+@instrumented(list_rows)
 def get_bridges_containing(bridge_data: list[list], search: str) -> list[int]:
     """
 
@@ -253,7 +319,12 @@ def get_bridges_containing(bridge_data: list[list], search: str) -> list[int]:
     [1, 2]
     >>> get_bridges_containing(THREE_BRIDGES, 'pass')
     [1, 2]
+    >>> get_bridges_containing(BridgeTable(THREE_BRIDGES), 'Stokes')
+    [3]
     """
+    if isinstance(bridge_data, BridgeTable):
+        return get_name_index(bridge_data).search(search)
+
     new_list = []
     for sublist in bridge_data:
         if search.lower() in sublist[NAME_INDEX].lower():
@@ -266,6 +337,7 @@ def get_bridges_containing(bridge_data: list[list], search: str) -> list[int]:
 # help(deepcopy)!): since this function modifies its input, we do not
 # want to call it with THREE_BRIDGES, which would interfere with the
 # use of THREE_BRIDGES in examples for other functions.
+@instrumented(list_rows)
 def inspect_bridges(bridge_data: list[list], bridge_ids: list[int], date: str,
                     bci: float) -> None:
     """Update the bridges in bridge_data with id in bridge_ids with the new
@@ -289,12 +361,22 @@ def inspect_bridges(bridge_data: list[list], bridge_ids: list[int], date: str,
 
     """
 
+    if isinstance(bridge_data, BridgeTable):
+        for bridge_id in set(bridge_ids):
+            row = bridge_data.row_of(bridge_id)
+            if row != -1:
+                bridge_data[row][LAST_INSPECTED_INDEX] = date
+                bridge_data[row][BCIS_INDEX].insert(0, bci)
+                bridge_data.refresh_row(row)
+        return
+
     for bridge in bridge_data:
         if bridge[ID_INDEX] in bridge_ids:
             bridge[LAST_INSPECTED_INDEX] = date
             bridge[BCIS_INDEX].insert(0, bci)
 
 
+@instrumented(list_rows)
 def add_rehab(bridge_data: list[list],
               bridge_id: int,
               date: str,
@@ -330,40 +412,87 @@ def add_rehab(bridge_data: list[list],
                     ]
     True
     """
+    if isinstance(bridge_data, BridgeTable):
+        row = bridge_data.row_of(bridge_id)
+        if row != -1 and severity is True:
+            bridge_data[row][LAST_MAJOR_INDEX] = date[-4:]
+            bridge_data.refresh_row(row)
+        elif row != -1 and severity is False:
+            bridge_data[row][LAST_MINOR_INDEX] = date[-4:]
+            bridge_data.refresh_row(row)
+        return
+
     for bridge in bridge_data:
         if bridge[ID_INDEX] == bridge_id and severity is True:
             bridge[LAST_MAJOR_INDEX] = date[-4:]
         elif bridge[ID_INDEX] == bridge_id and severity is False:
             bridge[LAST_MINOR_INDEX] = date[-4:]
 
-def format_index(bridge_record: list) -> None:
+def format_index(bridge_data: list[list]) -> None:
     """Modify the index of the bridges in the bridge_data based on their index
-    in bridge_data.
-
+    in bridge_data, so that the first bridge has id 1.
 
+    >>> records = [['1 -  32/'], ['1 -  43/'], ['2 -   4/']]
+    >>> format_index(records)
+    >>> records
+    [[1], [2], [3]]
     """
-    for bridge in bridge_record:
-        bridge[ID_INDEX] = bridge_record.index(bridge)
+    for index, bridge in enumerate(bridge_data):
+        bridge[ID_INDEX] = index + 1
 
 # We provide the header and doctring for this function to help get you started.
-def format_data(data: list[list[str]]) -> None:
+@instrumented(list_rows)
+def format_data(data: list[list[str]],
+                errors: Optional[list[tuple[int, str]]] = None) -> None:
     """Modify the uncleaned bridge data data, so that it contains proper
     bridge data, i.e., follows the format outlined in the 'Data
     formatting' section of the assignment handout.
 
+    A field that cannot be formatted is blanked instead of stopping the
+    formatting (see format_fields), and if errors is not None, the line
+    number and message of each such field is appended to it. Line numbers
+    count the two header lines read_data skips.
+
     >>> d = THREE_BRIDGES_UNCLEANED
     >>> format_data(d)
     >>> d == THREE_BRIDGES
     True
+    >>> d = [['1 -  32/', 'A', '403', '43.1', 'x', '1965', '', '', '1',
+    ...       'Total=16  (1)=16;', '16', '', '72.3'], ['2 -  5/', 'B']]
+    >>> errors = []
+    >>> format_data(d, errors)
+    >>> d[0][LAT_INDEX:LON_INDEX + 1], d[1][NUM_SPANS_INDEX:]
+    (['', ''], ['', [], '', '', []])
+    >>> errors
+    [(3, "malformed location '43.1', 'x'"), \
+(4, 'expected at least 13 columns, found 2')]
     """
 
-    for bridge in data:
-        format_index(bridge)
-        format_location(bridge)
-        format_spans(bridge)
-        format_bcis(bridge)
-        format_length(bridge)
-        bridge[NUM_SPANS_INDEX] = int(bridge[NUM_SPANS_INDEX])
+    format_index(data)
+    for line, bridge in enumerate(data, 3):
+        messages = format_fields(bridge)
+        if errors is not None:
+            errors.extend((line, message) for message in messages)
+
+
+def format_record(bridge_record: list) -> None:
+    """Format every field of the bridge record bridge_record except its id.
+
+    >>> record = ['1 -  32/', 'Highway 24 Underpass at Highway 403', '403',
+    ...           '43.167233', '-80.275567', '1965', '2014', '2009', '4',
+    ...           'Total=64  (1)=12;(2)=19;(3)=21;(4)=12;', '65', '04/13/2012',
+    ...           '72.3', '', '72.3', '', '69.5', '', '70', '', '70.3', '',
+    ...           '70.5', '', '70.7', '72.9', '']
+    >>> format_record(record)
+    >>> record[LAT_INDEX:] == [
+    ...     43.167233, -80.275567, '1965', '2014', '2009', 4,
+    ...     [12.0, 19.0, 21.0, 12.0], 65.0, '04/13/2012',
+    ...     [72.3, 72.3, 69.5, 70.0, 70.3, 70.5, 70.7, 72.9]]
+    True
+    """
+
+    for formatter, _, _, _ in FIELD_FORMATS:
+        formatter(bridge_record)
 
 
 # This is a suggested helper function for format_data. We provide the
@@ -444,7 +573,8 @@ def format_length(bridge_record: list) -> None:
 
     """
 
-    bridge_record[LENGTH_INDEX] = float(bridge_record[LENGTH_INDEX])
+    if bridge_record[LENGTH_INDEX] != '':
+        bridge_record[LENGTH_INDEX] = float(bridge_record[LENGTH_INDEX])
 
 
 # This is a suggested helper function for format_data. We provide the
@@ -476,7 +606,73 @@ def format_bcis(bridge_record: list) -> list:
     bridge_record[BCIS_INDEX:] = [bci_list]
 
 
+def format_num_spans(bridge_record: list) -> None:
+    """Format the number of spans in the bridge record bridge_record.
+
+    >>> record = ['1 -  32/', 'A', '403', '43.1', '-80.2', '1965', '2014',
+    ...           '2009', '4']
+    >>> format_num_spans(record)
+    >>> record[NUM_SPANS_INDEX]
+    4
+    """
+
+    bridge_record[NUM_SPANS_INDEX] = int(bridge_record[NUM_SPANS_INDEX])
+
+
+# The formatter of each group of fields of a record, in the order
+# format_record applies them, with a name for error messages, the slice of
+# the record it formats and what that slice becomes if it is malformed.
+FIELD_FORMATS = (
+    (format_location, 'location', slice(LAT_INDEX, LON_INDEX + 1), ['', '']),
+    (format_spans, 'span details',
+     slice(SPAN_DETAILS_INDEX, SPAN_DETAILS_INDEX + 1), [[]]),
+    (format_bcis, 'BCIs', slice(BCIS_INDEX, None), [[]]),
+    (format_length, 'deck length', slice(LENGTH_INDEX, LENGTH_INDEX + 1),
+     ['']),
+    (format_num_spans, 'number of spans',
+     slice(NUM_SPANS_INDEX, NUM_SPANS_INDEX + 1), ['']))
+
+
+def format_fields(bridge_record: list,
+                  formats: tuple = FIELD_FORMATS) -> list[str]:
+    """Format the fields of the bridge record bridge_record with the
+    formatters of formats (by default, all of FIELD_FORMATS), blanking the
+    fields of each formatter that fails, and return a message for each
+    failure. A record too short to have a BCI column is padded with blank
+    fields first, and only its shortness is reported for those.
+
+    >>> record = ['1 -  32/', 'A', '403', '43.1', '-80.2', '1965', '', '',
+    ...           'x', '16', 'abc', '', '72.3', 'n/a']
+    >>> for message in format_fields(record):
+    ...     print(message)
+    malformed span details '16'
+    malformed BCIs '72.3', 'n/a'
+    malformed deck length 'abc'
+    malformed number of spans 'x'
+    >>> record[LAT_INDEX:]
+    [43.1, -80.2, '1965', '', '', '', [], '', '', []]
+    """
+
+    messages = []
+    present = len(bridge_record)
+    if present <= BCIS_INDEX:
+        messages.append(f'expected at least {BCIS_INDEX + 1} columns, '
+                        f'found {len(bridge_record)}')
+        bridge_record.extend([''] * (BCIS_INDEX + 1 - len(bridge_record)))
+    for formatter, name, fields, blank in formats:
+        values = bridge_record[fields]
+        try:
+            formatter(bridge_record)
+        except (ValueError, IndexError):
+            bridge_record[fields] = blank
+            if fields.start < present:
+                messages.append(f'malformed {name} '
+                                + ', '.join(map(repr, values)))
+    return messages
+
+
 # Helper functions
+@instrumented()
 def high_bridges(bridge_data: list[list], ins_lat: float,
                  ins_lon: float) -> list[int]:
     """Return a list of ids of bridges from bridge_data that is within the
@@ -497,6 +693,7 @@ def high_bridges(bridge_data: list[list], ins_lat: float,
     return list1
 
 
+@instrumented()
 def medium_bridges(bridge_data: list[list], ins_lat: float,
                    ins_lon: float) -> list[int]:
     """Return a list of ids of bridges from bridge_data that is within the
@@ -519,6 +716,7 @@ def medium_bridges(bridge_data: list[list], ins_lat: float,
     return list1
 
 
+@instrumented()
 def low_bridges(bridge_data: list[list], ins_lat: float,
                 ins_lon: float) -> list[int]:
     """Return a list of ids of bridges from bridge_data that is within the
@@ -542,8 +740,11 @@ def low_bridges(bridge_data: list[list], ins_lat: float,
 
 
 # We provide the header and doctring for this function to help get you started.
+@instrumented()
 def assign_inspectors(bridge_data: list[list], inspectors: list[list[float]],
-                      max_bridges: int) -> list[list[int]]:
+                      max_bridges: int,
+                      mode: str = 'greedy',
+                      year: Optional[float] = None) -> list[list[int]]:
     """Return a list of bridge IDs from bridge data bridge_data, to be
     assigned to each inspector in inspectors. inspectors is a list
     containing (latitude, longitude) pairs representing each
@@ -553,6 +754,14 @@ def assign_inspectors(bridge_data: list[list], inspectors: list[list[float]],
 
     See the "Assigning Inspectors" section of the handout for more details.
 
+    If mode is 'nearest', bridges are instead assigned by
+    assign_nearest_from_table, which keeps the total travel distance low
+    rather than serving inspectors in order.
+
+    If year is given, bridges are placed in priority tiers by the BCI they
+    are projected to have in year, from the trend of their BCI history
+    (see bci_trends), instead of by their current BCI.
+
     >>> assign_inspectors(THREE_BRIDGES, [[43.10, -80.15], [42.10, -81.15]], 0)
     [[], []]
     >>> assign_inspectors(THREE_BRIDGES, [[43.10, -80.15]], 1)
@@ -571,27 +780,46 @@ def assign_inspectors(bridge_data: list[list], inspectors: list[list[float]],
     >>> assign_inspectors(THREE_BRIDGES, [[38.691, -80.85], [43.20, -80.35]],
     ...                   2)
     [[], [1, 2]]
+    >>> assign_inspectors(BridgeTable(THREE_BRIDGES),
+    ...                   [[43.20, -80.35], [43.10, -80.15]], 1)
+    [[1], [2]]
+    >>> assign_inspectors(THREE_BRIDGES, [[43.10, -80.15], [43.20, -80.35]],
+    ...                   1, 'nearest')
+    [[2], [1]]
+    >>> assign_inspectors(THREE_BRIDGES, [[43.20, -80.35]], 3, year=2035)
+    [[2, 1]]
 
     """
 
+    if mode not in ('greedy', 'nearest'):
+        raise ValueError(f'unknown assignment mode {mode!r}')
+    if ((mode == 'nearest' or year is not None)
+            and not isinstance(bridge_data, BridgeTable)):
+        bridge_data = BridgeTable(bridge_data)
+    if mode == 'nearest':
+        return assign_nearest_from_table(bridge_data, inspectors, max_bridges,
+                                         year)
+    if isinstance(bridge_data, BridgeTable):
+        return assign_from_table(bridge_data, inspectors, max_bridges, year)
+
     output = []
-    assigned = []
+    assigned = set()
 
     for inspector in inspectors:
         output.append([])
         for bridge_id in high_bridges(bridge_data, inspector[0], inspector[1]):
             if bridge_id not in assigned and len(output[-1]) != max_bridges:
                 output[-1].append(bridge_id)
-                assigned.append(bridge_id)
+                assigned.add(bridge_id)
         for bridge_id in medium_bridges(bridge_data, inspector[0],
                                         inspector[1]):
             if bridge_id not in assigned and len(output[-1]) != max_bridges:
                 output[-1].append(bridge_id)
-                assigned.append(bridge_id)
+                assigned.add(bridge_id)
         for bridge_id in low_bridges(bridge_data, inspector[0], inspector[1]):
             if bridge_id not in assigned and len(output[-1]) != max_bridges:
                 output[-1].append(bridge_id)
-                assigned.append(bridge_id)
+                assigned.add(bridge_id)
     return output
 
 
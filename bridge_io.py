@@ -0,0 +1,168 @@
+"""Streaming ingestion of bridge data CSV files.
+
+read_data followed by format_data holds the whole raw file in memory before
+any formatting happens. The functions here read the CSV one line at a time,
+skip the two header lines while streaming, and format each record as it
+arrives, so only the formatted output is ever kept. load_table parses the
+span details and BCI histories with bridge_parser, a block of records at a
+time.
+"""
+
+import csv
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Iterator, Optional, TextIO
+
+from bci_history import compact_histories
+from bridge_functions import (
+    FIELD_FORMATS, format_bcis, format_fields, format_record, format_spans)
+from bridge_parser import parse_records
+from bridge_table import BridgeTable
+from constants import ID_INDEX, SPAN_DETAILS_INDEX, BCIS_INDEX
+
+# Number of header lines at the top of a bridge data CSV file.
+HEADER_LINES = 2
+
+# The fields iter_parsed_bridges formats itself: bridge_parser parses the
+# span details and BCIs.
+PARSED_FORMATS = tuple(entry for entry in FIELD_FORMATS
+                       if entry[0] not in (format_spans, format_bcis))
+
+# Number of records iter_parsed_bridges hands to parse_records at a time.
+PARSE_BLOCK = 4096
+
+
+def iter_raw_records(csv_file: TextIO) -> Iterator[list[str]]:
+    """Yield the unformatted records of the open CSV file csv_file one at a
+    time, skipping the header lines.
+
+    >>> from io import StringIO
+    >>> lines = StringIO(',,LOCATION\\nID,STRUCTURE\\n'
+    ...                  '1 -  32/,A\\n1 -  43/,B\\n')
+    >>> list(iter_raw_records(lines))
+    [['1 -  32/', 'A'], ['1 -  43/', 'B']]
+    """
+
+    return islice(csv.reader(csv_file), HEADER_LINES, None)
+
+
+def iter_bridges(csv_file: TextIO) -> Iterator[list]:
+    """Yield the records of the open CSV file csv_file one at a time,
+    formatted as format_data would format them (ids start at 1).
+
+    >>> from io import StringIO
+    >>> lines = StringIO(
+    ...     ',,LOCATION\\nID,STRUCTURE\\n'
+    ...     '2 -   4/,STOKES RIVER BRIDGE,6,45.036739,-81.33579,1958,2013,,1,'
+    ...     'Total=16  (1)=16;,18.4,08/28/2013,85.1,85.1,,67.8\\n')
+    >>> list(iter_bridges(lines)) == [
+    ...     [1, 'STOKES RIVER BRIDGE', '6', 45.036739, -81.33579, '1958',
+    ...      '2013', '', 1, [16.0], 18.4, '08/28/2013', [85.1, 85.1, 67.8]]]
+    True
+    """
+
+    for index, bridge in enumerate(iter_raw_records(csv_file)):
+        bridge[ID_INDEX] = index + 1
+        format_record(bridge)
+        yield bridge
+
+
+def iter_parsed_bridges(csv_file: TextIO,
+                        errors: Optional[list[tuple[int, str]]] = None
+                        ) -> Iterator[list]:
+    """Yield the records of the open CSV file csv_file one at a time,
+    formatted as iter_bridges formats them, but with the span lengths and
+    BCIs parsed by bridge_parser.parse_records.
+
+    A malformed field is blanked instead of stopping the read (see
+    bridge_functions.format_fields; malformed span details or BCIs become
+    empty lists), and if errors is not None, the line number and message
+    of each malformed field is appended to it.
+
+    >>> from io import StringIO
+    >>> lines = StringIO(
+    ...     ',,LOCATION\\nID,STRUCTURE\\n'
+    ...     '2 -   4/,STOKES RIVER BRIDGE,6,45.036739,-81.33579,1958,2013,,1,'
+    ...     'Total=16  (1)=16;,18.4,08/28/2013,85.1,85.1,,67.8\\n'
+    ...     '2 -   5/,BRIDGE,6,45.0,-81.3,1958,2013,,1,16,18.4,,85.1\\n'
+    ...     '2 -   6/,SHORT,6\\n'
+    ...     '2 -   7/,BRIDGE,6,45.0,-81.3,1958,2013,,x,Total=16  (1)=16;,abc,,'
+    ...     '85.1\\n')
+    >>> errors = []
+    >>> bridges = list(iter_parsed_bridges(lines, errors))
+    >>> bridges[0] == [
+    ...     1, 'STOKES RIVER BRIDGE', '6', 45.036739, -81.33579, '1958',
+    ...     '2013', '', 1, [16.0], 18.4, '08/28/2013', [85.1, 85.1, 67.8]]
+    True
+    >>> bridges[1][SPAN_DETAILS_INDEX], bridges[1][BCIS_INDEX]
+    ([], [])
+    >>> bridges[2][3:], bridges[3][8:]
+    (['', '', '', '', '', '', [], '', '', []], ['', [16.0], '', '', [85.1]])
+    >>> for line, message in errors:
+    ...     print(line, message)
+    4 malformed span details '16'
+    5 expected at least 13 columns, found 3
+    6 malformed deck length 'abc'
+    6 malformed number of spans 'x'
+    """
+
+    records = iter_raw_records(csv_file)
+    bridge_id = 1
+    while True:
+        block = list(islice(records, PARSE_BLOCK))
+        if not block:
+            return
+        parsed = parse_records(block, HEADER_LINES + bridge_id)
+        formatted = []
+        for line, bridge in enumerate(block, HEADER_LINES + bridge_id):
+            short = len(bridge) <= BCIS_INDEX
+            messages = format_fields(bridge, PARSED_FORMATS)
+            # parse_records has reported a short record already.
+            formatted.extend((line, message)
+                             for message in messages[1 if short else 0:])
+        if errors is not None:
+            errors.extend(sorted(parsed.errors + formatted,
+                                 key=itemgetter(0)))
+        for index, bridge in enumerate(block):
+            bridge[ID_INDEX] = bridge_id
+            bridge_id += 1
+            bridge[SPAN_DETAILS_INDEX] = parsed.spans[index]
+            bridge[BCIS_INDEX:] = [parsed.bcis[index]]
+            yield bridge
+
+
+def stream_bridges(csv_file: TextIO, callback: Callable[[list], None]) -> int:
+    """Call callback on each formatted record of the open CSV file csv_file,
+    in file order, and return the number of records.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    count = 0
+    for bridge in iter_bridges(csv_file):
+        callback(bridge)
+        count += 1
+    return count
+
+
+def load_table(csv_file: TextIO, compact: bool = True,
+               errors: Optional[list[tuple[int, str]]] = None) -> BridgeTable:
+    """Return a BridgeTable of the formatted records of the open CSV file
+    csv_file, built while the file is being read by iter_parsed_bridges,
+    which reports malformed records to errors. If compact is True, the
+    BCIs of each record are kept in a BciHistory instead of a list.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    table = BridgeTable()
+    for bridge in iter_parsed_bridges(csv_file, errors):
+        table.append(bridge)
+    if compact:
+        compact_histories(table)
+    return table
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
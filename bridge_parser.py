@@ -0,0 +1,130 @@
+"""Fast parsing of the span details and BCI history columns.
+
+format_spans and format_bcis build a list of floats per record with
+repeated str.split calls. The parser here matches span details against a
+grammar compiled once, and stores the span lengths and BCI histories of all
+records as ragged arrays: one flat array of values plus an array of
+offsets, where the values of record i are values[offsets[i]:offsets[i + 1]].
+
+Malformed records do not stop the parse: they get empty spans and BCIs and
+are reported with their line number in the file.
+"""
+
+import re
+from array import array
+from typing import Iterable
+
+from constants import SPAN_DETAILS_INDEX, BCIS_INDEX
+
+# Number of header lines at the top of a bridge data CSV file.
+HEADER_LINES = 2
+
+# Span details look like 'Total=64  (1)=12;(2)=19;(3)=21;(4)=12;'.
+SPAN_DETAILS = re.compile(r'Total=\S*\s+((?:\(\d+\)=[^;\s]+;?)*)')
+SPAN_LENGTH = re.compile(r'\(\d+\)=([^;\s]+)')
+
+
+class RaggedArray:
+    """A sequence of variable-length lists of floats stored as one flat
+    array of values and an array of offsets into it.
+
+    >>> ragged = RaggedArray()
+    >>> ragged.append([12.0, 19.0])
+    >>> ragged.append([])
+    >>> ragged.append([16.0])
+    >>> len(ragged), ragged[0], ragged[1], ragged[2]
+    (3, [12.0, 19.0], [], [16.0])
+    >>> list(ragged.offsets)
+    [0, 2, 2, 3]
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty ragged array."""
+
+        self.values = array('d')
+        self.offsets = array('q', [0])
+
+    def append(self, values: Iterable[float]) -> None:
+        """Append the list of floats values as a new last entry."""
+
+        self.values.extend(values)
+        self.offsets.append(len(self.values))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> list[float]:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.values[start:end].tolist()
+
+
+class ParsedColumns:
+    """The span lengths and BCI histories of a sequence of records, and the
+    (line number, message) pairs of the records that could not be parsed.
+    """
+
+    def __init__(self) -> None:
+        """Initialize columns with no records."""
+
+        self.spans = RaggedArray()
+        self.bcis = RaggedArray()
+        self.errors = []
+
+
+def parse_span_details(span_details: str) -> list[float]:
+    """Return the span lengths in the span details string span_details, as
+    format_spans would. Raise ValueError if span_details is malformed.
+
+    >>> parse_span_details('Total=64  (1)=12;(2)=19;(3)=21;(4)=12;')
+    [12.0, 19.0, 21.0, 12.0]
+    >>> parse_span_details('64')
+    Traceback (most recent call last):
+    ...
+    ValueError: malformed span details '64'
+    """
+
+    match = SPAN_DETAILS.fullmatch(span_details)
+    if match is None:
+        raise ValueError(f'malformed span details {span_details!r}')
+    return [float(length) for length in SPAN_LENGTH.findall(match.group(1))]
+
+
+def parse_records(records: Iterable[list[str]],
+                  first_line: int = HEADER_LINES + 1) -> ParsedColumns:
+    """Return the parsed span lengths and BCI histories (as format_bcis
+    would build them) of the unformatted records. The first record is on
+    line first_line of its file, and each record is on its own line.
+
+    >>> parsed = parse_records([
+    ...     ['1 -  32/', 'A', '403', '43.1', '-80.2', '1965', '2014', '2009',
+    ...      '4', 'Total=64  (1)=12;(2)=19;(3)=21;(4)=12;', '65',
+    ...      '04/13/2012', '72.3', '', '72.3'],
+    ...     ['1 -  43/', 'B', '403', '43.1', '-80.2', '1963', '2014', '2007',
+    ...      '4', '60.4', '61', '04/13/2012', '71.5', 'n/a']])
+    >>> parsed.spans[0], parsed.bcis[0]
+    ([12.0, 19.0, 21.0, 12.0], [72.3, 72.3])
+    >>> parsed.spans[1], parsed.bcis[1]
+    ([], [])
+    >>> parsed.errors
+    [(4, "malformed span details '60.4'")]
+    """
+
+    parsed = ParsedColumns()
+    for line, record in enumerate(records, first_line):
+        try:
+            if len(record) <= BCIS_INDEX:
+                raise ValueError(f'expected at least {BCIS_INDEX + 1} '
+                                 f'columns, found {len(record)}')
+            spans = parse_span_details(record[SPAN_DETAILS_INDEX])
+            bcis = [float(bci) for bci in record[BCIS_INDEX:] if bci != '']
+        except ValueError as error:
+            parsed.errors.append((line, str(error)))
+            spans = bcis = []
+        parsed.spans.append(spans)
+        parsed.bcis.append(bcis)
+    return parsed
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
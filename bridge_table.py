@@ -0,0 +1,300 @@
+"""Columnar storage for formatted bridge data.
+
+A BridgeTable wraps a list of formatted bridge records (the format produced
+by bridge_functions.format_data) and keeps the hot fields in typed arrays,
+together with an id -> row hash index, so that lookups by id are O(1) and
+scans walk flat arrays instead of indexing into every record.
+
+The table still iterates, indexes and measures like the list of records it
+wraps, so code written against list[list] keeps working when given a table.
+"""
+
+from array import array
+from math import cos, nan, radians
+from typing import Iterable, Optional, Union
+
+from constants import (
+    ID_INDEX, LAT_INDEX, LON_INDEX, NUM_SPANS_INDEX, LENGTH_INDEX,
+    BCIS_INDEX)
+
+
+def _as_float(value: object) -> float:
+    """Return value as a float, or nan if value was never formatted (e.g. an
+    empty location string).
+
+    >>> _as_float(43.1)
+    43.1
+    >>> _as_float('')
+    nan
+    """
+
+    if isinstance(value, (int, float)):
+        return float(value)
+    return nan
+
+
+def _as_int(value: object) -> int:
+    """Return value if it is an int, or 0 if it was never formatted (e.g. a
+    blanked number of spans).
+
+    >>> _as_int(4), _as_int('')
+    (4, 0)
+    """
+
+    return value if isinstance(value, int) else 0
+
+
+def renumbering(length: int, rows: Iterable[int]) -> list[int]:
+    """Return, for each row of a table of length rows, its row once the
+    rows in rows are deleted from the table, or -1 if it is one of them.
+
+    >>> renumbering(5, [3, 1])
+    [0, -1, 1, -1, 2]
+    """
+
+    deleted = set(rows)
+    renumbered = []
+    new_row = 0
+    for row in range(length):
+        if row in deleted:
+            renumbered.append(-1)
+        else:
+            renumbered.append(new_row)
+            new_row += 1
+    return renumbered
+
+
+def compact(values: Union[list, array], renumbered: list[int]) -> None:
+    """Delete from the per-row list or array values, in place, the entries
+    of the rows that renumbered (see renumbering) maps to -1.
+
+    >>> values = array('d', [1.0, 2.0, 3.0])
+    >>> compact(values, [0, -1, 1])
+    >>> values
+    array('d', [1.0, 3.0])
+    """
+
+    kept = values[:0]
+    start = 0
+    while True:
+        try:
+            row = renumbered.index(-1, start)
+        except ValueError:
+            break
+        kept += values[start:row]
+        start = row + 1
+    kept += values[start:]
+    values[:] = kept
+
+
+# The typed column arrays of a BridgeTable and their array typecodes.
+COLUMNS = {
+    'ids': 'q', 'lats': 'd', 'lons': 'd', 'lengths': 'd', 'num_spans': 'q',
+    'bcis': 'd', 'lat_radians': 'd', 'lon_radians': 'd', 'cos_lats': 'd'
+}
+
+
+class BridgeTable:
+    """A columnar table of formatted bridge records.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> len(table)
+    3
+    >>> list(table.ids)
+    [1, 2, 3]
+    >>> table.row_of(2)
+    1
+    >>> table.row_of(42)
+    -1
+    >>> table.record(3)[1]
+    'STOKES RIVER BRIDGE'
+    >>> table.bcis[0]
+    72.3
+    """
+
+    def __init__(self, bridge_data: Optional[list[list]] = None) -> None:
+        """Initialize a table over the formatted records in bridge_data, or an
+        empty table if bridge_data is None.
+
+        The records themselves are shared, not copied: get_bridge on a table
+        returns the same list object that is stored in bridge_data.
+
+        derived holds structures built from the table on first use (such as
+        the spatial index), keyed by name, so they are built only once.
+        listeners holds functions that keep those structures up to date:
+        each is called with the row of every record that is appended or
+        refreshed. removers holds the functions that do the same when rows
+        are deleted: each is called with the renumbering of the deletion
+        (see renumbering) before the table changes.
+        """
+
+        if bridge_data is None:
+            bridge_data = []
+        self.records = bridge_data
+        for name, typecode in COLUMNS.items():
+            setattr(self, name, array(typecode))
+        self._rows = {}
+        self.derived = {}
+        self.listeners = []
+        self.removers = []
+        for bridge in bridge_data:
+            self._append_columns(bridge)
+
+    @classmethod
+    def from_columns(cls, bridge_data: list[list],
+                     columns: dict[str, array]) -> 'BridgeTable':
+        """Return a table over the formatted records in bridge_data whose
+        column arrays are the (already computed) arrays in columns, keyed by
+        the names in COLUMNS.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(THREE_BRIDGES)
+        >>> columns = {name: getattr(table, name) for name in COLUMNS}
+        >>> copy = BridgeTable.from_columns(THREE_BRIDGES, columns)
+        >>> copy.row_of(3), list(copy.lengths)
+        (2, [65.0, 61.0, 18.4])
+        """
+
+        table = cls()
+        table.records = bridge_data
+        for name in COLUMNS:
+            setattr(table, name, columns[name])
+        table._rows = {bridge_id: row for row, bridge_id
+                       in enumerate(table.ids)}
+        return table
+
+    def _append_columns(self, bridge: list) -> None:
+        """Append the hot fields of the formatted record bridge to the
+        column arrays and the id index.
+        """
+
+        self._rows[bridge[ID_INDEX]] = len(self.ids)
+        self.ids.append(bridge[ID_INDEX])
+        self.lats.append(_as_float(bridge[LAT_INDEX]))
+        self.lons.append(_as_float(bridge[LON_INDEX]))
+        self.lat_radians.append(radians(self.lats[-1]))
+        self.lon_radians.append(radians(self.lons[-1]))
+        self.cos_lats.append(cos(self.lat_radians[-1]))
+        self.lengths.append(_as_float(bridge[LENGTH_INDEX]))
+        self.num_spans.append(_as_int(bridge[NUM_SPANS_INDEX]))
+        if bridge[BCIS_INDEX]:
+            self.bcis.append(bridge[BCIS_INDEX][0])
+        else:
+            self.bcis.append(nan)
+
+    def append(self, bridge: list) -> None:
+        """Append the formatted record bridge to the end of the table.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable()
+        >>> for bridge in THREE_BRIDGES:
+        ...     table.append(bridge)
+        >>> len(table), table.row_of(3)
+        (3, 2)
+        """
+
+        self.records.append(bridge)
+        self._append_columns(bridge)
+        self._notify(len(self.records) - 1)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, row: int) -> list:
+        return self.records[row]
+
+    def row_of(self, bridge_id: int) -> int:
+        """Return the row of the bridge with id bridge_id, or -1 if there is
+        no such bridge.
+        """
+
+        return self._rows.get(bridge_id, -1)
+
+    def record(self, bridge_id: int) -> list:
+        """Return the record of the bridge with id bridge_id, or [] if there
+        is no such bridge.
+        """
+
+        row = self._rows.get(bridge_id, -1)
+        if row == -1:
+            return []
+        return self.records[row]
+
+    def refresh_row(self, row: int) -> None:
+        """Reload the column values of row from its record, after the record
+        has been modified in place, and tell the listeners.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> table.listeners.append(print)
+        >>> table[1][BCIS_INDEX].insert(0, 55.0)
+        >>> table.refresh_row(1)
+        1
+        >>> table.bcis[1]
+        55.0
+        """
+
+        bridge = self.records[row]
+        self.lats[row] = _as_float(bridge[LAT_INDEX])
+        self.lons[row] = _as_float(bridge[LON_INDEX])
+        self.lat_radians[row] = radians(self.lats[row])
+        self.lon_radians[row] = radians(self.lons[row])
+        self.cos_lats[row] = cos(self.lat_radians[row])
+        self.lengths[row] = _as_float(bridge[LENGTH_INDEX])
+        self.num_spans[row] = _as_int(bridge[NUM_SPANS_INDEX])
+        if bridge[BCIS_INDEX]:
+            self.bcis[row] = bridge[BCIS_INDEX][0]
+        else:
+            self.bcis[row] = nan
+        self._notify(row)
+
+    def delete_rows(self, rows: Iterable[int]) -> None:
+        """Remove the records at rows from the table, keeping the other
+        records in order.
+
+        The records after a removed row move up. Every remover is called
+        first, with the renumbering of the deletion, so that the derived
+        structures can drop the removed rows and renumber the others in
+        place; they stay registered. The columns are then compacted in one
+        pass.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> table.removers.append(print)
+        >>> table.delete_rows([0])
+        [-1, 0, 1]
+        >>> list(table.ids), table.row_of(3), table.row_of(1)
+        ([2, 3], 1, -1)
+        >>> table.record(3)[1]
+        'STOKES RIVER BRIDGE'
+        """
+
+        rows = set(rows)
+        if not rows:
+            return
+        renumbered = renumbering(len(self.records), rows)
+        for remover in list(self.removers):
+            remover(renumbered)
+        for row in rows:
+            del self._rows[self.ids[row]]
+        compact(self.records, renumbered)
+        for name in COLUMNS:
+            compact(getattr(self, name), renumbered)
+        for row in range(min(rows), len(self.ids)):
+            self._rows[self.ids[row]] = row
+
+    def _notify(self, row: int) -> None:
+        """Call every listener with row."""
+
+        for listener in list(self.listeners):
+            listener(row)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
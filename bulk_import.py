@@ -0,0 +1,234 @@
+"""Bulk import of inspection and rehab records.
+
+An import takes (id, date, bci) inspection rows or (id, date, severity)
+rehab rows, either as an iterable or as an open CSV file, and validates
+all of them before changing anything: if any row is invalid, nothing is
+applied. Valid imports are applied in one pass in input order, looking
+bridges up by id, with the same effect as calling inspect_bridges or
+add_rehab once per row.
+"""
+
+import csv
+from datetime import datetime
+from typing import Callable, Iterable, NamedTuple, Sequence, TextIO, Union
+
+from bridge_table import BridgeTable
+from constants import (
+    ID_INDEX, LAST_MAJOR_INDEX, LAST_MINOR_INDEX, LAST_INSPECTED_INDEX,
+    BCIS_INDEX)
+
+DATE_FORMAT = '%m/%d/%Y'
+MAJOR_SEVERITIES = ('major', 'true', '1')
+MINOR_SEVERITIES = ('minor', 'false', '0')
+
+
+class ImportReport(NamedTuple):
+    """The outcome of an import: the number of rows applied, the number of
+    rows rejected, and a (row number, message) pair for each rejected row.
+    Row numbers count from 1, or are line numbers for CSV files.
+    """
+    applied: int
+    rejected: int
+    errors: list[tuple[int, str]]
+
+
+def _parse_id(value: object, row_of: Callable[[int], int]) -> int:
+    """Return value as the id of a bridge whose row, according to row_of, is
+    not -1. Raise ValueError if it is not one.
+    """
+
+    try:
+        bridge_id = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid bridge id {value!r}') from None
+    if row_of(bridge_id) == -1:
+        raise ValueError(f'no bridge with id {bridge_id}')
+    return bridge_id
+
+
+def _parse_date(value: object) -> str:
+    """Return value if it is a valid MM/DD/YYYY date. Raise ValueError if it
+    is not.
+
+    >>> _parse_date('09/15/2018')
+    '09/15/2018'
+    >>> _parse_date('2018-09-15')
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid date '2018-09-15'
+    """
+
+    try:
+        datetime.strptime(value, DATE_FORMAT)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid date {value!r}') from None
+    return value
+
+
+def _parse_bci(value: object) -> float:
+    """Return value as a BCI between 0 and 100. Raise ValueError if it is
+    not one.
+    """
+
+    try:
+        bci = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid BCI {value!r}') from None
+    if not 0 <= bci <= 100:
+        raise ValueError(f'BCI {bci} is not between 0 and 100')
+    return bci
+
+
+def _parse_severity(value: object) -> bool:
+    """Return True if value describes a major rehab and False if it
+    describes a minor one. Raise ValueError otherwise.
+
+    >>> _parse_severity(True), _parse_severity('Minor'), _parse_severity('1')
+    (True, False, True)
+    """
+
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in MAJOR_SEVERITIES:
+        return True
+    if str(value).strip().lower() in MINOR_SEVERITIES:
+        return False
+    raise ValueError(f'invalid severity {value!r}')
+
+
+def row_lookup(bridge_data: Union[BridgeTable, list[list]]
+               ) -> Callable[[int], int]:
+    """Return a function that maps a bridge id to its position in
+    bridge_data, or to -1 if there is no bridge with that id.
+    """
+
+    if isinstance(bridge_data, BridgeTable):
+        return bridge_data.row_of
+    rows = {bridge[ID_INDEX]: row for row, bridge in enumerate(bridge_data)}
+    return lambda bridge_id: rows.get(bridge_id, -1)
+
+
+def _validate(rows: Iterable[tuple[int, Sequence]],
+              parsers: tuple) -> tuple[list[tuple], list[tuple[int, str]]]:
+    """Return the parsed values of every (row number, row) pair in rows, and
+    the errors of the rows that could not be parsed. Each row must have one
+    value per parser in parsers.
+    """
+
+    parsed = []
+    errors = []
+    for number, row in rows:
+        try:
+            if len(row) != len(parsers):
+                raise ValueError(f'expected {len(parsers)} values, found '
+                                 f'{len(row)}')
+            parsed.append(tuple(parse(value)
+                                for parse, value in zip(parsers, row)))
+        except ValueError as error:
+            errors.append((number, str(error)))
+    return parsed, errors
+
+
+def _numbered(rows: Union[Iterable[Sequence], TextIO]
+              ) -> Iterable[tuple[int, Sequence]]:
+    """Return (row number, row) pairs for rows, which is either an iterable
+    of rows or an open CSV file, whose rows are numbered by line and whose
+    first line is skipped if it is a header starting with 'id'.
+    """
+
+    if hasattr(rows, 'read'):
+        reader = csv.reader(rows)
+        return ((reader.line_num, row) for row in reader
+                if row and not (reader.line_num == 1
+                                and row[0].strip().lower() == 'id'))
+    return enumerate(rows, 1)
+
+
+def import_inspections(bridge_data: Union[BridgeTable, list[list]],
+                       rows: Union[Iterable[Sequence], TextIO]
+                       ) -> ImportReport:
+    """Record the (bridge id, date, BCI) inspections in rows, an iterable or
+    an open CSV file, in bridge_data, unless any row is invalid. Return a
+    report of the import.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> from copy import deepcopy
+    >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+    >>> import_inspections(table, [(1, '09/15/2018', 71.9),
+    ...                            (3, '09/16/2018', '88')])
+    ImportReport(applied=2, rejected=0, errors=[])
+    >>> table.record(3)[LAST_INSPECTED_INDEX], table.bcis[2]
+    ('09/16/2018', 88.0)
+    >>> import_inspections(table, [(2, '09/15/2018', 60), (4, '', 200)])
+    ImportReport(applied=0, rejected=1, errors=[(2, 'no bridge with id 4')])
+    >>> table.bcis[1]
+    71.5
+    """
+
+    row_of = row_lookup(bridge_data)
+    parsed, errors = _validate(
+        _numbered(rows),
+        (lambda value: _parse_id(value, row_of), _parse_date, _parse_bci))
+    if errors:
+        return ImportReport(0, len(errors), errors)
+
+    touched = set()
+    for bridge_id, date, bci in parsed:
+        bridge = bridge_data[row_of(bridge_id)]
+        bridge[LAST_INSPECTED_INDEX] = date
+        bridge[BCIS_INDEX].insert(0, bci)
+        touched.add(row_of(bridge_id))
+    refresh_rows(bridge_data, touched)
+    return ImportReport(len(parsed), 0, [])
+
+
+def import_rehabs(bridge_data: Union[BridgeTable, list[list]],
+                  rows: Union[Iterable[Sequence], TextIO]) -> ImportReport:
+    """Record the (bridge id, date, severity) rehabs in rows, an iterable or
+    an open CSV file, in bridge_data, unless any row is invalid. severity
+    is True or 'major' for a major rehab and False or 'minor' for a minor
+    one. Return a report of the import.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> from copy import deepcopy
+    >>> from io import StringIO
+    >>> bridges = deepcopy(THREE_BRIDGES)
+    >>> import_rehabs(bridges, StringIO('id,date,severity\\n'
+    ...                                 '1,09/15/2023,minor\\n'
+    ...                                 '3,10/01/2023,major\\n'))
+    ImportReport(applied=2, rejected=0, errors=[])
+    >>> bridges[0][LAST_MINOR_INDEX], bridges[2][LAST_MAJOR_INDEX]
+    ('2023', '2023')
+    """
+
+    row_of = row_lookup(bridge_data)
+    parsed, errors = _validate(
+        _numbered(rows),
+        (lambda value: _parse_id(value, row_of), _parse_date, _parse_severity))
+    if errors:
+        return ImportReport(0, len(errors), errors)
+
+    touched = set()
+    for bridge_id, date, severity in parsed:
+        bridge = bridge_data[row_of(bridge_id)]
+        if severity:
+            bridge[LAST_MAJOR_INDEX] = date[-4:]
+        else:
+            bridge[LAST_MINOR_INDEX] = date[-4:]
+        touched.add(row_of(bridge_id))
+    refresh_rows(bridge_data, touched)
+    return ImportReport(len(parsed), 0, [])
+
+
+def refresh_rows(bridge_data: Union[BridgeTable, list[list]],
+                 rows: Iterable[int]) -> None:
+    """Refresh rows of bridge_data, in order, if it is a BridgeTable."""
+
+    if isinstance(bridge_data, BridgeTable):
+        for row in sorted(rows):
+            bridge_data.refresh_row(row)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,234 @@
+"""Parsed date columns of a BridgeTable with sorted indexes.
+
+The last inspection date of every bridge is parsed once into an ordinal day
+(date.toordinal) and its last major and minor rehab years into integers,
+each kept in a typed array (-1 where the field is empty) and in a
+SortedIndex. Questions such as "which bridges were not inspected since X"
+then take two binary searches instead of parsing every date string.
+"""
+
+import datetime
+from array import array
+from math import inf
+
+from bridge_table import BridgeTable, compact
+from constants import LAST_MAJOR_INDEX, LAST_MINOR_INDEX, LAST_INSPECTED_INDEX
+from sorted_index import SortedIndex
+
+MISSING = -1
+
+
+def date_ordinal(date: str) -> int:
+    """Return the ordinal day of the MM/DD/YYYY date date, or MISSING if
+    date is empty or not a valid date.
+
+    >>> date_ordinal('04/13/2012')
+    734606
+    >>> date_ordinal('')
+    -1
+    """
+
+    try:
+        month, day, year = date.split('/')
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except (AttributeError, ValueError):
+        return MISSING
+
+
+def checked_ordinal(date: str) -> int:
+    """Return the ordinal day of the MM/DD/YYYY date date. Raise ValueError
+    if date is not a valid date.
+
+    >>> checked_ordinal('04/13/2012')
+    734606
+    >>> checked_ordinal('13/04/2012')
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid date '13/04/2012'
+    """
+
+    day = date_ordinal(date)
+    if day == MISSING:
+        raise ValueError(f'invalid date {date!r}')
+    return day
+
+
+def year_number(year: str) -> int:
+    """Return the year year as an integer, or MISSING if it is empty.
+
+    >>> year_number('2014'), year_number('')
+    (2014, -1)
+    """
+
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+class DateIndex:
+    """Sorted indexes of the last inspection dates and last rehab years of
+    the bridges in a table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> index = DateIndex(BridgeTable(THREE_BRIDGES))
+    >>> list(index.inspected_days)
+    [734606, 734606, 735108]
+    >>> index.inspected_before('01/01/2013')
+    [1, 2]
+    >>> index.inspected_between('01/01/2013', '12/31/2013')
+    [3]
+    >>> index.rehab_between(2013, 2013, True)
+    [3]
+    >>> index.rehab_between(2008, 2010, False)
+    [1]
+    """
+
+    def __init__(self, table: BridgeTable) -> None:
+        """Initialize the date indexes of the bridges in table."""
+
+        self.table = table
+        self.inspected_days = array('q', (
+            date_ordinal(bridge[LAST_INSPECTED_INDEX]) for bridge in table))
+        self.major_years = array('q', (
+            year_number(bridge[LAST_MAJOR_INDEX]) for bridge in table))
+        self.minor_years = array('q', (
+            year_number(bridge[LAST_MINOR_INDEX]) for bridge in table))
+        self._inspected, self._major, self._minor = (
+            SortedIndex.from_values(None if value == MISSING else value
+                                    for value in column)
+            for column in (self.inspected_days, self.major_years,
+                           self.minor_years))
+
+    def update(self, row: int) -> None:
+        """Parse the dates of the bridge at row of the table again, adding
+        them if the bridge is new.
+
+        >>> from bridge_functions import THREE_BRIDGES, inspect_bridges
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> index = get_date_index(table)
+        >>> inspect_bridges(table, [1], '09/15/2018', 71.9)
+        >>> index.inspected_before('01/01/2013')
+        [2]
+        """
+
+        bridge = self.table[row]
+        values = (date_ordinal(bridge[LAST_INSPECTED_INDEX]),
+                  year_number(bridge[LAST_MAJOR_INDEX]),
+                  year_number(bridge[LAST_MINOR_INDEX]))
+        columns = (self.inspected_days, self.major_years, self.minor_years)
+        indexes = (self._inspected, self._major, self._minor)
+        for column, index, value in zip(columns, indexes, values):
+            if row == len(column):
+                column.append(value)
+            else:
+                column[row] = value
+            index.set(row, None if value == MISSING else value)
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the dates of the bridges at the rows that renumbered maps to
+        -1 (see bridge_table.renumbering), and renumber the others.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> index = get_date_index(table)
+        >>> table.delete_rows([0])
+        >>> list(index.inspected_days), index.inspected_before('01/01/2013')
+        ([734606, 735108], [2])
+        """
+
+        for column in (self.inspected_days, self.major_years,
+                       self.minor_years):
+            compact(column, renumbered)
+        for index in (self._inspected, self._major, self._minor):
+            index.delete_rows(renumbered)
+
+    def _ids(self, rows: list[int]) -> list[int]:
+        """Return the ids of the bridges at rows of the table."""
+
+        ids = self.table.ids
+        return [ids[row] for row in rows]
+
+    def inspected_rows(self, first_day: float = -inf,
+                       last_day: float = inf) -> list[int]:
+        """Return the rows, in table order, of the bridges last inspected on
+        an ordinal day from first_day to last_day.
+        """
+
+        return self._inspected.rows_between(first_day, last_day)
+
+    def count_inspected(self, first_day: float = -inf,
+                        last_day: float = inf) -> int:
+        """Return the number of rows inspected_rows would return."""
+
+        return self._inspected.count_between(first_day, last_day)
+
+    def inspected_before(self, date: str) -> list[int]:
+        """Return the ids, in table order, of the bridges last inspected
+        before the MM/DD/YYYY date date, i.e. not inspected since then.
+        Bridges with no inspection date are not included. Raise ValueError
+        if date is not a valid date.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> index = DateIndex(BridgeTable(THREE_BRIDGES))
+        >>> index.inspected_before('01/01/2013')
+        [1, 2]
+        >>> index.inspected_before('2013-01-01')
+        Traceback (most recent call last):
+        ...
+        ValueError: invalid date '2013-01-01'
+        """
+
+        return self._ids(self._inspected.rows_between(
+            high=checked_ordinal(date), include_high=False))
+
+    def inspected_between(self, start: str, end: str) -> list[int]:
+        """Return the ids, in table order, of the bridges last inspected on
+        or after the MM/DD/YYYY date start and on or before the date end.
+        Raise ValueError if either is not a valid date.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> index = DateIndex(BridgeTable(THREE_BRIDGES))
+        >>> index.inspected_between('01/01/2013', '12/31/2013')
+        [3]
+        >>> index.inspected_between('01/01/2013', '')
+        Traceback (most recent call last):
+        ...
+        ValueError: invalid date ''
+        """
+
+        return self._ids(self._inspected.rows_between(
+            checked_ordinal(start), checked_ordinal(end)))
+
+    def rehab_between(self, first_year: int, last_year: int,
+                      major: bool) -> list[int]:
+        """Return the ids, in table order, of the bridges whose last major
+        (if major is True) or minor rehab was in a year from first_year to
+        last_year.
+        """
+
+        index = self._major if major else self._minor
+        return self._ids(index.rows_between(first_year, last_year))
+
+
+def get_date_index(table: BridgeTable) -> DateIndex:
+    """Return the date index of table, building it on first use. The index
+    follows later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_date_index(table) is get_date_index(table)
+    True
+    """
+
+    if 'dates' not in table.derived:
+        table.derived['dates'] = DateIndex(table)
+        table.listeners.append(table.derived['dates'].update)
+        table.removers.append(table.derived['dates'].delete_rows)
+    return table.derived['dates']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
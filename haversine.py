@@ -0,0 +1,125 @@
+"""Batched haversine distances from one or many points to every bridge in a
+BridgeTable.
+
+The kernels use the cached radians and cos(lat) columns of the table and
+evaluate the same expression as bridge_functions.calculate_distance, in the
+same order, so the rounded results are identical to calling it once per
+bridge with the bridge as the first location.
+"""
+
+from array import array
+from math import asin, cos, radians, sin, sqrt
+
+from bridge_table import BridgeTable
+from constants import EARTH_RADIUS
+from instrumentation import instrumented, result_rows
+
+
+@instrumented(result_rows)
+def bridge_distances(table: BridgeTable, lat: float, lon: float,
+                     rounded: bool = True) -> array:
+    """Return an array with the distance in kilometers from every bridge in
+    table, in row order, to the location (lat, lon). If rounded is True, the
+    distances are rounded to the nearest meter like calculate_distance.
+
+    >>> from bridge_functions import THREE_BRIDGES, calculate_distance
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> list(bridge_distances(table, 43.10, -80.15))
+    [12.638, 10.929, 235.266]
+    >>> all(distance == calculate_distance(bridge[3], bridge[4], 43.10, -80.15)
+    ...     for distance, bridge in zip(bridge_distances(table, 43.10, -80.15),
+    ...                                 THREE_BRIDGES))
+    True
+    >>> abs(bridge_distances(table, 43.10, -80.15, False)[0] - 12.638) < 0.001
+    True
+    """
+
+    lat2 = radians(lat)
+    lon2 = radians(lon)
+    cos_lat2 = cos(lat2)
+    diameter = 2 * EARTH_RADIUS
+    distances = array('d', [
+        diameter * asin(sqrt(sin((lat2 - lat1) / 2) ** 2
+                             + cos_lat1 * cos_lat2
+                             * sin((lon2 - lon1) / 2) ** 2))
+        for lat1, lon1, cos_lat1
+        in zip(table.lat_radians, table.lon_radians, table.cos_lats)])
+    if rounded:
+        return array('d', [round(distance, 3) for distance in distances])
+    return distances
+
+
+@instrumented(result_rows)
+def bridge_distances_at(table: BridgeTable, rows: list[int], lat: float,
+                        lon: float, rounded: bool = True) -> array:
+    """Return an array with the distance in kilometers from each bridge at a
+    row in rows, in the order given, to the location (lat, lon). The
+    distances are the same as those bridge_distances returns for those rows.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> list(bridge_distances_at(table, [2, 0], 43.10, -80.15))
+    [235.266, 12.638]
+    """
+
+    lat2 = radians(lat)
+    lon2 = radians(lon)
+    cos_lat2 = cos(lat2)
+    diameter = 2 * EARTH_RADIUS
+    lat_radians = table.lat_radians
+    lon_radians = table.lon_radians
+    cos_lats = table.cos_lats
+    distances = array('d', [
+        diameter * asin(sqrt(sin((lat2 - lat_radians[row]) / 2) ** 2
+                             + cos_lats[row] * cos_lat2
+                             * sin((lon2 - lon_radians[row]) / 2) ** 2))
+        for row in rows])
+    if rounded:
+        return array('d', [round(distance, 3) for distance in distances])
+    return distances
+
+
+def bridge_point_distances(table: BridgeTable, row: int,
+                           points: list[tuple[float, float, float]]
+                           ) -> list[float]:
+    """Return the distance in kilometers, rounded to the nearest meter, from
+    the bridge at row of table to each point in points, given as (latitude
+    in radians, longitude in radians, cosine of latitude) triples. The
+    distances are the same as those bridge_distances returns.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> bridge_point_distances(table, 0, [(radians(43.10), radians(-80.15),
+    ...                                    cos(radians(43.10)))])
+    [12.638]
+    """
+
+    lat1 = table.lat_radians[row]
+    lon1 = table.lon_radians[row]
+    cos_lat1 = table.cos_lats[row]
+    diameter = 2 * EARTH_RADIUS
+    return [round(diameter * asin(sqrt(sin((lat2 - lat1) / 2) ** 2
+                                       + cos_lat1 * cos_lat2
+                                       * sin((lon2 - lon1) / 2) ** 2)), 3)
+            for lat2, lon2, cos_lat2 in points]
+
+
+@instrumented()
+def bridge_distances_many(table: BridgeTable, points: list[list[float]],
+                          rounded: bool = True) -> list[array]:
+    """Return a list with one array of bridge distances (as returned by
+    bridge_distances) for each (latitude, longitude) pair in points.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> [list(row) for row in bridge_distances_many(
+    ...     table, [[43.10, -80.15], [45.036739, -81.33579]])]
+    [[12.638, 10.929, 235.266], [224.451, 225.459, 0.0]]
+    """
+
+    return [bridge_distances(table, lat, lon, rounded) for lat, lon in points]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
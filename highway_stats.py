@@ -0,0 +1,250 @@
+"""Per-highway aggregates over the bridges in a BridgeTable.
+
+The rows of each highway are kept in table order, together with running
+totals of its bridge count, span count, deck length and current BCIs. A
+bridge that is added, changed or deleted only adds or takes away its own
+contribution, so an update costs constant time unless the bridge changes
+highway, which also moves its row between the row lists. The float totals
+are compensated sums (Neumaier's variant of Kahan summation), and a
+highway's are summed again from its rows with fsum after RESUM_CHANGES
+updates, so rounding errors cannot pile up however long the table lives.
+"""
+
+from bisect import insort
+from math import fsum, nan
+from typing import NamedTuple
+
+from bridge_table import BridgeTable, compact
+from constants import HIGHWAY_INDEX
+
+# Updates to the totals of a highway after which they are summed again
+# from its rows.
+RESUM_CHANGES = 1024
+
+
+def _add(total: list[float], value: float) -> None:
+    """Add value to total, a compensated sum held as [sum, compensation].
+
+    >>> total = [0.0, 0.0]
+    >>> for value in [0.1] * 10:
+    ...     _add(total, value)
+    >>> total[0] + total[1], sum([0.1] * 10)
+    (1.0, 0.9999999999999999)
+    """
+
+    running = total[0] + value
+    if abs(total[0]) >= abs(value):
+        total[1] += (total[0] - running) + value
+    else:
+        total[1] += (value - running) + total[0]
+    total[0] = running
+
+
+class HighwayStats(NamedTuple):
+    """Aggregates of the bridges on one highway. mean_bci is 0.0 if none of
+    them has a BCI. Bridges without a deck length add nothing to
+    total_length.
+    """
+    total_length: float
+    bridge_count: int
+    mean_bci: float
+    span_count: int
+
+
+class HighwayAggregates:
+    """Aggregates of every highway in a BridgeTable.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> aggregates = HighwayAggregates(BridgeTable(THREE_BRIDGES))
+    >>> tuple(aggregates.stats('403'))
+    (126.0, 2, 71.9, 8)
+    >>> tuple(aggregates.stats('401'))
+    (0.0, 0, 0.0, 0)
+    >>> list(aggregates.all_stats())
+    ['403', '6']
+    """
+
+    def __init__(self, table: BridgeTable) -> None:
+        """Initialize the aggregates of the highways in table."""
+
+        self.table = table
+        self._highway_of = []
+        self._span_count_of = []
+        self._length_of = []
+        self._bci_of = []
+        self._rows = {}
+        self._counts = {}
+        self._span_counts = {}
+        self._lengths = {}
+        self._bcis = {}
+        self._bci_counts = {}
+        self._changes = {}
+        for row in range(len(table)):
+            self.update(row)
+
+    def update(self, row: int) -> None:
+        """Bring the aggregates up to date with the bridge at row of the
+        table, which may be new.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> aggregates = HighwayAggregates(table)
+        >>> table[2][HIGHWAY_INDEX] = '403'
+        >>> aggregates.update(2)
+        >>> aggregates.stats('403').total_length
+        144.4
+        >>> '6' in aggregates.all_stats()
+        False
+        """
+
+        highway = self.table[row][HIGHWAY_INDEX]
+        if row == len(self._highway_of):
+            self._highway_of.append(None)
+            self._span_count_of.append(0)
+            self._length_of.append(0.0)
+            self._bci_of.append(nan)
+        old_highway = self._highway_of[row]
+        if old_highway is not None:
+            self._apply(old_highway, row, -1)
+        if old_highway != highway:
+            if old_highway is not None:
+                self._rows[old_highway].remove(row)
+                self._counts[old_highway] -= 1
+                if not self._rows[old_highway]:
+                    self._forget(old_highway)
+            if highway not in self._rows:
+                self._start(highway)
+            insort(self._rows[highway], row)
+            self._counts[highway] += 1
+            self._highway_of[row] = highway
+        length = self.table.lengths[row]
+        self._span_count_of[row] = self.table.num_spans[row]
+        self._length_of[row] = length if length == length else 0.0
+        self._bci_of[row] = self.table.bcis[row]
+        self._apply(highway, row, 1)
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Take the bridges at the rows that renumbered maps to -1 (see
+        bridge_table.renumbering) out of the aggregates, and renumber the
+        rows of the others.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> aggregates = get_highway_aggregates(table)
+        >>> table.delete_rows([0])
+        >>> tuple(aggregates.stats('403')), aggregates.rows_on('6')
+        ((61.0, 1, 71.5, 4), [1])
+        """
+
+        for row, new_row in enumerate(renumbered):
+            if new_row == -1:
+                highway = self._highway_of[row]
+                self._apply(highway, row, -1)
+                self._counts[highway] -= 1
+        for highway, rows in list(self._rows.items()):
+            rows[:] = [renumbered[row] for row in rows
+                       if renumbered[row] != -1]
+            if not rows:
+                self._forget(highway)
+        for values in (self._highway_of, self._span_count_of,
+                       self._length_of, self._bci_of):
+            compact(values, renumbered)
+
+    def _start(self, highway: str) -> None:
+        """Start the aggregates of highway, which has no bridges yet."""
+
+        self._rows[highway] = []
+        self._counts[highway] = 0
+        self._span_counts[highway] = 0
+        self._lengths[highway] = [0.0, 0.0]
+        self._bcis[highway] = [0.0, 0.0]
+        self._bci_counts[highway] = 0
+        self._changes[highway] = 0
+
+    def _forget(self, highway: str) -> None:
+        """Remove every aggregate of highway, which has no bridges left."""
+
+        for aggregate in (self._rows, self._counts, self._span_counts,
+                          self._lengths, self._bcis, self._bci_counts,
+                          self._changes):
+            del aggregate[highway]
+
+    def _apply(self, highway: str, row: int, sign: int) -> None:
+        """Add (if sign is 1) or take away (if sign is -1) the contribution
+        of the bridge at row to the totals of highway, except to its
+        bridge count.
+        """
+
+        self._span_counts[highway] += sign * self._span_count_of[row]
+        _add(self._lengths[highway], sign * self._length_of[row])
+        bci = self._bci_of[row]
+        if bci == bci:
+            _add(self._bcis[highway], sign * bci)
+            self._bci_counts[highway] += sign
+        self._changes[highway] += 1
+
+    def _resum(self, highway: str) -> None:
+        """Sum the totals of highway again from the bridges on it."""
+
+        rows = self._rows[highway]
+        bcis = [self._bci_of[row] for row in rows
+                if self._bci_of[row] == self._bci_of[row]]
+        self._lengths[highway] = [
+            fsum(self._length_of[row] for row in rows), 0.0]
+        self._bcis[highway] = [fsum(bcis), 0.0]
+        self._bci_counts[highway] = len(bcis)
+        self._changes[highway] = 0
+
+    def stats(self, highway: str) -> HighwayStats:
+        """Return the aggregates of the bridges on highway."""
+
+        if highway not in self._rows:
+            return HighwayStats(0.0, 0, 0.0, 0)
+        if self._changes[highway] >= RESUM_CHANGES:
+            self._resum(highway)
+        bci_count = self._bci_counts[highway]
+        return HighwayStats(sum(self._lengths[highway]),
+                            self._counts[highway],
+                            sum(self._bcis[highway]) / bci_count
+                            if bci_count else 0.0,
+                            self._span_counts[highway])
+
+    def rows_on(self, highway: str) -> list[int]:
+        """Return the rows, in table order, of the bridges on highway.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> HighwayAggregates(BridgeTable(THREE_BRIDGES)).rows_on('403')
+        [0, 1]
+        """
+
+        return list(self._rows.get(highway, ()))
+
+    def all_stats(self) -> dict[str, HighwayStats]:
+        """Return a dictionary mapping every highway with at least one bridge
+        to its aggregates.
+        """
+
+        return {highway: self.stats(highway) for highway in self._rows}
+
+
+def get_highway_aggregates(table: BridgeTable) -> HighwayAggregates:
+    """Return the highway aggregates of table, building them on first use.
+    The aggregates follow later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_highway_aggregates(table) is get_highway_aggregates(table)
+    True
+    """
+
+    if 'highways' not in table.derived:
+        table.derived['highways'] = HighwayAggregates(table)
+        table.listeners.append(table.derived['highways'].update)
+        table.removers.append(table.derived['highways'].delete_rows)
+    return table.derived['highways']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,312 @@
+"""Opt-in call counts, timings and rows scanned for the hot functions.
+
+Functions are registered with the instrumented decorator, which returns
+them unchanged, so they cost nothing extra while no collection is running.
+Entering collect() replaces every registered function, wherever a module
+of this package or a class defined in one holds a reference to it, with a
+wrapper that counts calls, adds up elapsed time and, if the function was
+registered with a rows function, the number of rows it scanned. Leaving
+the last open collect() block puts the original functions back.
+
+    with collect() as report:
+        assign_inspectors(bridges, inspectors, 10)
+    print(report.format())
+
+Times are cumulative: a function's time includes the time of the
+instrumented functions it calls. References kept elsewhere, e.g. in local
+variables or in modules outside this package, still call the original
+functions. A block only records the calls made in its own context (see
+contextvars): its thread, and asyncio tasks started inside it. Blocks can
+be open in several threads at once (such as the service's worker thread),
+and each sees only its own calls, though every thread runs the wrappers
+while any block is open.
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Iterator, NamedTuple, Optional, Union
+
+from bridge_table import BridgeTable
+
+# Rows scanned by a call, given its positional arguments and its result.
+RowCounter = Callable[[tuple, object], int]
+
+# (name, function, rows function) of every registered function.
+_registry = []
+
+# The reports of the collect() blocks currently running in any context.
+_reports = []
+
+# The reports of the collect() blocks running in the current context,
+# outermost first.
+_active = ContextVar('active_reports', default=())
+
+# (module namespace or class, attribute name, original function) of every
+# reference that is currently replaced by a wrapper.
+_patched = []
+
+# Held while _reports or _patched change, and while a call is recorded.
+_lock = threading.Lock()
+
+# The directory of this package's modules, the only modules whose
+# references to registered functions are replaced.
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class CallStats(NamedTuple):
+    """The number of calls to a function, their total time in seconds and
+    the total number of rows they scanned.
+    """
+    calls: int
+    seconds: float
+    rows: int
+
+
+class Report:
+    """Call statistics collected by one collect() block, by function name.
+
+    >>> report = Report()
+    >>> report.record('f', 0.5, 10)
+    >>> report.record('f', 0.25, 0)
+    >>> report.stats()
+    {'f': CallStats(calls=2, seconds=0.75, rows=10)}
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty report."""
+
+        self._stats = {}
+
+    def record(self, name: str, seconds: float, rows: int) -> None:
+        """Add one call to the function name, taking seconds and scanning
+        rows rows, to the report.
+        """
+
+        stats = self._stats.setdefault(name, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] += rows
+
+    def stats(self) -> dict[str, CallStats]:
+        """Return the statistics of every function called, by name."""
+
+        return {name: CallStats(*stats)
+                for name, stats in self._stats.items()}
+
+    def as_dict(self) -> dict[str, dict]:
+        """Return the statistics as a dictionary that can be saved as
+        JSON.
+
+        >>> report = Report()
+        >>> report.record('f', 0.5, 10)
+        >>> report.as_dict()
+        {'f': {'calls': 1, 'seconds': 0.5, 'rows': 10}}
+        """
+
+        return {name: stats._asdict()
+                for name, stats in self.stats().items()}
+
+    def format(self) -> str:
+        """Return the statistics as a table, slowest function first.
+
+        >>> report = Report()
+        >>> report.record('bridge_functions.get_bridge', 0.5, 10)
+        >>> print(report.format())  # doctest: +NORMALIZE_WHITESPACE
+        function                          calls    seconds       rows
+        bridge_functions.get_bridge           1     0.5000         10
+        """
+
+        lines = [f'{"function":44} {"calls":>9} {"seconds":>10} '
+                 f'{"rows":>10}']
+        for name, stats in sorted(self.stats().items(),
+                                  key=lambda item: -item[1].seconds):
+            lines.append(f'{name:44} {stats.calls:9} '
+                         f'{stats.seconds:10.4f} {stats.rows:10}')
+        return '\n'.join(lines)
+
+
+def instrumented(rows: Optional[RowCounter] = None) -> Callable:
+    """Return a decorator registering a function for instrumentation. If
+    rows is given, rows(args, result) is the number of rows a call with
+    positional arguments args returning result scanned.
+    """
+
+    def register(function: Callable) -> Callable:
+        name = f'{function.__module__}.{function.__qualname__}'
+        _registry.append((name, function, rows))
+        return function
+
+    return register
+
+
+def list_rows(args: tuple, result: object) -> int:
+    """Return the number of rows a full scan of the bridge data passed as
+    the first argument visits: none if it is a BridgeTable, which is not
+    scanned, and every record otherwise.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> list_rows((THREE_BRIDGES, 1), None)
+    3
+    >>> list_rows((BridgeTable(THREE_BRIDGES), 1), None)
+    0
+    """
+
+    return 0 if isinstance(args[0], BridgeTable) else len(args[0])
+
+
+def lookup_rows(args: tuple, result: int) -> int:
+    """Return the number of records a linear search of the bridge data
+    passed as the first argument visits to return the row result: the
+    records up to and including that row, or every record if result is -1.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> lookup_rows((THREE_BRIDGES, 2), 1)
+    2
+    >>> lookup_rows((THREE_BRIDGES, 42), -1)
+    3
+    """
+
+    if result == -1:
+        return len(args[0])
+    return result + 1
+
+
+def result_rows(args: tuple, result: object) -> int:
+    """Return the length of result, for functions whose result holds one
+    entry per row they scanned.
+    """
+
+    return len(result)
+
+
+def _wrapper(name: str, function: Callable,
+             rows: Optional[RowCounter]) -> Callable:
+    """Return a wrapper of function that records each of its calls under
+    name in every report running in the context of the call.
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        reports = _active.get()
+        if not reports:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        scanned = 0 if rows is None else rows(args, result)
+        with _lock:
+            for report in reports:
+                report.record(name, seconds, scanned)
+        return result
+
+    return wrapper
+
+
+def _holders() -> Iterator[Union[dict, type]]:
+    """Yield everything in this package that may hold a reference to a
+    registered function: the namespace of every loaded module of the
+    package and every class defined in one.
+    """
+
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if (path is None or os.path.dirname(os.path.abspath(path))
+                != _PACKAGE_DIR):
+            continue
+        namespace = module.__dict__
+        yield namespace
+        for value in list(namespace.values()):
+            if (isinstance(value, type)
+                    and value.__module__ == module.__name__):
+                yield value
+
+
+def _set(holder: Union[dict, type], attribute: str,
+         value: Callable) -> None:
+    """Set attribute of holder, a module namespace or a class, to value."""
+
+    if isinstance(holder, dict):
+        holder[attribute] = value
+    else:
+        setattr(holder, attribute, value)
+
+
+def _patch() -> None:
+    """Replace every reference to a registered function with its
+    wrapper.
+    """
+
+    wrappers = {id(function): (function, _wrapper(name, function, rows))
+                for name, function, rows in _registry}
+    for holder in _holders():
+        namespace = (holder if isinstance(holder, dict)
+                     else getattr(holder, '__dict__', {}))
+        for attribute, value in list(namespace.items()):
+            if id(value) in wrappers and wrappers[id(value)][0] is value:
+                _patched.append((holder, attribute, value))
+    for holder, attribute, function in _patched:
+        _set(holder, attribute, wrappers[id(function)][1])
+
+
+def _unpatch() -> None:
+    """Put every original function back where _patch replaced it."""
+
+    for holder, attribute, function in _patched:
+        _set(holder, attribute, function)
+    _patched.clear()
+
+
+@contextmanager
+def collect() -> Iterator[Report]:
+    """Collect statistics of the registered functions called inside the
+    with block into the report it yields. Only calls made in the context
+    the block runs in are collected, not those of other threads. Blocks
+    can be nested; the calls in an inner block are recorded in the reports
+    of the outer blocks too.
+
+    >>> import bridge_functions as bf
+    >>> with collect() as report:
+    ...     bf.get_bridges_in_radius(bf.THREE_BRIDGES, 43.10, -80.15, 50)
+    [1, 2]
+    >>> stats = report.stats()
+    >>> stats['bridge_functions.get_bridges_in_radius'].rows
+    3
+    >>> stats['bridge_functions.calculate_distance'].calls
+    3
+    >>> bf.get_bridges_in_radius(bf.THREE_BRIDGES, 43.10, -80.15, 50)
+    [1, 2]
+    >>> report.stats()['bridge_functions.calculate_distance'].calls
+    3
+    >>> with collect() as report:
+    ...     worker = threading.Thread(target=bf.get_bridge,
+    ...                               args=(bf.THREE_BRIDGES, 1))
+    ...     worker.start()
+    ...     worker.join()
+    >>> report.stats()
+    {}
+    """
+
+    report = Report()
+    with _lock:
+        if not _reports:
+            _patch()
+        _reports.append(report)
+    token = _active.set(_active.get() + (report,))
+    try:
+        yield report
+    finally:
+        _active.reset(token)
+        with _lock:
+            _reports.remove(report)
+            if not _reports:
+                _unpatch()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,179 @@
+"""The k-nearest-neighbour graph of all bridges in a BridgeTable.
+
+The graph is built once, with one grid index query per bridge, and stored
+as two flat arrays with k slots per table row: the neighbour ids, closest
+first, and their rounded distances. Following get_closest_bridge, a bridge
+is never its own neighbour and neither is any bridge at distance 0 from it.
+Unused slots hold id 0 and distance inf. Deleting bridges that are no
+bridge's neighbour only compacts the arrays.
+"""
+
+from array import array
+from math import inf, nan
+
+from bridge_table import BridgeTable, compact
+from haversine import bridge_distances_at
+from spatial_index import get_grid_index
+
+
+class KnnGraph:
+    """The k nearest neighbours of every bridge in a table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> graph = KnnGraph(BridgeTable(THREE_BRIDGES), 2)
+    >>> list(graph.neighbour_ids)
+    [2, 3, 1, 3, 1, 2]
+    >>> graph.neighbours(3)
+    [1, 2]
+    >>> graph.closest(2)
+    1
+    >>> graph.closest(42)
+    0
+    """
+
+    def __init__(self, table: BridgeTable, k: int = 1) -> None:
+        """Initialize the graph of the k nearest neighbours of every bridge in
+        table.
+        """
+
+        self.table = table
+        self.k = k
+        self.lats = array('d', table.lats)
+        self.lons = array('d', table.lons)
+        self.neighbour_ids = array('q', [0]) * (k * len(table))
+        self.distances = array('d', [inf]) * (k * len(table))
+        index = get_grid_index(table)
+        for row, (lat, lon) in enumerate(zip(table.lats, table.lons)):
+            if lat != lat or lon != lon:
+                continue
+            ids = index.nearest(lat, lon, k, True)
+            rows = [table.row_of(bridge_id) for bridge_id in ids]
+            start = row * k
+            self.neighbour_ids[start:start + len(ids)] = array('q', ids)
+            self.distances[start:start + len(ids)] = bridge_distances_at(
+                table, rows, lat, lon)
+
+    def neighbours(self, bridge_id: int) -> list[int]:
+        """Return the ids of the neighbours of the bridge with id bridge_id,
+        closest first, or [] if there is no such bridge.
+        """
+
+        row = self.table.row_of(bridge_id)
+        if row == -1:
+            return []
+        start = row * self.k
+        return [neighbour for neighbour
+                in self.neighbour_ids[start:start + self.k] if neighbour != 0]
+
+    def closest(self, bridge_id: int) -> int:
+        """Return the id of the bridge closest to the bridge with id
+        bridge_id, as get_closest_bridge would, or 0 if there is none.
+        """
+
+        row = self.table.row_of(bridge_id)
+        if row == -1 or self.k == 0:
+            return 0
+        return self.neighbour_ids[row * self.k]
+
+    def watch(self, row: int) -> None:
+        """Drop this graph from its table's derived structures if the bridge
+        at row of the table is new or has moved since the graph was built.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> graph = get_knn_graph(table)
+        >>> table.refresh_row(0)
+        >>> table.derived['knn'] is graph
+        True
+        >>> table[0][3] = 45.0
+        >>> table.refresh_row(0)
+        >>> 'knn' in table.derived
+        False
+        """
+
+        if row < len(self.lats) and (
+                _same(self.lats[row], self.table.lats[row])
+                and _same(self.lons[row], self.table.lons[row])):
+            return
+        self._drop()
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the neighbours of the bridges at the rows that renumbered
+        maps to -1 (see bridge_table.renumbering), or drop this graph from
+        its table's derived structures if any of them is the neighbour of a
+        bridge that stays.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> graph = get_knn_graph(table)
+        >>> table.delete_rows([2])
+        >>> table.derived['knn'] is graph, graph.closest(1)
+        (True, 2)
+        >>> table.delete_rows([1])
+        >>> 'knn' in table.derived
+        False
+        """
+
+        ids = self.table.ids
+        deleted = {ids[row] for row, new_row in enumerate(renumbered)
+                   if new_row == -1}
+        k = self.k
+        for row, new_row in enumerate(renumbered):
+            if new_row != -1 and not deleted.isdisjoint(
+                    self.neighbour_ids[row * k:row * k + k]):
+                self._drop()
+                return
+        compact(self.lats, renumbered)
+        compact(self.lons, renumbered)
+        slots = [new_row for new_row in renumbered for _ in range(k)]
+        compact(self.neighbour_ids, slots)
+        compact(self.distances, slots)
+
+    def _drop(self) -> None:
+        """Drop this graph from its table's derived structures and stop
+        following the table.
+        """
+
+        if self.table.derived.get('knn') is self:
+            del self.table.derived['knn']
+        self.table.listeners.remove(self.watch)
+        self.table.removers.remove(self.delete_rows)
+
+
+def _same(value1: float, value2: float) -> bool:
+    """Return whether value1 and value2 are equal or both nan.
+
+    >>> _same(1.0, 1.0), _same(nan, nan), _same(nan, 1.0)
+    (True, True, False)
+    """
+
+    return value1 == value2 or (value1 != value1 and value2 != value2)
+
+
+def get_knn_graph(table: BridgeTable, k: int = 1) -> KnnGraph:
+    """Return a k-nearest-neighbour graph of table with at least k neighbours
+    per bridge, building it on first use. Once built, get_closest_bridge on
+    table reads its answers from the graph, until a bridge is added to or
+    moved in table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_knn_graph(table, 2) is get_knn_graph(table, 1)
+    True
+    """
+
+    graph = table.derived.get('knn')
+    if graph is None or graph.k < k:
+        if graph is not None:
+            graph._drop()
+        graph = KnnGraph(table, k)
+        table.derived['knn'] = graph
+        table.listeners.append(graph.watch)
+        table.removers.append(graph.delete_rows)
+    return graph
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
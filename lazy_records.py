@@ -0,0 +1,302 @@
+"""Bridge records that are formatted field by field on first access.
+
+format_data formats every field of every record up front, even when the
+caller only needs one bridge or only the locations. A LazyRecord keeps the
+raw CSV line of its record as one string, splits it into fields the first
+time a field other than the id is read, and formats a field (with the same
+format_* function format_data uses) the first time it is read, keeping the
+result. Otherwise it reads like a formatted record: indexing, slicing,
+iterating, comparing with lists and assigning fields all work as they do on
+the list format_data would have built.
+
+The hot columns of a BridgeTable (location, length, number of spans and
+current BCI) can be decoded in bulk straight from the raw fields, without
+formatting the records, by lazy_table.
+"""
+
+import csv
+from array import array
+from itertools import count, islice
+from math import cos, nan, radians
+from typing import Iterator, TextIO, Union
+
+from bridge_functions import (
+    format_location, format_spans, format_bcis, format_length)
+from bridge_table import COLUMNS, BridgeTable, _as_float
+from constants import (
+    ID_INDEX, LAT_INDEX, LON_INDEX, NUM_SPANS_INDEX, SPAN_DETAILS_INDEX,
+    LENGTH_INDEX, BCIS_INDEX)
+
+# Number of header lines at the top of a bridge data CSV file.
+HEADER_LINES = 2
+
+# Number of fields of a formatted record.
+RECORD_LENGTH = BCIS_INDEX + 1
+
+
+class _Undecoded:
+    """The marker of a field of a LazyRecord that is not formatted yet. It
+    stays the same object when records are copied or pickled.
+    """
+
+    def __deepcopy__(self, memo: dict) -> '_Undecoded':
+        return self
+
+    def __reduce__(self) -> str:
+        return '_UNDECODED'
+
+    def __repr__(self) -> str:
+        return '_UNDECODED'
+
+
+_UNDECODED = _Undecoded()
+
+# The fields of a record of which nothing is decoded, but its id.
+_NOTHING_DECODED = [None] + [_UNDECODED] * (RECORD_LENGTH - 1)
+
+
+def split_line(line: str) -> list[str]:
+    """Return the fields of the CSV line line. Lines without quotes, which
+    are most of them, are split directly rather than by the csv module.
+
+    >>> split_line('1 -  32/,A,403\\r\\n')
+    ['1 -  32/', 'A', '403']
+    >>> split_line('1 -  43/,"B, C",403\\r\\n')
+    ['1 -  43/', 'B, C', '403']
+    """
+
+    if '"' in line:
+        return next(csv.reader([line]))
+    return line.rstrip('\r\n').split(',')
+
+
+class LazyRecord:
+    """A bridge record over its raw CSV line, with each field formatted as
+    format_data would format it the first time it is read.
+
+    >>> raw = ['1 -  32/', 'Highway 24 Underpass at Highway 403', '403',
+    ...        '43.167233', '-80.275567', '1965', '2014', '2009', '4',
+    ...        'Total=64  (1)=12;(2)=19;(3)=21;(4)=12;', '65', '04/13/2012',
+    ...        '72.3', '', '72.3', '', '69.5', '', '70', '', '70.3', '',
+    ...        '70.5', '', '70.7', '72.9', '']
+    >>> record = LazyRecord(1, raw)
+    >>> record[LAT_INDEX], record[-1][:2]
+    (43.167233, [72.3, 72.3])
+    >>> record.decoded()
+    [0, 3, 4, 12]
+    >>> record == [1, 'Highway 24 Underpass at Highway 403', '403',
+    ...            43.167233, -80.275567, '1965', '2014', '2009', 4,
+    ...            [12.0, 19.0, 21.0, 12.0], 65.0, '04/13/2012',
+    ...            [72.3, 72.3, 69.5, 70.0, 70.3, 70.5, 70.7, 72.9]]
+    True
+    """
+
+    __slots__ = ('_id', '_raw', '_fields')
+
+    def __init__(self, bridge_id: int, raw: Union[str, list[str]]) -> None:
+        """Initialize a record with id bridge_id over raw, the CSV line of
+        the record or its fields.
+        """
+
+        self._id = bridge_id
+        self._raw = raw
+        self._fields = None
+
+    def decoded(self) -> list[int]:
+        """Return the indexes of the fields formatted so far."""
+
+        if self._fields is None:
+            return [ID_INDEX]
+        return [index for index, value in enumerate(self._fields)
+                if value is not _UNDECODED]
+
+    def raw_fields(self) -> list[str]:
+        """Return the raw fields of the record, as read from its CSV line.
+        """
+
+        if isinstance(self._raw, str):
+            self._raw = split_line(self._raw)
+        return self._raw
+
+    def _decode(self, index: int) -> None:
+        """Format the field at index, and any field formatted together
+        with it, from the raw fields.
+        """
+
+        scratch = list(self.raw_fields())
+        if index in (LAT_INDEX, LON_INDEX):
+            format_location(scratch)
+            formatted = (LAT_INDEX, LON_INDEX)
+        elif index == NUM_SPANS_INDEX:
+            scratch[index] = int(scratch[index])
+            formatted = (index,)
+        elif index == SPAN_DETAILS_INDEX:
+            format_spans(scratch)
+            formatted = (index,)
+        elif index == LENGTH_INDEX:
+            format_length(scratch)
+            formatted = (index,)
+        elif index == BCIS_INDEX:
+            format_bcis(scratch)
+            formatted = (index,)
+        else:
+            formatted = (index,)
+        for field in formatted:
+            if self._fields[field] is _UNDECODED:
+                self._fields[field] = scratch[field]
+
+    def _field_list(self) -> list:
+        """Return the list of fields, creating it on first use."""
+
+        if self._fields is None:
+            self._fields = ([self._id]
+                            + [_UNDECODED] * (RECORD_LENGTH - 1))
+        return self._fields
+
+    def hot_fields(self) -> tuple[float, float, float, int, float]:
+        """Return the latitude, longitude, length, number of spans and
+        current BCI of the record as a BridgeTable stores them, decoding the
+        fields that are not formatted yet straight from the raw fields,
+        without formatting them.
+        """
+
+        fields = self._fields or _NOTHING_DECODED
+        raw = self._raw
+        if isinstance(raw, str):
+            raw = split_line(raw)
+        if (fields[LAT_INDEX] is _UNDECODED
+                and fields[LON_INDEX] is _UNDECODED):
+            if raw[LAT_INDEX] != '' and raw[LON_INDEX] != '':
+                lat, lon = float(raw[LAT_INDEX]), float(raw[LON_INDEX])
+            else:
+                lat = lon = nan
+        else:
+            lat, lon = _as_float(self[LAT_INDEX]), _as_float(self[LON_INDEX])
+        if fields[LENGTH_INDEX] is _UNDECODED:
+            length = _raw_float(raw[LENGTH_INDEX])
+        else:
+            length = _as_float(fields[LENGTH_INDEX])
+        if fields[BCIS_INDEX] is _UNDECODED:
+            bci = next((float(bci) for bci in raw[BCIS_INDEX:] if bci != ''),
+                       nan)
+        else:
+            bci = fields[BCIS_INDEX][0] if fields[BCIS_INDEX] else nan
+        if fields[NUM_SPANS_INDEX] is _UNDECODED:
+            num_spans = int(raw[NUM_SPANS_INDEX])
+        else:
+            num_spans = fields[NUM_SPANS_INDEX]
+        return lat, lon, length, num_spans, bci
+
+    def __getitem__(self, index: Union[int, slice]) -> object:
+        if index == ID_INDEX and self._fields is None:
+            return self._id
+        if isinstance(index, slice):
+            return [self[field]
+                    for field in range(*index.indices(RECORD_LENGTH))]
+        value = self._field_list()[index]
+        if value is _UNDECODED:
+            self._decode(index % RECORD_LENGTH)
+            value = self._fields[index]
+        return value
+
+    def __setitem__(self, index: int, value: object) -> None:
+        self._field_list()[index] = value
+
+    def __len__(self) -> int:
+        return RECORD_LENGTH
+
+    def __iter__(self) -> Iterator[object]:
+        return (self[index] for index in range(RECORD_LENGTH))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, LazyRecord)):
+            return len(other) == RECORD_LENGTH and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+def record_lines(csv_file: TextIO) -> Iterator[str]:
+    """Yield the CSV lines of the open CSV file csv_file, joining lines that
+    were split inside a quoted field back into one.
+
+    >>> from io import StringIO
+    >>> list(record_lines(StringIO('a,"b\\nc",d\\ne,f\\n')))
+    ['a,"b\\nc",d\\n', 'e,f\\n']
+    """
+
+    pending = ''
+    for line in csv_file:
+        pending += line
+        if pending.count('"') % 2 == 0:
+            yield pending
+            pending = ''
+    if pending:
+        yield pending
+
+
+def load_lazy(csv_file: TextIO) -> list[LazyRecord]:
+    """Return the records of the open CSV file csv_file as LazyRecords,
+    with ids starting at 1 as format_data numbers them. Nothing is split or
+    formatted until it is read.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    return list(map(LazyRecord, count(1),
+                    islice(record_lines(csv_file), HEADER_LINES, None)))
+
+
+def _raw_float(value: str) -> float:
+    """Return the raw field value as a float, or nan if it is empty.
+
+    >>> _raw_float('43.1'), _raw_float('')
+    (43.1, nan)
+    """
+
+    return float(value) if value != '' else nan
+
+
+def lazy_table(records: list[LazyRecord]) -> BridgeTable:
+    """Return a BridgeTable over records, with its columns decoded in bulk
+    from the raw fields of records that are not formatted yet. The records
+    themselves stay unformatted.
+
+    >>> from io import StringIO
+    >>> from bridge_functions import read_data, format_data
+    >>> text = (',,LOCATION\\nID,STRUCTURE\\n'
+    ...         '1 -  32/,A,403,43.1,-80.2,1965,2014,2009,1,Total=65  (1)=65;,'
+    ...         '65,04/13/2012,72.3,,69.5\\n'
+    ...         '1 -  43/,"B, C",403,43.2,-80.3,1963,2014,,1,Total=61  (1)=61;,'
+    ...         ',04/13/2012,,71.5\\n')
+    >>> records = load_lazy(StringIO(text))
+    >>> table = lazy_table(records)
+    >>> list(table.bcis), list(table.lengths)
+    ([72.3, 71.5], [65.0, nan])
+    >>> records[1].decoded()
+    [0]
+    >>> formatted = read_data(StringIO(text))
+    >>> format_data(formatted)
+    >>> list(table) == formatted
+    True
+    """
+
+    columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+    for record in records:
+        lat, lon, length, num_spans, bci = record.hot_fields()
+        columns['ids'].append(record[ID_INDEX])
+        columns['lats'].append(lat)
+        columns['lons'].append(lon)
+        columns['lat_radians'].append(radians(lat))
+        columns['lon_radians'].append(radians(lon))
+        columns['cos_lats'].append(cos(radians(lat)))
+        columns['lengths'].append(length)
+        columns['num_spans'].append(num_spans)
+        columns['bcis'].append(bci)
+    return BridgeTable.from_columns(records, columns)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,165 @@
+"""A trigram index over the lowercased structure names of a BridgeTable.
+
+Every name is lowercased once and each of its three-character substrings
+(trigrams) maps to the set of rows whose name contains it. A search for a
+substring of at least three characters only checks the rows whose names
+contain every trigram of the search, smallest posting set first; shorter
+searches scan the lowercased names, which still saves lowercasing every
+name on every call.
+"""
+
+from bridge_table import BridgeTable, compact
+from constants import NAME_INDEX
+from instrumentation import instrumented
+
+GRAM_LENGTH = 3
+
+
+def _grams(text: str) -> set[str]:
+    """Return the set of substrings of length GRAM_LENGTH of text.
+
+    >>> sorted(_grams('bridge'))
+    ['bri', 'dge', 'idg', 'rid']
+    >>> _grams('ab')
+    set()
+    """
+
+    return {text[start:start + GRAM_LENGTH]
+            for start in range(len(text) - GRAM_LENGTH + 1)}
+
+
+class NameIndex:
+    """A case-insensitive substring index over the names of the bridges in a
+    BridgeTable.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> index = NameIndex(BridgeTable(THREE_BRIDGES))
+    >>> index.search('underpass')
+    [1, 2]
+    >>> index.search('PASS')
+    [1, 2]
+    >>> index.search('st')
+    [2, 3]
+    >>> index.search('culvert')
+    []
+    """
+
+    def __init__(self, table: BridgeTable) -> None:
+        """Initialize an index over the names of the bridges in table."""
+
+        self.table = table
+        self.names = []
+        self.postings = {}
+        for row in range(len(table)):
+            self.update(row)
+
+    def update(self, row: int) -> None:
+        """Bring the index up to date with the name of the bridge at row of
+        the table, which may be new to the index.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> index = NameIndex(table)
+        >>> table[2][NAME_INDEX] = 'Stokes River Underpass'
+        >>> index.update(2)
+        >>> index.search('underpass')
+        [1, 2, 3]
+        """
+
+        name = self.table[row][NAME_INDEX].lower()
+        if row == len(self.names):
+            self.names.append(name)
+            old_grams = set()
+        elif self.names[row] == name:
+            return
+        else:
+            old_grams = _grams(self.names[row])
+            self.names[row] = name
+        new_grams = _grams(name)
+        for gram in old_grams - new_grams:
+            self.postings[gram].discard(row)
+        for gram in new_grams - old_grams:
+            self.postings.setdefault(gram, set()).add(row)
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the names of the bridges at the rows that renumbered maps to
+        -1 (see bridge_table.renumbering), and renumber the others.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> index = get_name_index(table)
+        >>> table.delete_rows([0])
+        >>> index.search_rows('underpass'), index.search('st')
+        ([0], [2, 3])
+        """
+
+        for gram, rows in list(self.postings.items()):
+            rows = set(map(renumbered.__getitem__, rows))
+            rows.discard(-1)
+            if rows:
+                self.postings[gram] = rows
+            else:
+                del self.postings[gram]
+        compact(self.names, renumbered)
+
+    def count_candidates(self, search: str) -> int:
+        """Return the size of the smallest posting set a search for search
+        would start from, an upper bound on the number of matches.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> index = NameIndex(BridgeTable(THREE_BRIDGES))
+        >>> index.count_candidates('Stokes'), index.count_candidates('st')
+        (1, 3)
+        """
+
+        grams = _grams(search.lower())
+        if not grams:
+            return len(self.names)
+        return min(len(self.postings.get(gram, ())) for gram in grams)
+
+    @instrumented()
+    def search_rows(self, search: str) -> list[int]:
+        """Return the rows, in table order, of the bridges whose names
+        contain search, ignoring case.
+        """
+
+        search = search.lower()
+        grams = _grams(search)
+        if not grams:
+            return [row for row, name in enumerate(self.names)
+                    if search in name]
+        postings = sorted((self.postings.get(gram, set())
+                           for gram in grams), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return sorted(row for row in candidates if search in self.names[row])
+
+    def search(self, search: str) -> list[int]:
+        """Return the ids of the bridges whose names contain search, ignoring
+        case, in the same order as get_bridges_containing.
+        """
+
+        ids = self.table.ids
+        return [ids[row] for row in self.search_rows(search)]
+
+
+def get_name_index(table: BridgeTable) -> NameIndex:
+    """Return the name index of table, building it on first use. The index
+    follows later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_name_index(table) is get_name_index(table)
+    True
+    """
+
+    if 'names' not in table.derived:
+        table.derived['names'] = NameIndex(table)
+        table.listeners.append(table.derived['names'].update)
+        table.removers.append(table.derived['names'].delete_rows)
+    return table.derived['names']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
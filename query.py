@@ -0,0 +1,348 @@
+"""Combined queries over a BridgeTable.
+
+A Query is a conjunction of predicates on location, current BCI, highway,
+name and last inspection date, e.g.
+
+    Query(table).on_highway('401').within(lat, lon, 50).bci_below(60)
+
+Each predicate estimates from its index (grid, BCI, highway, name or date)
+how many rows it could match. The most selective predicate is evaluated
+first through its index; every later predicate either checks the remaining
+rows one by one, or, if it matches fewer rows than remain, asks its index
+and looks each row it gets up in the remaining ones by binary search, so
+the cost follows the smaller of the two. Results are in table order, like
+the functions in bridge_functions.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from math import inf
+from typing import NamedTuple
+
+from bci_index import get_bci_index
+from bridge_table import BridgeTable
+from constants import HIGHWAY_INDEX
+from date_index import MISSING, checked_ordinal, get_date_index
+from haversine import bridge_distances_at
+from highway_stats import get_highway_aggregates
+from name_index import get_name_index
+from spatial_index import get_grid_index
+
+
+class QueryStep(NamedTuple):
+    """One step of an evaluated query: the predicate, the number of rows it
+    was estimated to match, how it was evaluated ('index', 'check' or
+    'intersect'), the number of rows it touched (the candidates its index
+    scanned, the rows it checked, or the rows its index gave that were
+    looked up) and the number left after it.
+    """
+    predicate: str
+    estimate: int
+    path: str
+    rows_touched: int
+    rows_left: int
+
+
+class _Predicate(ABC):
+    """A condition on the bridges of a table. Subclasses implement each
+    method for one kind of condition, and set scans_estimate if rows
+    checks each of the candidates estimate counts, rather than reading its
+    rows straight off an index.
+    """
+
+    scans_estimate = False
+
+    @abstractmethod
+    def estimate(self, table: BridgeTable) -> int:
+        """Return an upper bound, taken from an index, on the number of rows
+        of table matching this predicate.
+        """
+
+    @abstractmethod
+    def rows(self, table: BridgeTable) -> list[int]:
+        """Return the rows of table matching this predicate, in table order,
+        using an index.
+        """
+
+    @abstractmethod
+    def check(self, table: BridgeTable, rows: list[int]) -> list[int]:
+        """Return the rows among rows, which are in table order, matching
+        this predicate, by checking each of them.
+        """
+
+
+class _Within(_Predicate):
+    """Bridges within radius kilometers of (lat, lon)."""
+
+    scans_estimate = True
+
+    def __init__(self, lat: float, lon: float, radius: float) -> None:
+        self.lat, self.lon, self.radius = lat, lon, radius
+
+    def __str__(self) -> str:
+        return f'within {self.radius} km of ({self.lat}, {self.lon})'
+
+    def estimate(self, table: BridgeTable) -> int:
+        return get_grid_index(table).count_candidates(self.lat, self.lon,
+                                                      self.radius)
+
+    def rows(self, table: BridgeTable) -> list[int]:
+        return get_grid_index(table).rows_in_radius(self.lat, self.lon,
+                                                    self.radius)
+
+    def check(self, table: BridgeTable, rows: list[int]) -> list[int]:
+        distances = bridge_distances_at(table, rows, self.lat, self.lon)
+        return [row for row, distance in zip(rows, distances)
+                if distance <= self.radius]
+
+
+class _BciBand(_Predicate):
+    """Bridges whose current BCI is more than low and at most high."""
+
+    def __init__(self, low: float, high: float) -> None:
+        self.low, self.high = low, high
+
+    def __str__(self) -> str:
+        return f'{self.low} < BCI <= {self.high}'
+
+    def estimate(self, table: BridgeTable) -> int:
+        return get_bci_index(table).count_in_band(self.low, self.high)
+
+    def rows(self, table: BridgeTable) -> list[int]:
+        return get_bci_index(table).rows_in_band(self.low, self.high)
+
+    def check(self, table: BridgeTable, rows: list[int]) -> list[int]:
+        bcis = table.bcis
+        return [row for row in rows if self.low < bcis[row] <= self.high]
+
+
+class _OnHighway(_Predicate):
+    """Bridges on a highway."""
+
+    def __init__(self, highway: str) -> None:
+        self.highway = highway
+
+    def __str__(self) -> str:
+        return f'on highway {self.highway!r}'
+
+    def estimate(self, table: BridgeTable) -> int:
+        return get_highway_aggregates(table).stats(self.highway).bridge_count
+
+    def rows(self, table: BridgeTable) -> list[int]:
+        return get_highway_aggregates(table).rows_on(self.highway)
+
+    def check(self, table: BridgeTable, rows: list[int]) -> list[int]:
+        return [row for row in rows
+                if table[row][HIGHWAY_INDEX] == self.highway]
+
+
+class _NameContains(_Predicate):
+    """Bridges whose names contain a search string, ignoring case."""
+
+    scans_estimate = True
+
+    def __init__(self, search: str) -> None:
+        self.search = search
+
+    def __str__(self) -> str:
+        return f'name contains {self.search!r}'
+
+    def estimate(self, table: BridgeTable) -> int:
+        return get_name_index(table).count_candidates(self.search)
+
+    def rows(self, table: BridgeTable) -> list[int]:
+        return get_name_index(table).search_rows(self.search)
+
+    def check(self, table: BridgeTable, rows: list[int]) -> list[int]:
+        names = get_name_index(table).names
+        search = self.search.lower()
+        return [row for row in rows if search in names[row]]
+
+
+class _InspectedBetween(_Predicate):
+    """Bridges last inspected on an ordinal day from first_day to
+    last_day.
+    """
+
+    def __init__(self, first_day: float, last_day: float,
+                 description: str) -> None:
+        self.first_day, self.last_day = first_day, last_day
+        self.description = description
+
+    def __str__(self) -> str:
+        return self.description
+
+    def estimate(self, table: BridgeTable) -> int:
+        return get_date_index(table).count_inspected(self.first_day,
+                                                     self.last_day)
+
+    def rows(self, table: BridgeTable) -> list[int]:
+        return get_date_index(table).inspected_rows(self.first_day,
+                                                    self.last_day)
+
+    def check(self, table: BridgeTable, rows: list[int]) -> list[int]:
+        days = get_date_index(table).inspected_days
+        return [row for row in rows if days[row] != MISSING
+                and self.first_day <= days[row] <= self.last_day]
+
+
+def _contains(rows: list[int], row: int) -> bool:
+    """Return whether row is in rows, which are in table order.
+
+    >>> _contains([1, 4, 9], 4), _contains([1, 4, 9], 5)
+    (True, False)
+    """
+
+    position = bisect_left(rows, row)
+    return position < len(rows) and rows[position] == row
+
+
+class Query:
+    """A conjunction of predicates over the bridges in a BridgeTable. Each
+    predicate method returns a new query with that predicate added.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> query = Query(table).within(43.10, -80.15, 50).bci_below(72)
+    >>> query.ids()
+    [2]
+    >>> Query(table).on_highway('403').name_contains('underpass').ids()
+    [1, 2]
+    >>> Query(table).inspected_before('01/01/2013').bci_below(80).ids()
+    [1, 2]
+    >>> Query(table).ids()
+    [1, 2, 3]
+    """
+
+    def __init__(self, table: BridgeTable, predicates: tuple = ()) -> None:
+        """Initialize a query over table with the predicates in
+        predicates.
+        """
+
+        self.table = table
+        self.predicates = predicates
+
+    def _with(self, predicate: _Predicate) -> 'Query':
+        """Return a new query with predicate added to this one."""
+
+        return Query(self.table, self.predicates + (predicate,))
+
+    def within(self, lat: float, lon: float, radius: float) -> 'Query':
+        """Keep the bridges within radius kilometers of (lat, lon)."""
+
+        return self._with(_Within(lat, lon, radius))
+
+    def bci_between(self, low: float = -inf, high: float = inf) -> 'Query':
+        """Keep the bridges whose current BCI is more than low and at most
+        high.
+        """
+
+        return self._with(_BciBand(low, high))
+
+    def bci_below(self, limit: float) -> 'Query':
+        """Keep the bridges whose current BCI is at most limit, like
+        get_bridges_with_bci_below.
+        """
+
+        return self.bci_between(high=limit)
+
+    def on_highway(self, highway: str) -> 'Query':
+        """Keep the bridges on highway."""
+
+        return self._with(_OnHighway(highway))
+
+    def name_contains(self, search: str) -> 'Query':
+        """Keep the bridges whose names contain search, ignoring case."""
+
+        return self._with(_NameContains(search))
+
+    def inspected_between(self, start: str, end: str) -> 'Query':
+        """Keep the bridges last inspected on or after the MM/DD/YYYY date
+        start and on or before the date end. Raise ValueError if either is
+        not a valid date.
+        """
+
+        return self._with(_InspectedBetween(
+            checked_ordinal(start), checked_ordinal(end),
+            f'inspected from {start} to {end}'))
+
+    def inspected_before(self, date: str) -> 'Query':
+        """Keep the bridges last inspected before the MM/DD/YYYY date
+        date. Raise ValueError if date is not a valid date.
+        """
+
+        return self._with(_InspectedBetween(
+            -inf, checked_ordinal(date) - 1, f'inspected before {date}'))
+
+    def _run(self) -> tuple[list[int], list[QueryStep]]:
+        """Return the rows matching the query, in table order, and the steps
+        taken to find them.
+        """
+
+        if not self.predicates:
+            rows = list(range(len(self.table)))
+            return rows, [QueryStep('all bridges', len(rows), 'index',
+                                    len(rows), len(rows))]
+
+        estimates = [(predicate.estimate(self.table), position, predicate)
+                     for position, predicate in enumerate(self.predicates)]
+        estimates.sort(key=lambda item: item[:2])
+        steps = []
+        rows = None
+        for estimate, _, predicate in estimates:
+            if rows is None:
+                rows = predicate.rows(self.table)
+                touched = estimate if predicate.scans_estimate else len(rows)
+                steps.append(QueryStep(str(predicate), estimate, 'index',
+                                       touched, len(rows)))
+            elif len(rows) <= estimate:
+                touched = len(rows)
+                rows = predicate.check(self.table, rows)
+                steps.append(QueryStep(str(predicate), estimate, 'check',
+                                       touched, len(rows)))
+            else:
+                matches = predicate.rows(self.table)
+                touched = len(matches)
+                rows = [row for row in matches if _contains(rows, row)]
+                steps.append(QueryStep(str(predicate), estimate, 'intersect',
+                                       touched, len(rows)))
+        return rows, steps
+
+    def rows(self) -> list[int]:
+        """Return the table rows of the bridges matching the query, in table
+        order.
+        """
+
+        return self._run()[0]
+
+    def ids(self) -> list[int]:
+        """Return the ids of the bridges matching the query, in table
+        order.
+        """
+
+        ids = self.table.ids
+        return [ids[row] for row in self.rows()]
+
+    def explain(self) -> list[QueryStep]:
+        """Evaluate the query and return the steps taken, most selective
+        predicate first.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(THREE_BRIDGES)
+        >>> for step in (Query(table).bci_below(72)
+        ...              .within(43.10, -80.15, 50).explain()):
+        ...     print(step)
+        QueryStep(predicate='-inf < BCI <= 72', estimate=1, path='index', \
+rows_touched=1, rows_left=1)
+        QueryStep(predicate='within 50 km of (43.1, -80.15)', estimate=2, \
+path='check', rows_touched=1, rows_left=1)
+        >>> Query(table).within(43.10, -80.15, 11).explain()[0].rows_touched
+        2
+        """
+
+        return self._run()[1]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
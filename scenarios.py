@@ -0,0 +1,175 @@
+"""Running many inspector assignment scenarios in parallel.
+
+A scenario is one (inspectors, max_bridges) pair, as passed to
+assign_inspectors. The columns the assignment reads (ids, locations and
+current BCIs) are copied once into a shared memory block; every worker
+process of the pool attaches to that block when it starts and wraps the
+columns in a BridgeTable, so only the scenarios and their results are
+pickled between processes. Each result comes with a coverage summary of
+the assignment.
+"""
+
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import NamedTuple, Optional, Union
+
+from assignment import assign_from_table, tier_rows
+from bridge_table import COLUMNS, BridgeTable
+
+# A list of (latitude, longitude) inspector locations and the most bridges
+# each inspector may be assigned.
+Scenario = tuple[list[list[float]], int]
+
+# The table of the current worker process, over the shared columns.
+_worker_table = None
+
+# The shared memory block of the current worker process. It must stay open
+# as long as _worker_table uses it.
+_worker_memory = None
+
+
+class Coverage(NamedTuple):
+    """A summary of an assignment: the number of bridges assigned, the
+    number assigned in each priority tier (high, medium, low), and the
+    number of high priority bridges left unassigned.
+    """
+    assigned: int
+    tier_counts: tuple[int, ...]
+    unassigned_high: int
+
+
+class ScenarioResult(NamedTuple):
+    """The assignment of a scenario, as assign_inspectors returns it, and
+    its coverage.
+    """
+    assignments: list[list[int]]
+    coverage: Coverage
+
+
+def coverage(table: BridgeTable, assignments: list[list[int]]) -> Coverage:
+    """Return the coverage of assignments of bridges in table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> coverage(BridgeTable(THREE_BRIDGES), [[1, 2], [3]])
+    Coverage(assigned=3, tier_counts=(0, 0, 3), unassigned_high=0)
+    """
+
+    assigned = {bridge_id for inspector in assignments
+                for bridge_id in inspector}
+    ids = table.ids
+    tiers = tier_rows(table)
+    tier_counts = tuple(sum(ids[row] in assigned for row in rows)
+                        for rows in tiers)
+    return Coverage(len(assigned), tier_counts,
+                    len(tiers[0]) - tier_counts[0])
+
+
+def run_scenario(table: BridgeTable, scenario: Scenario) -> ScenarioResult:
+    """Return the assignment and coverage of scenario over table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> run_scenario(BridgeTable(THREE_BRIDGES), ([[43.10, -80.15]], 1))
+    ScenarioResult(assignments=[[1]], coverage=Coverage(assigned=1, \
+tier_counts=(0, 0, 1), unassigned_high=0))
+    """
+
+    inspectors, max_bridges = scenario
+    assignments = assign_from_table(table, inspectors, max_bridges)
+    return ScenarioResult(assignments, coverage(table, assignments))
+
+
+def _share_columns(table: BridgeTable) -> SharedMemory:
+    """Return a new shared memory block holding the columns of table one
+    after the other, in the order of COLUMNS.
+    """
+
+    size = len(table.ids) * sum(array(typecode).itemsize
+                                for typecode in COLUMNS.values())
+    memory = SharedMemory(create=True, size=max(size, 1))
+    offset = 0
+    for name in COLUMNS:
+        data = getattr(table, name).tobytes()
+        memory.buf[offset:offset + len(data)] = data
+        offset += len(data)
+    return memory
+
+
+def _attached_table(memory: SharedMemory, count: int) -> BridgeTable:
+    """Return a table of count bridges over the columns in the shared
+    memory block memory, laid out as _share_columns lays them out. Its
+    records hold only the bridge ids.
+    """
+
+    columns = {}
+    offset = 0
+    for name, typecode in COLUMNS.items():
+        size = count * array(typecode).itemsize
+        columns[name] = memory.buf[offset:offset + size].cast(typecode)
+        offset += size
+    records = [[bridge_id] for bridge_id in columns['ids']]
+    return BridgeTable.from_columns(records, columns)
+
+
+def _attach(name: str, count: int) -> None:
+    """Attach the current worker process to the shared memory block name,
+    which holds the columns of count bridges.
+    """
+
+    global _worker_table, _worker_memory
+    _worker_memory = SharedMemory(name)
+    _worker_table = _attached_table(_worker_memory, count)
+
+
+def _run_shared(scenario: Scenario) -> ScenarioResult:
+    """Return the assignment and coverage of scenario over the table of the
+    current worker process.
+    """
+
+    return run_scenario(_worker_table, scenario)
+
+
+def run_scenarios(bridge_data: Union[BridgeTable, list[list]],
+                  scenarios: list[Scenario],
+                  workers: Optional[int] = None) -> list[ScenarioResult]:
+    """Return the assignment and coverage of every scenario in scenarios
+    over the bridges in bridge_data, in the order of scenarios. Each
+    assignment equals what assign_inspectors returns for that scenario.
+
+    If workers is more than 1 (or None, for one per CPU), the scenarios run
+    in a pool of that many processes sharing the bridge columns.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> results = run_scenarios(THREE_BRIDGES, [
+    ...     ([[43.20, -80.35], [43.10, -80.15]], 1),
+    ...     ([[43.20, -80.35], [45.0368, -81.34]], 2)], workers=2)
+    >>> [result.assignments for result in results]
+    [[[1], [2]], [[1, 2], [3]]]
+    >>> results[1].coverage
+    Coverage(assigned=3, tier_counts=(0, 0, 3), unassigned_high=0)
+    """
+
+    table = bridge_data
+    if not isinstance(table, BridgeTable):
+        table = BridgeTable(bridge_data)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(scenarios) <= 1:
+        return [run_scenario(table, scenario) for scenario in scenarios]
+
+    memory = _share_columns(table)
+    try:
+        with ProcessPoolExecutor(workers, initializer=_attach,
+                                 initargs=(memory.name, len(table))) as pool:
+            chunk_size = max(1, len(scenarios) // (workers * 4))
+            return list(pool.map(_run_shared, scenarios,
+                                 chunksize=chunk_size))
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
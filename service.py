@@ -0,0 +1,468 @@
+"""A local JSON query service over bridge data kept in memory.
+
+The service loads and formats the bridge data once (through the snapshot
+cache) and answers queries over a localhost TCP socket, so scripts no
+longer re-read the CSV file for a handful of queries. Each request is one
+line of JSON and gets one line of JSON back, with the id it was sent with:
+
+    {"id": 1, "op": "get_bridges_in_radius",
+     "args": {"lat": 43.1, "lon": -80.15, "radius": 50}}
+    {"id": 1, "result": [1, 2]}
+
+The operations are named after the bridge_functions functions they call
+and take the same arguments by name; 'stats' returns the service counters
+and latency percentiles. Requests are queued and run in micro-batches: the
+first request of a batch waits BATCH_WINDOW seconds for others, and the
+batch then runs in the worker thread in one hop. Identical requests that
+are queued or running at the same time share one computation, and radius
+queries of one batch around the same point share one grid lookup and one
+distance computation at the largest of their radii (see
+GridIndex.in_radii). Radius queries around different points, however
+close, are each computed in full, as are all other operations.
+
+    python service.py bridge_data.csv --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from typing import Optional
+
+import bridge_functions as bf
+from bci_history import BciHistory
+from bci_index import get_bci_index
+from bridge_table import BridgeTable
+from lazy_records import LazyRecord
+from snapshot import load_bridges
+from spatial_index import get_grid_index
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Seconds the first request of a batch waits for more requests.
+BATCH_WINDOW = 0.002
+
+# Most requests run in one batch.
+BATCH_LIMIT = 256
+
+# Number of recent latencies kept for each operation.
+LATENCY_SAMPLES = 10000
+
+# The latency percentiles reported by the 'stats' operation.
+PERCENTILES = (50, 90, 99)
+
+
+def _bci_below(table: BridgeTable, args: dict) -> list[int]:
+    """Return the ids of the bridges with ids in args['bridge_ids'] (every
+    bridge, if it is not given) whose current BCI is at most
+    args['limit'].
+
+    >>> table = BridgeTable(bf.THREE_BRIDGES)
+    >>> _bci_below(table, {'limit': 72}), _bci_below(
+    ...     table, {'limit': 80, 'bridge_ids': [1, 3]})
+    ([2], [1])
+    """
+
+    if 'bridge_ids' in args:
+        return bf.get_bridges_with_bci_below(table, args['bridge_ids'],
+                                             args['limit'])
+    return get_bci_index(table).ids_below(args['limit'])
+
+
+# Each operation, by name, as a function of the table and the arguments of
+# a request.
+OPERATIONS = {
+    'get_bridge': lambda table, args: bf.get_bridge(
+        table, args['bridge_id']),
+    'get_bridges_in_radius': lambda table, args: bf.get_bridges_in_radius(
+        table, args['lat'], args['lon'], args['radius']),
+    'get_closest_bridge': lambda table, args: bf.get_closest_bridge(
+        table, args['bridge_id']),
+    'get_bridges_containing': lambda table, args: bf.get_bridges_containing(
+        table, args['search']),
+    'get_bridges_with_bci_below': _bci_below,
+    'assign_inspectors': lambda table, args: bf.assign_inspectors(
+        table, args['inspectors'], args['max_bridges'],
+        args.get('mode', 'greedy'), args.get('year'))
+}
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    """Return the nearest-rank percent percentile of the sorted list
+    samples, which is not empty.
+
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 50)
+    2.0
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 99)
+    4.0
+    """
+
+    return samples[max(ceil(percent / 100 * len(samples)), 1) - 1]
+
+
+class LatencyLog:
+    """The most recent latencies, in seconds, of each operation.
+
+    >>> log = LatencyLog()
+    >>> for seconds in [0.001, 0.002, 0.003, 0.004]:
+    ...     log.record('get_bridge', seconds)
+    >>> log.summary()
+    {'get_bridge': {'count': 4, 'p50_ms': 2.0, 'p90_ms': 4.0, 'p99_ms': 4.0}}
+    """
+
+    def __init__(self, size: int = LATENCY_SAMPLES) -> None:
+        """Initialize an empty log keeping size latencies per operation."""
+
+        self.size = size
+        self._samples = {}
+        self._counts = {}
+
+    def record(self, op: str, seconds: float) -> None:
+        """Record a request for op that took seconds."""
+
+        self._samples.setdefault(op, deque(maxlen=self.size)).append(seconds)
+        self._counts[op] = self._counts.get(op, 0) + 1
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Return, by operation, the number of requests and the
+        PERCENTILES of the recent latencies in milliseconds.
+        """
+
+        output = {}
+        for op, samples in self._samples.items():
+            ordered = sorted(samples)
+            output[op] = {'count': self._counts[op]}
+            for percent in PERCENTILES:
+                output[op][f'p{percent}_ms'] = round(
+                    percentile(ordered, percent) * 1000, 3)
+        return output
+
+
+def _json_default(value: object) -> object:
+    """Return value, which json cannot encode, as something it can."""
+
+    if isinstance(value, (BciHistory, LazyRecord)):
+        return list(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode(message: dict) -> bytes:
+    """Return message as one line of JSON.
+
+    >>> encode({'id': 1, 'result': [1, 'A', BciHistory([72.3, 69.5])]})
+    b'{"id": 1, "result": [1, "A", [72.3, 69.5]]}\\n'
+    """
+
+    return json.dumps(message, default=_json_default).encode() + b'\n'
+
+
+class BridgeService:
+    """Queries over a resident BridgeTable, coalesced and run in
+    micro-batches. start must be called from a running event loop before
+    call.
+
+    >>> async def demo():
+    ...     service = BridgeService(BridgeTable(bf.THREE_BRIDGES))
+    ...     service.start()
+    ...     results = await asyncio.gather(
+    ...         service.call('get_closest_bridge', {'bridge_id': 1}),
+    ...         service.call('get_closest_bridge', {'bridge_id': 1}),
+    ...         service.call('get_bridges_with_bci_below', {'limit': 72}),
+    ...         service.call('get_bridges_in_radius',
+    ...                      {'lat': 43.10, 'lon': -80.15, 'radius': 50}),
+    ...         service.call('get_bridges_in_radius',
+    ...                      {'lat': 43.10, 'lon': -80.15, 'radius': 11}))
+    ...     await service.close()
+    ...     return results, service.batches, service.coalesced, service.shared
+    >>> asyncio.run(demo())
+    ([2, 2, [2], [1, 2], [2]], 1, 1, 1)
+    """
+
+    def __init__(self, table: BridgeTable, batch_window: float = BATCH_WINDOW,
+                 batch_limit: int = BATCH_LIMIT) -> None:
+        """Initialize a service answering queries over table."""
+
+        self.table = table
+        self.batch_window = batch_window
+        self.batch_limit = batch_limit
+        self.latencies = LatencyLog()
+        self.batches = 0
+        self.coalesced = 0
+        self.shared = 0
+        self._queue = []
+        self._pending = {}
+        self._wakeup = None
+        self._batch_task = None
+        # One thread runs every batch, so the table and its lazily built
+        # indexes are only ever used by one query at a time.
+        self._executor = ThreadPoolExecutor(1)
+
+    def start(self) -> None:
+        """Start running batches in the current event loop."""
+
+        self._wakeup = asyncio.Event()
+        self._batch_task = asyncio.get_running_loop().create_task(
+            self._run_batches())
+
+    async def close(self) -> None:
+        """Stop running batches and release the worker thread."""
+
+        self._batch_task.cancel()
+        try:
+            await self._batch_task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown()
+
+    def stats(self) -> dict:
+        """Return the number of batches run, of requests coalesced with an
+        identical one, of radius queries answered from another's lookup,
+        and the latency percentiles of each operation.
+        """
+
+        return {'bridges': len(self.table), 'batches': self.batches,
+                'coalesced': self.coalesced, 'shared': self.shared,
+                'latency': self.latencies.summary()}
+
+    async def call(self, op: str, args: dict) -> object:
+        """Return the result of the operation op with the arguments args.
+        Raise ValueError if there is no operation op, and whatever the
+        operation raises, e.g. KeyError if args lacks an argument.
+        """
+
+        if op == 'stats':
+            return self.stats()
+        if op not in OPERATIONS:
+            raise ValueError(f'unknown operation {op!r}')
+        start = time.perf_counter()
+        try:
+            key = (op, json.dumps(args, sort_keys=True))
+            future = self._pending.get(key)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self._pending[key] = future
+                self._queue.append((key, op, args))
+                self._wakeup.set()
+            else:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+        finally:
+            self.latencies.record(op, time.perf_counter() - start)
+
+    def _run(self, op: str, args: dict) -> tuple[bool, object]:
+        """Return whether the operation op with the arguments args succeeded,
+        and its result or exception.
+        """
+
+        try:
+            return True, OPERATIONS[op](self.table, args)
+        except Exception as error:
+            # Sent back to the caller; one bad request must not stop the
+            # batches.
+            return False, error
+
+    def _run_batch(self, batch: list[tuple]) -> list[tuple[bool, object]]:
+        """Return, for each (key, op, args) request in batch, whether it
+        succeeded and its result or exception. Radius queries around the
+        same point are answered together.
+        """
+
+        outcomes = [None] * len(batch)
+        circles = {}
+        for position, (_, op, args) in enumerate(batch):
+            if op == 'get_bridges_in_radius' and all(
+                    isinstance(args.get(name), (int, float))
+                    for name in ('lat', 'lon', 'radius')):
+                circles.setdefault((args['lat'], args['lon']),
+                                   []).append(position)
+            else:
+                outcomes[position] = self._run(op, args)
+        for (lat, lon), positions in circles.items():
+            if len(positions) > 1:
+                succeeded, value = self._run_circles(
+                    lat, lon, [batch[position][2]['radius']
+                               for position in positions])
+                if succeeded:
+                    self.shared += len(positions) - 1
+                    for position, ids in zip(positions, value):
+                        outcomes[position] = (True, ids)
+                    continue
+            for position in positions:
+                outcomes[position] = self._run(*batch[position][1:])
+        return outcomes
+
+    def _run_circles(self, lat: float, lon: float,
+                     radii: list[float]) -> tuple[bool, object]:
+        """Return whether the radius queries around (lat, lon) with the
+        radii radii could be answered together, and the ids for each.
+        """
+
+        try:
+            return True, get_grid_index(self.table).in_radii(lat, lon, radii)
+        except Exception as error:
+            # Each query is run on its own instead, to get its own error.
+            return False, error
+
+    async def _run_batches(self) -> None:
+        """Run the queued requests in batches, forever."""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.batch_window)
+            batch = self._queue[:self.batch_limit]
+            del self._queue[:self.batch_limit]
+            if not self._queue:
+                self._wakeup.clear()
+            self.batches += 1
+            outcomes = await loop.run_in_executor(self._executor,
+                                                  self._run_batch, batch)
+            for (key, _, _), (succeeded, value) in zip(batch, outcomes):
+                future = self._pending.pop(key)
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    async def _answer(self, line: bytes, writer: asyncio.StreamWriter
+                      ) -> None:
+        """Answer the request line, a line of JSON, on writer."""
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            result = await self.call(request['op'], request.get('args', {}))
+            message = {'id': request_id, 'result': result}
+        except Exception as error:
+            message = {'id': request_id,
+                       'error': f'{type(error).__name__}: {error}'}
+        writer.write(encode(message))
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of one connection until it closes. Requests
+        sent without waiting for an answer are answered as they complete.
+        """
+
+        answers = set()
+        try:
+            while line := await reader.readline():
+                answer = asyncio.create_task(self._answer(line, writer))
+                answers.add(answer)
+                answer.add_done_callback(answers.discard)
+            if answers:
+                await asyncio.wait(answers)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(table: BridgeTable, host: str = DEFAULT_HOST,
+                port: int = DEFAULT_PORT) -> tuple[BridgeService,
+                                                   asyncio.Server]:
+    """Start answering queries over table on host and port, and return the
+    service and its server. Port 0 picks a free port.
+
+    >>> async def demo():
+    ...     service, server = await serve(BridgeTable(bf.THREE_BRIDGES),
+    ...                                   port=0)
+    ...     port = server.sockets[0].getsockname()[1]
+    ...     result = await request('get_bridges_in_radius',
+    ...                            {'lat': 43.10, 'lon': -80.15,
+    ...                             'radius': 50}, port=port)
+    ...     server.close()
+    ...     await server.wait_closed()
+    ...     await service.close()
+    ...     return result
+    >>> asyncio.run(demo())
+    [1, 2]
+    """
+
+    service = BridgeService(table)
+    service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    return service, server
+
+
+def _result(reply: dict) -> object:
+    """Return the result of reply, a decoded answer of the service, or
+    raise ValueError with its error.
+    """
+
+    if 'error' in reply:
+        raise ValueError(reply['error'])
+    return reply['result']
+
+
+async def request(op: str, args: Optional[dict] = None,
+                  host: str = DEFAULT_HOST,
+                  port: int = DEFAULT_PORT) -> object:
+    """Return the result of the operation op with the arguments args from
+    the service on host and port. Raise ValueError if it answers with an
+    error.
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(encode({'id': 0, 'op': op, 'args': args or {}}))
+        await writer.drain()
+        return _result(json.loads(await reader.readline()))
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def query(op: str, args: Optional[dict] = None, host: str = DEFAULT_HOST,
+          port: int = DEFAULT_PORT) -> object:
+    """Return what request returns, without an event loop, for scripts.
+
+    Docstring examples not given since the function needs a running
+    service.
+    """
+
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(encode({'id': 0, 'op': op, 'args': args or {}}))
+        with connection.makefile('rb') as replies:
+            return _result(json.loads(replies.readline()))
+
+
+async def _serve_forever(csv_path: str, host: str, port: int) -> None:
+    """Load the bridges in the CSV file at csv_path and answer queries over
+    them on host and port until cancelled.
+    """
+
+    service, server = await serve(load_bridges(csv_path), host, port)
+    print(f'serving {len(service.table)} bridges on {host}:{port}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """Run the service as described by the command line arguments until
+    interrupted.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv_path', nargs='?', default='bridge_data.csv')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    options = parser.parse_args(arguments)
+    try:
+        asyncio.run(_serve_forever(options.csv_path, options.host,
+                                   options.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,278 @@
+"""A binary snapshot cache of formatted bridge data.
+
+A snapshot file holds every column of a BridgeTable, the span lengths and
+BCI histories as ragged arrays, and the text fields as indices into a
+string table, each as a raw, 8-byte aligned array. It starts with the
+SHA-256 digest of the CSV file it was built from, so a snapshot is only
+used while the CSV file is unchanged.
+
+Opening a snapshot memory-maps it and reads its columns as memoryviews
+without parsing anything. load_bridges is the entry point: it opens a
+matching snapshot if there is one, and otherwise reads the CSV file and
+writes a new snapshot for the next run.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from math import nan
+from typing import Optional
+
+from bci_history import compact_histories
+from bridge_io import load_table
+from bridge_table import BridgeTable, COLUMNS
+from constants import (
+    ID_INDEX, NAME_INDEX, HIGHWAY_INDEX, LAT_INDEX, LON_INDEX, YEAR_INDEX,
+    LAST_MAJOR_INDEX, LAST_MINOR_INDEX, NUM_SPANS_INDEX, SPAN_DETAILS_INDEX,
+    LENGTH_INDEX, LAST_INSPECTED_INDEX, BCIS_INDEX)
+
+MAGIC = b'BRIDGES1'
+SNAPSHOT_SUFFIX = '.snapshot'
+
+# Header: magic, CSV digest, number of bridges, number of sections.
+HEADER = struct.Struct('<8s32sqq')
+# One entry per section: name, typecode, byte offset, number of items.
+SECTION = struct.Struct('<24s8sqq')
+
+# The text fields of a record, each stored as indices into the string table.
+STRING_FIELDS = {
+    'names': NAME_INDEX, 'highways': HIGHWAY_INDEX, 'years': YEAR_INDEX,
+    'last_majors': LAST_MAJOR_INDEX, 'last_minors': LAST_MINOR_INDEX,
+    'last_inspected': LAST_INSPECTED_INDEX
+}
+
+
+def csv_digest(csv_path: str) -> bytes:
+    """Return the SHA-256 digest of the contents of the file at csv_path."""
+
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def _ragged(lists: list[list[float]]) -> tuple[array, array]:
+    """Return the values and offsets arrays of the ragged array lists.
+
+    >>> values, offsets = _ragged([[12.0, 19.0], [], [16.0]])
+    >>> list(values), list(offsets)
+    ([12.0, 19.0, 16.0], [0, 2, 2, 3])
+    """
+
+    values = array('d')
+    offsets = array('q', [0])
+    for floats in lists:
+        values.extend(floats)
+        offsets.append(len(values))
+    return values, offsets
+
+
+def write_snapshot(table: BridgeTable, snapshot_path: str,
+                   digest: bytes) -> None:
+    """Write a snapshot of table, built from a CSV file with SHA-256 digest
+    digest, to snapshot_path. The file is written under a unique temporary
+    name in the same directory and then renamed, so it is replaced
+    atomically and concurrent writers do not clobber each other.
+    """
+
+    sections = {name: getattr(table, name) for name in COLUMNS}
+    sections['span_values'], sections['span_offsets'] = _ragged(
+        [bridge[SPAN_DETAILS_INDEX] for bridge in table])
+    sections['bci_values'], sections['bci_offsets'] = _ragged(
+        [bridge[BCIS_INDEX] for bridge in table])
+
+    strings = {}
+    for name, index in STRING_FIELDS.items():
+        sections[name] = array('q', [
+            strings.setdefault(bridge[index], len(strings))
+            for bridge in table])
+    encoded = [string.encode('utf-8') for string in strings]
+    sections['string_offsets'] = array('q', [0])
+    for string in encoded:
+        sections['string_offsets'].append(
+            sections['string_offsets'][-1] + len(string))
+    sections['strings'] = array('B', b''.join(encoded))
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    for name, values in sections.items():
+        offset += -offset % 8
+        directory.append(SECTION.pack(name.encode(), values.typecode.encode(),
+                                      offset, len(values)))
+        offset += len(values) * values.itemsize
+
+    directory_path = os.path.dirname(os.path.abspath(snapshot_path))
+    handle, temporary_path = tempfile.mkstemp(
+        prefix=os.path.basename(snapshot_path) + '.', suffix='.tmp',
+        dir=directory_path)
+    try:
+        with os.fdopen(handle, 'wb') as snapshot_file:
+            snapshot_file.write(HEADER.pack(MAGIC, digest, len(table),
+                                            len(sections)))
+            snapshot_file.write(b''.join(directory))
+            for values in sections.values():
+                snapshot_file.write(b'\0' * (-snapshot_file.tell() % 8))
+                snapshot_file.write(values.tobytes())
+        os.replace(temporary_path, snapshot_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+class Snapshot:
+    """A memory-mapped snapshot file of formatted bridge data."""
+
+    def __init__(self, snapshot_path: str) -> None:
+        """Open and memory-map the snapshot file at snapshot_path. Raise
+        ValueError if it is not a snapshot file.
+        """
+
+        with open(snapshot_path, 'rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f'{snapshot_path} is not a snapshot file')
+        magic, self.digest, self.count, sections = HEADER.unpack_from(
+            self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{snapshot_path} is not a snapshot file')
+        self._sections = {}
+        for section in range(sections):
+            name, typecode, offset, length = SECTION.unpack_from(
+                self._map, HEADER.size + section * SECTION.size)
+            self._sections[name.rstrip(b'\0').decode()] = (
+                typecode.rstrip(b'\0').decode(), offset, length)
+
+    def _raw(self, name: str) -> memoryview:
+        """Return the bytes of the section called name."""
+
+        typecode, offset, length = self._sections[name]
+        size = array(typecode).itemsize
+        return self._view[offset:offset + length * size]
+
+    def column(self, name: str) -> memoryview:
+        """Return the section called name as a memoryview of its typed
+        values, backed directly by the mapped file.
+        """
+
+        return self._raw(name).cast(self._sections[name][0])
+
+    def strings(self) -> list[str]:
+        """Return the string table."""
+
+        offsets = self.column('string_offsets')
+        blob = bytes(self._raw('strings'))
+        return [blob[start:end].decode('utf-8')
+                for start, end in zip(offsets, offsets[1:])]
+
+    def records(self) -> list[list]:
+        """Return the formatted bridge records stored in the snapshot."""
+
+        strings = self.strings()
+        text = {name: [strings[index] for index in self.column(name)]
+                for name in STRING_FIELDS}
+        span_values = self.column('span_values').tolist()
+        span_offsets = self.column('span_offsets')
+        bci_values = self.column('bci_values').tolist()
+        bci_offsets = self.column('bci_offsets')
+
+        records = []
+        for row, (bridge_id, lat, lon, num_spans, length) in enumerate(zip(
+                self.column('ids'), self.column('lats'), self.column('lons'),
+                self.column('num_spans'), self.column('lengths'))):
+            bridge = [None] * (BCIS_INDEX + 1)
+            bridge[ID_INDEX] = bridge_id
+            bridge[LAT_INDEX] = _unformatted(lat)
+            bridge[LON_INDEX] = _unformatted(lon)
+            bridge[NUM_SPANS_INDEX] = num_spans
+            bridge[SPAN_DETAILS_INDEX] = span_values[span_offsets[row]:
+                                                     span_offsets[row + 1]]
+            bridge[LENGTH_INDEX] = _unformatted(length)
+            bridge[BCIS_INDEX] = bci_values[bci_offsets[row]:
+                                            bci_offsets[row + 1]]
+            for name, index in STRING_FIELDS.items():
+                bridge[index] = text[name][row]
+            records.append(bridge)
+        return records
+
+    def to_table(self) -> BridgeTable:
+        """Return a BridgeTable of the records stored in the snapshot, with
+        their BCIs in BciHistory objects. Its columns are copied straight
+        from the mapped file.
+        """
+
+        columns = {}
+        for name, typecode in COLUMNS.items():
+            columns[name] = array(typecode)
+            columns[name].frombytes(self._raw(name))
+        table = BridgeTable.from_columns(self.records(), columns)
+        compact_histories(table)
+        return table
+
+
+def _unformatted(value: float) -> object:
+    """Return value, or '' if value is nan, undoing the nan that BridgeTable
+    stores for fields the CSV file left empty.
+
+    >>> _unformatted(18.4), _unformatted(nan)
+    (18.4, '')
+    """
+
+    if value != value:
+        return ''
+    return value
+
+
+def open_snapshot(snapshot_path: str, digest: bytes) -> Optional[Snapshot]:
+    """Return the snapshot at snapshot_path if it exists and was built from
+    a CSV file with SHA-256 digest digest, and None otherwise.
+    """
+
+    try:
+        snapshot = Snapshot(snapshot_path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if snapshot.digest != digest:
+        return None
+    return snapshot
+
+
+def load_bridges(csv_path: str, snapshot_path: Optional[str] = None,
+                 errors: Optional[list[tuple[int, str]]] = None
+                 ) -> BridgeTable:
+    """Return a BridgeTable of the bridges in the CSV file at csv_path.
+
+    The table is read from the snapshot at snapshot_path (by default,
+    csv_path followed by SNAPSHOT_SUFFIX) if it matches the current contents
+    of the CSV file. Otherwise the CSV file is read and formatted by
+    load_table, which reports malformed records to errors, and the snapshot
+    is rewritten. Writing the snapshot is best effort: if it fails (say,
+    the directory is read-only), the table is still returned.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    if snapshot_path is None:
+        snapshot_path = csv_path + SNAPSHOT_SUFFIX
+    digest = csv_digest(csv_path)
+    snapshot = open_snapshot(snapshot_path, digest)
+    if snapshot is not None:
+        return snapshot.to_table()
+
+    with open(csv_path, encoding='utf-8') as csv_file:
+        table = load_table(csv_file, errors=errors)
+    try:
+        write_snapshot(table, snapshot_path, digest)
+    except OSError:
+        pass
+    return table
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,128 @@
+"""A sorted index from the rows of a table to one comparable value each.
+
+The index keeps (value, row) pairs in sorted order, so the rows whose
+values fall in a range are found with two binary searches, and a row's
+value is changed with a binary search and a list insertion. A whole column
+is indexed at once with from_values, which sorts the pairs in one go.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from math import inf
+from typing import Iterable, Optional
+
+from instrumentation import instrumented, result_rows
+
+
+class SortedIndex:
+    """Rows kept sorted by a value, answering range queries with bisect.
+
+    >>> index = SortedIndex()
+    >>> for row, value in enumerate([72.3, 55.0, 60.0, None, 85.1]):
+    ...     index.set(row, value)
+    >>> index.rows_between(high=60)
+    [1, 2]
+    >>> index.rows_between(60, 100, include_low=False)
+    [0, 4]
+    >>> index.set(0, 40.0)
+    >>> index.rows_between(high=60), index.count_between(high=60)
+    ([0, 1, 2], 3)
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty index."""
+
+        self._pairs = []
+        self._values = {}
+
+    @classmethod
+    def from_values(cls, values: Iterable[Optional[float]]) -> 'SortedIndex':
+        """Return an index of rows 0, 1, 2, ... under the values in values,
+        in order. Rows whose value is None are not indexed.
+
+        >>> index = SortedIndex.from_values([72.3, 55.0, 60.0, None, 85.1])
+        >>> index.rows_between(high=60), len(index)
+        ([1, 2], 4)
+        """
+
+        index = cls()
+        index._values = {row: value for row, value in enumerate(values)
+                         if value is not None}
+        index._pairs = sorted((value, row)
+                              for row, value in index._values.items())
+        return index
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def set(self, row: int, value: Optional[float]) -> None:
+        """Index row under value, replacing its previous value. If value is
+        None, row is not indexed.
+        """
+
+        old_value = self._values.get(row)
+        if old_value == value:
+            return
+        if old_value is not None:
+            del self._pairs[bisect_left(self._pairs, (old_value, row))]
+            del self._values[row]
+        if value is not None:
+            insort(self._pairs, (value, row))
+            self._values[row] = value
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Drop the rows that renumbered maps to -1 (see
+        bridge_table.renumbering) and renumber the others. Renumbering
+        keeps the order of rows, so the pairs stay sorted.
+
+        >>> index = SortedIndex.from_values([72.3, 55.0, 60.0, None, 85.1])
+        >>> index.delete_rows([0, -1, 1, 2, 3])
+        >>> index.rows_between(high=80), len(index)
+        ([0, 1], 3)
+        """
+
+        self._pairs = [(value, renumbered[row]) for value, row in self._pairs
+                       if renumbered[row] != -1]
+        self._values = {renumbered[row]: value
+                        for row, value in self._values.items()
+                        if renumbered[row] != -1}
+
+    def _bounds(self, low: float, high: float, include_low: bool,
+                include_high: bool) -> tuple[int, int]:
+        """Return the positions in self._pairs of the first pair in the range
+        and of the first pair after it.
+        """
+
+        if include_low:
+            start = bisect_left(self._pairs, (low, -inf))
+        else:
+            start = bisect_right(self._pairs, (low, inf))
+        if include_high:
+            end = bisect_right(self._pairs, (high, inf))
+        else:
+            end = bisect_left(self._pairs, (high, -inf))
+        return start, max(start, end)
+
+    @instrumented(result_rows)
+    def rows_between(self, low: float = -inf, high: float = inf,
+                     include_low: bool = True,
+                     include_high: bool = True) -> list[int]:
+        """Return the rows whose values are between low and high, in row
+        order. The bounds are included unless include_low or include_high is
+        False.
+        """
+
+        start, end = self._bounds(low, high, include_low, include_high)
+        return sorted(row for _, row in self._pairs[start:end])
+
+    def count_between(self, low: float = -inf, high: float = inf,
+                      include_low: bool = True,
+                      include_high: bool = True) -> int:
+        """Return the number of rows rows_between would return."""
+
+        start, end = self._bounds(low, high, include_low, include_high)
+        return end - start
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,230 @@
+"""Incremental refresh of loaded bridge data from a new export of the CSV.
+
+format_data numbers bridges by their position in the file, so reloading a
+new export can give the same structure a different id. A SourceIndex keys
+each loaded bridge by its source structure id (the raw ID column, such as
+'1 -  32/') and remembers the id it was given and the CSV line it was last
+loaded from. refresh diffs a new export against it: lines that are the
+same as before are skipped without being formatted, and only inserted,
+changed and deleted bridges are applied to the data, and so to the
+derived indexes of a BridgeTable. A bridge keeps its id for as long as its
+structure id is in the exports.
+
+A few structure ids appear more than once in an export; the bridges with
+such an id are told apart by the order they appear in.
+"""
+
+import csv
+from itertools import islice
+from typing import Iterator, NamedTuple, TextIO, Union
+
+from bci_history import BciHistory
+from bridge_functions import format_record
+from bridge_table import BridgeTable
+from bulk_import import refresh_rows, row_lookup
+from constants import ID_INDEX, BCIS_INDEX
+from lazy_records import HEADER_LINES, record_lines, split_line
+
+# The key of a bridge in a SourceIndex: its structure id, and how many
+# bridges with that structure id come before it in the file.
+SourceKey = tuple[str, int]
+
+
+class RefreshReport(NamedTuple):
+    """The ids of the bridges a refresh inserted, changed and deleted, each
+    in file order (deleted ids in id order).
+    """
+    inserted: list[int]
+    changed: list[int]
+    deleted: list[int]
+
+
+class SourceIndex:
+    """The structure id of every loaded bridge, with the id it was given and
+    the CSV line it was last loaded from.
+
+    >>> index = SourceIndex()
+    >>> index.add(('1 -  32/', 0), 'line 1')
+    1
+    >>> index.add(('1 -  43/', 0), 'line 2')
+    2
+    >>> index.ids[('1 -  43/', 0)], index.next_id
+    (2, 3)
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty index, whose first bridge gets id 1."""
+
+        self.ids = {}
+        self.lines = {}
+        self.next_id = 1
+
+    def add(self, key: SourceKey, line: str) -> int:
+        """Give the bridge at key, loaded from line, the next id, and return
+        it.
+        """
+
+        bridge_id = self.next_id
+        self.ids[key] = bridge_id
+        self.lines[key] = line
+        self.next_id += 1
+        return bridge_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _structure_id(line: str) -> str:
+    """Return the structure id, the first field, of the CSV line line.
+
+    >>> _structure_id('1 -  32/,A,403\\n')
+    '1 -  32/'
+    >>> _structure_id('"2 -  4/",B\\n')
+    '2 -  4/'
+    """
+
+    if line.startswith('"'):
+        return next(csv.reader([line]))[0]
+    return line.partition(',')[0].rstrip('\r\n')
+
+
+def _keyed_lines(csv_file: TextIO) -> Iterator[tuple[SourceKey, str]]:
+    """Yield the key and the CSV line, without its line ending, of every
+    record of the open CSV file csv_file, in file order.
+
+    >>> from io import StringIO
+    >>> list(_keyed_lines(StringIO(',,LOCATION\\nID,STRUCTURE\\n'
+    ...                            'A,1\\r\\nB,2\\r\\nA,3\\r\\n\\r\\n')))
+    [(('A', 0), 'A,1'), (('B', 0), 'B,2'), (('A', 1), 'A,3')]
+    """
+
+    seen = {}
+    for line in islice(record_lines(csv_file), HEADER_LINES, None):
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        structure_id = _structure_id(line)
+        occurrence = seen.get(structure_id, 0)
+        seen[structure_id] = occurrence + 1
+        yield (structure_id, occurrence), line
+
+
+def _parse(line: str, bridge_id: int) -> list:
+    """Return the record of the CSV line line, formatted as format_data
+    would format it, with id bridge_id.
+    """
+
+    bridge = split_line(line)
+    bridge[ID_INDEX] = bridge_id
+    format_record(bridge)
+    return bridge
+
+
+def read_source_index(csv_file: TextIO) -> SourceIndex:
+    """Return the SourceIndex of the open CSV file csv_file, with the ids
+    format_data gives the records of the file.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    index = SourceIndex()
+    for key, line in _keyed_lines(csv_file):
+        index.add(key, line)
+    return index
+
+
+def refresh(bridge_data: Union[BridgeTable, list[list]], index: SourceIndex,
+            csv_file: TextIO) -> RefreshReport:
+    """Bring bridge_data, loaded from the export index was read from (or
+    refreshed to since), up to date with the open CSV file csv_file, a new
+    export of the same data, and update index to match. Return a report of
+    the bridges inserted, changed and deleted.
+
+    Changed bridges keep their ids and are modified in place. New bridges
+    get ids after any id given before and are added at the end, and
+    deleted bridges are removed. Every record of csv_file is formatted
+    before anything is changed, so if one cannot be formatted, nothing is.
+    If the BCIs of bridge_data are kept in BciHistory objects (see
+    compact_histories), so are those of the changed and new bridges.
+
+    >>> from io import StringIO
+    >>> from bci_history import compact_histories
+    >>> from bridge_functions import read_data, format_data
+    >>> header = ',,LOCATION\\nID,STRUCTURE\\n'
+    >>> rows = ['1 -  32/,A,403,43.1,-80.2,1965,2014,2009,1,'
+    ...         'Total=65  (1)=65;,65,04/13/2012,72.3,,69.5\\n',
+    ...         '1 -  43/,B,403,43.2,-80.3,1963,2014,,1,'
+    ...         'Total=61  (1)=61;,61,04/13/2012,71.5\\n',
+    ...         '2 -   4/,C,6,45.0,-81.3,1958,2013,,1,'
+    ...         'Total=16  (1)=16;,18.4,08/28/2013,85.1\\n']
+    >>> bridges = read_data(StringIO(header + ''.join(rows)))
+    >>> format_data(bridges)
+    >>> table = BridgeTable(bridges)
+    >>> compact_histories(table)
+    >>> index = read_source_index(StringIO(header + ''.join(rows)))
+    >>> new_rows = [rows[0].replace('72.3', '60.1'), rows[2],
+    ...             rows[1].replace('1 -  43/,B', '3 -   7/,D')]
+    >>> refresh(table, index, StringIO(header + ''.join(new_rows)))
+    RefreshReport(inserted=[4], changed=[1], deleted=[2])
+    >>> [(bridge[ID_INDEX], bridge[1]) for bridge in table]
+    [(1, 'A'), (3, 'C'), (4, 'D')]
+    >>> list(table.bcis)
+    [60.1, 85.1, 71.5]
+    >>> [type(bridge[BCIS_INDEX]).__name__ for bridge in table]
+    ['BciHistory', 'BciHistory', 'BciHistory']
+    >>> refresh(table, index, StringIO(header + ''.join(new_rows)))
+    RefreshReport(inserted=[], changed=[], deleted=[])
+    """
+
+    inserted = []
+    changed = []
+    seen = set()
+    for key, line in _keyed_lines(csv_file):
+        seen.add(key)
+        old_line = index.lines.get(key)
+        if old_line is None:
+            inserted.append((key, line))
+        elif old_line != line:
+            changed.append((key, line))
+    deleted = [key for key in index.ids if key not in seen]
+
+    new_ids = range(index.next_id, index.next_id + len(inserted))
+    new_bridges = [_parse(line, bridge_id)
+                   for (_, line), bridge_id in zip(inserted, new_ids)]
+    changed_bridges = [_parse(line, index.ids[key]) for key, line in changed]
+    if bridge_data and isinstance(bridge_data[0][BCIS_INDEX], BciHistory):
+        for bridge in changed_bridges + new_bridges:
+            bridge[BCIS_INDEX] = BciHistory(bridge[BCIS_INDEX])
+
+    row_of = row_lookup(bridge_data)
+    touched = set()
+    for bridge in changed_bridges:
+        row = row_of(bridge[ID_INDEX])
+        bridge_data[row][:] = bridge
+        touched.add(row)
+    refresh_rows(bridge_data, touched)
+
+    deleted_ids = sorted(index.ids[key] for key in deleted)
+    deleted_rows = {row_of(bridge_id) for bridge_id in deleted_ids}
+    if isinstance(bridge_data, BridgeTable):
+        bridge_data.delete_rows(deleted_rows)
+    elif deleted_rows:
+        bridge_data[:] = [bridge for row, bridge in enumerate(bridge_data)
+                          if row not in deleted_rows]
+    for bridge in new_bridges:
+        bridge_data.append(bridge)
+
+    for key in deleted:
+        del index.ids[key]
+        del index.lines[key]
+    for key, line in changed:
+        index.lines[key] = line
+    for key, line in inserted:
+        index.add(key, line)
+    return RefreshReport(list(new_ids), [bridge[ID_INDEX] for bridge
+                                         in changed_bridges], deleted_ids)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
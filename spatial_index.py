@@ -0,0 +1,307 @@
+"""A latitude/longitude grid index over the bridges in a BridgeTable.
+
+Bridges are bucketed into square cells of cell_size degrees. A query only
+visits the cells overlapping a bounding box that is guaranteed to contain
+every bridge within the query radius, and then checks the candidates with
+the same rounded haversine distance as calculate_distance, so results
+(including the <= radius boundary) match a full scan exactly.
+"""
+
+from math import asin, cos, degrees, floor, pi, radians, sin
+from typing import Iterable, Optional
+
+from bridge_table import BridgeTable
+from constants import EARTH_RADIUS
+from haversine import bridge_distances_at
+from instrumentation import instrumented, result_rows
+
+DEFAULT_CELL_SIZE = 0.5
+
+# Distances are rounded to the meter before they are compared with a radius,
+# so a bridge up to half a meter outside the radius still counts as inside.
+ROUNDING_MARGIN = 0.001
+
+# Radius (in kilometers) of the first search in a nearest-bridge query.
+FIRST_NEAREST_RADIUS = 10
+
+
+class GridIndex:
+    """A grid index answering radius, nearest and bounding-box queries over
+    the bridges in a BridgeTable.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> index = GridIndex(BridgeTable(THREE_BRIDGES))
+    >>> index.in_radius(43.10, -80.15, 50)
+    [1, 2]
+    >>> index.nearest(43.10, -80.15, 2)
+    [2, 1]
+    >>> index.in_box(43.0, -81.0, 44.0, -80.0)
+    [1, 2]
+    """
+
+    def __init__(self, table: BridgeTable,
+                 cell_size: float = DEFAULT_CELL_SIZE,
+                 rows: Optional[Iterable[int]] = None) -> None:
+        """Initialize an index over the bridges in table with cells of
+        cell_size degrees. If rows is given, only the bridges at those rows
+        are indexed. Bridges without a location are never indexed.
+        """
+
+        self.table = table
+        self.cell_size = cell_size
+        self.cells = {}
+        self._cell_of = {}
+        if rows is None:
+            rows = range(len(table))
+        for row in rows:
+            self.add(row)
+
+    def add(self, row: int) -> None:
+        """Add the bridge at row of the table to the index."""
+
+        key = self._row_cell(row)
+        if key is not None:
+            self.cells.setdefault(key, []).append(row)
+            self._cell_of[row] = key
+
+    def remove(self, row: int) -> None:
+        """Remove the bridge at row of the table from the index. Rows not in
+        the index are ignored.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> index = GridIndex(BridgeTable(THREE_BRIDGES))
+        >>> index.remove(0)
+        >>> index.in_radius(43.10, -80.15, 50)
+        [2]
+        """
+
+        key = self._cell_of.pop(row, None)
+        if key is None:
+            return
+        cell = self.cells[key]
+        cell.remove(row)
+        if not cell:
+            del self.cells[key]
+
+    def update(self, row: int) -> None:
+        """Move the bridge at row of the table to the cell of its current
+        location, adding it if it is new to the index.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> index = GridIndex(table)
+        >>> table[2][3], table[2][4] = 43.16, -80.26
+        >>> table.refresh_row(2)
+        >>> index.update(2)
+        >>> index.in_radius(43.10, -80.15, 50)
+        [1, 2, 3]
+        """
+
+        if self._cell_of.get(row) != self._row_cell(row):
+            self.remove(row)
+            self.add(row)
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Remove the bridges at the rows that renumbered maps to -1 (see
+        bridge_table.renumbering) from the index, and renumber the others.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> index = get_grid_index(table)
+        >>> table.delete_rows([1])
+        >>> index.in_radius(43.10, -80.15, 50), index.nearest(45.0, -81.3)
+        ([1], [3])
+        """
+
+        self._cell_of = {renumbered[row]: key
+                         for row, key in self._cell_of.items()
+                         if renumbered[row] != -1}
+        for key, cell in list(self.cells.items()):
+            cell[:] = [renumbered[row] for row in cell
+                       if renumbered[row] != -1]
+            if not cell:
+                del self.cells[key]
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        """Return the key of the cell containing the location (lat, lon)."""
+
+        return floor(lat / self.cell_size), floor(lon / self.cell_size)
+
+    def _row_cell(self, row: int) -> Optional[tuple[int, int]]:
+        """Return the key of the cell containing the bridge at row of the
+        table, or None if the bridge has no location.
+        """
+
+        lat, lon = self.table.lats[row], self.table.lons[row]
+        if lat != lat or lon != lon:
+            return None
+        return self._cell(lat, lon)
+
+    def _candidate_rows(self, min_lat: float, min_lon: float,
+                        max_lat: float, max_lon: float) -> list[int]:
+        """Return the rows of all bridges in cells overlapping the box from
+        (min_lat, min_lon) to (max_lat, max_lon), in no particular order.
+        """
+
+        low_row, low_col = self._cell(min_lat, min_lon)
+        high_row, high_col = self._cell(max_lat, max_lon)
+        rows = []
+        if ((high_row - low_row + 1) * (high_col - low_col + 1)
+                > len(self.cells)):
+            for (cell_row, cell_col), cell in self.cells.items():
+                if (low_row <= cell_row <= high_row
+                        and low_col <= cell_col <= high_col):
+                    rows.extend(cell)
+            return rows
+
+        for cell_row in range(low_row, high_row + 1):
+            for cell_col in range(low_col, high_col + 1):
+                rows.extend(self.cells.get((cell_row, cell_col), ()))
+        return rows
+
+    @instrumented(result_rows)
+    def _radius_candidates(self, lat: float, lon: float,
+                           radius: float) -> list[int]:
+        """Return the rows of all bridges in cells that may hold bridges
+        within radius kilometers of (lat, lon), in no particular order.
+        """
+
+        angle = (radius + ROUNDING_MARGIN) / EARTH_RADIUS
+        if angle >= pi:
+            return [row for cell in self.cells.values() for row in cell]
+        lat_span = degrees(angle)
+        min_lat, max_lat = lat - lat_span, lat + lat_span
+        min_lon, max_lon = -180.0, 180.0
+        if min_lat > -90 and max_lat < 90:
+            ratio = sin(angle) / cos(radians(lat))
+            if ratio < 1:
+                lon_span = degrees(asin(ratio))
+                if lon - lon_span >= -180 and lon + lon_span <= 180:
+                    min_lon, max_lon = lon - lon_span, lon + lon_span
+        return self._candidate_rows(min_lat, min_lon, max_lat, max_lon)
+
+    def _within(self, lat: float, lon: float,
+                radius: float) -> list[tuple[int, float]]:
+        """Return (row, distance) pairs, sorted by row, for every bridge whose
+        rounded distance to (lat, lon) is at most radius.
+        """
+
+        rows = sorted(self._radius_candidates(lat, lon, radius))
+        return [(row, distance) for row, distance
+                in zip(rows, bridge_distances_at(self.table, rows, lat, lon))
+                if distance <= radius]
+
+    def count_candidates(self, lat: float, lon: float,
+                         radius: float) -> int:
+        """Return the number of bridges a radius query around (lat, lon)
+        would check, an upper bound on the number it would return.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> GridIndex(BridgeTable(THREE_BRIDGES)).count_candidates(
+        ...     43.10, -80.15, 50)
+        2
+        """
+
+        return len(self._radius_candidates(lat, lon, radius))
+
+    def rows_in_radius(self, lat: float, lon: float,
+                       radius: float) -> list[int]:
+        """Return the table rows of the bridges within radius kilometers of
+        the location (lat, lon), in table order.
+        """
+
+        return [row for row, _ in self._within(lat, lon, radius)]
+
+    def in_radius(self, lat: float, lon: float, radius: float) -> list[int]:
+        """Return the ids of the bridges within radius kilometers of the
+        location (lat, lon), in the same order as get_bridges_in_radius.
+        """
+
+        ids = self.table.ids
+        return [ids[row] for row, _ in self._within(lat, lon, radius)]
+
+    def in_radii(self, lat: float, lon: float,
+                 radii: list[float]) -> list[list[int]]:
+        """Return what in_radius returns for each radius in radii around the
+        location (lat, lon), from one lookup at the largest radius.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> GridIndex(BridgeTable(THREE_BRIDGES)).in_radii(
+        ...     43.10, -80.15, [50, 11, 300])
+        [[1, 2], [2], [1, 2, 3]]
+        """
+
+        if not radii:
+            return []
+        within = self._within(lat, lon, max(radii))
+        ids = self.table.ids
+        return [[ids[row] for row, distance in within if distance <= radius]
+                for radius in radii]
+
+    @instrumented()
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                exclude_zero: bool = False) -> list[int]:
+        """Return the ids of the (at most) k bridges closest to the location
+        (lat, lon), closest first, breaking ties by table order. If
+        exclude_zero is True, bridges at distance 0 from the location are
+        skipped, like get_closest_bridge skips the bridge itself.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> index = GridIndex(BridgeTable(THREE_BRIDGES))
+        >>> index.nearest(45.036739, -81.33579, 1)
+        [3]
+        >>> index.nearest(45.036739, -81.33579, 1, True)
+        [1]
+        >>> index.nearest(45.036739, -81.33579, 5, True)
+        [1, 2]
+        """
+
+        radius = FIRST_NEAREST_RADIUS
+        while True:
+            found = [(distance, row) for row, distance
+                     in self._within(lat, lon, radius)
+                     if distance != 0 or not exclude_zero]
+            if len(found) >= k or radius >= pi * EARTH_RADIUS:
+                break
+            radius *= 2
+        found.sort()
+        ids = self.table.ids
+        return [ids[row] for _, row in found[:k]]
+
+    def in_box(self, min_lat: float, min_lon: float,
+               max_lat: float, max_lon: float) -> list[int]:
+        """Return the ids, in table order, of the bridges whose location is
+        inside the box from (min_lat, min_lon) to (max_lat, max_lon),
+        boundaries included.
+        """
+
+        lats = self.table.lats
+        lons = self.table.lons
+        ids = self.table.ids
+        return [ids[row] for row in sorted(self._candidate_rows(
+            min_lat, min_lon, max_lat, max_lon))
+                if min_lat <= lats[row] <= max_lat
+                and min_lon <= lons[row] <= max_lon]
+
+
+def get_grid_index(table: BridgeTable) -> GridIndex:
+    """Return the grid index of table, building it on first use. The index
+    follows later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_grid_index(table) is get_grid_index(table)
+    True
+    """
+
+    if 'grid' not in table.derived:
+        table.derived['grid'] = GridIndex(table)
+        table.listeners.append(table.derived['grid'].update)
+        table.removers.append(table.derived['grid'].delete_rows)
+    return table.derived['grid']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,108 @@
+"""Synthetic bridge data CSV files in the format of bridge_data.csv.
+
+Every synthetic record is a record of a template file (bridge_data.csv by
+default) moved a few kilometers away, with a new unique id and its BCI
+history shifted up or down. Copying real records keeps the two header
+rows, span details strings, sparse year columns and highway names exactly
+as they appear in the real data, and scattering the copies around real
+bridges keeps the spatial clustering of the real network.
+"""
+
+import csv
+import random
+from itertools import islice
+from typing import TextIO
+
+from bridge_io import HEADER_LINES
+from constants import BCIS_INDEX, LAT_INDEX, LON_INDEX
+
+# Standard deviation, in degrees, of the offset of a synthetic bridge from
+# the real bridge it is copied from (0.05 degrees is about 5 km).
+LOCATION_JITTER = 0.05
+
+# Standard deviation of the shift applied to the BCI history of a copy.
+BCI_JITTER = 3.0
+
+
+def _shift_bcis(record: list[str], shift: float) -> None:
+    """Add shift to every non-empty BCI of the raw record record, keeping
+    the scores between 0 and 100.
+
+    >>> record = ['1 -  32/', 'A', '403', '43.1', '-80.2', '1965', '', '',
+    ...           '1', 'Total=12  (1)=12;', '12', '04/13/2012', '72.3', '',
+    ...           '72.3', '', '69.5']
+    >>> _shift_bcis(record, 30.0)
+    >>> record[BCIS_INDEX:]
+    ['100.0', '', '100.0', '', '99.5']
+    """
+
+    for index in range(BCIS_INDEX, len(record)):
+        if record[index]:
+            bci = min(100.0, max(0.0, float(record[index]) + shift))
+            record[index] = str(round(bci, 1))
+
+
+def synthetic_record(template: list[str], number: int,
+                     rng: random.Random) -> list[str]:
+    """Return a raw record copied from the raw record template, with the id
+    built from number, a location near the template's and a shifted BCI
+    history, using rng for randomness.
+
+    >>> template = ['1 -  32/', 'A', '403', '43.167233', '-80.275567']
+    >>> record = synthetic_record(template, 1042, random.Random(0))
+    >>> record[0], record[1:3]
+    ('2 -  42/', ['A', '403'])
+    >>> abs(float(record[LAT_INDEX]) - 43.167233) < 1
+    True
+    """
+
+    record = list(template)
+    record[0] = f'{number // 1000 + 1} - {number % 1000:>3}/'
+    if record[LAT_INDEX] and record[LON_INDEX]:
+        record[LAT_INDEX] = str(round(
+            float(record[LAT_INDEX]) + rng.gauss(0, LOCATION_JITTER), 6))
+        record[LON_INDEX] = str(round(
+            float(record[LON_INDEX]) + rng.gauss(0, LOCATION_JITTER), 6))
+    _shift_bcis(record, rng.gauss(0, BCI_JITTER))
+    return record
+
+
+def write_synthetic_csv(template_file: TextIO, out_file: TextIO,
+                        scale: int, seed: int = 0) -> int:
+    """Write scale times as many records as the open bridge data CSV file
+    template_file holds to the open file out_file, with template_file's
+    header lines, and return the number of records written. The same seed
+    always gives the same file. out_file should be opened with newline=''.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    reader = csv.reader(template_file)
+    header = list(islice(reader, HEADER_LINES))
+    templates = list(reader)
+    rng = random.Random(seed)
+    writer = csv.writer(out_file)
+    writer.writerows(header)
+    count = scale * len(templates)
+    for number in range(count):
+        writer.writerow(synthetic_record(rng.choice(templates), number, rng))
+    return count
+
+
+def generate(template_path: str, out_path: str, scale: int,
+             seed: int = 0) -> int:
+    """Write a synthetic CSV file at out_path scale times the size of the
+    bridge data CSV file at template_path, and return its number of
+    records.
+
+    Docstring examples not given since the function reads from a file.
+    """
+
+    with open(template_path, newline='') as template_file, \
+            open(out_path, 'w', newline='') as out_file:
+        return write_synthetic_csv(template_file, out_file, scale, seed)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,280 @@
+"""A pyramid of map tiles with condition summaries of the bridges in them.
+
+Level z of the pyramid splits the map into 2 ** z by 2 ** z tiles of equal
+latitude and longitude size, so each tile of level z is split into four
+tiles of level z + 1, down to MAX_LEVEL. Every tile with bridges in it
+keeps its bridge count, BCI count and sum, counts of bridges at or below
+HIGH_PRIORITY_BCI, MEDIUM_PRIORITY_BCI and LOW_PRIORITY_BCI, and total
+deck length, so the summary of a tile or of a region of whole tiles is read
+without looking at any bridge.
+
+The pyramid is built in one pass over the table, which fills the tiles of
+MAX_LEVEL, and one pass over the tiles of each level, which fills the
+tiles of the level above. When a bridge changes (for example its current
+BCI through inspect_bridges), its old values are taken out of the
+MAX_LEVEL + 1 tiles containing it and its new ones added, so sums equal
+those of a full rebuild up to float rounding.
+"""
+
+from math import floor
+from typing import NamedTuple, Optional, Sequence
+
+from bridge_table import BridgeTable, compact
+from constants import (
+    HIGH_PRIORITY_BCI, MEDIUM_PRIORITY_BCI, LOW_PRIORITY_BCI)
+
+# Deepest level of the pyramid. Its tiles are about 0.09 degrees wide and
+# 0.04 degrees high, a few kilometers across.
+MAX_LEVEL = 12
+
+
+class TileSummary(NamedTuple):
+    """The condition summary of the bridges in a tile or region. mean_bci is
+    0.0 if none of them has a BCI. Bridges without a deck length add nothing
+    to total_length.
+    """
+    bridge_count: int
+    mean_bci: float
+    high_priority_count: int
+    medium_priority_count: int
+    low_priority_count: int
+    total_length: float
+
+
+# The position of each aggregate in the list kept for a tile.
+(COUNT, BCI_COUNT, BCI_SUM, HIGH_COUNT, MEDIUM_COUNT, LOW_COUNT,
+ LENGTH_SUM) = range(7)
+
+
+def _empty() -> list:
+    """Return the aggregates of a tile with no bridges."""
+
+    return [0, 0, 0.0, 0, 0, 0, 0.0]
+
+
+def _merge(aggregates: list, values: Sequence) -> None:
+    """Add values, position by position, to the tile aggregates aggregates.
+
+    >>> aggregates = _empty()
+    >>> _merge(aggregates, (1, 1, 72.3, 0, 0, 1, 65.0))
+    >>> aggregates
+    [1, 1, 72.3, 0, 0, 1, 65.0]
+    """
+
+    for position, value in enumerate(values):
+        aggregates[position] += value
+
+
+def _summary(aggregates: Optional[list]) -> TileSummary:
+    """Return the summary of the tile aggregates aggregates, which may be
+    None for an empty tile.
+
+    >>> _summary([2, 2, 131.0, 0, 1, 2, 126.0])
+    TileSummary(bridge_count=2, mean_bci=65.5, high_priority_count=0, \
+medium_priority_count=1, low_priority_count=2, total_length=126.0)
+    >>> _summary(None).bridge_count
+    0
+    """
+
+    if aggregates is None:
+        return TileSummary(0, 0.0, 0, 0, 0, 0.0)
+    bci_count = aggregates[BCI_COUNT]
+    return TileSummary(aggregates[COUNT],
+                       aggregates[BCI_SUM] / bci_count if bci_count else 0.0,
+                       aggregates[HIGH_COUNT], aggregates[MEDIUM_COUNT],
+                       aggregates[LOW_COUNT], aggregates[LENGTH_SUM])
+
+
+def tile_of(level: int, lat: float, lon: float) -> tuple[int, int]:
+    """Return the (column, row) of the tile of level containing the
+    location (lat, lon), counted from longitude -180 and latitude -90.
+
+    >>> tile_of(1, 43.1, -80.2), tile_of(3, 43.1, -80.2)
+    ((0, 1), (2, 5))
+    >>> tile_of(0, 90.0, 180.0)
+    (0, 0)
+    """
+
+    size = 1 << level
+    return (min(floor((lon + 180) / 360 * size), size - 1),
+            min(floor((lat + 90) / 180 * size), size - 1))
+
+
+class TilePyramid:
+    """Condition summaries of the tiles of every level of a table's map.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> pyramid = TilePyramid(BridgeTable(THREE_BRIDGES))
+    >>> pyramid.summary(0, 0, 0)
+    TileSummary(bridge_count=3, mean_bci=76.3, high_priority_count=0, \
+medium_priority_count=0, low_priority_count=3, total_length=144.4)
+    >>> sorted(pyramid.level_summaries(7))
+    [(35, 94), (35, 96)]
+    >>> pyramid.region(7, 43.0, -81.0, 44.0, -80.0).bridge_count
+    2
+    """
+
+    def __init__(self, table: BridgeTable, max_level: int = MAX_LEVEL) -> None:
+        """Initialize the pyramid of the bridges in table, with levels 0 to
+        max_level.
+        """
+
+        self.table = table
+        self.max_level = max_level
+        self.levels = [{} for _ in range(max_level + 1)]
+        self._contributions = []
+        deepest = self.levels[max_level]
+        for row in range(len(table)):
+            contribution = self._contribution(row)
+            self._contributions.append(contribution)
+            if contribution is not None:
+                key, values = contribution
+                _merge(deepest.setdefault(key, _empty()), values)
+        for level in range(max_level - 1, -1, -1):
+            tiles = self.levels[level]
+            for (column, row), aggregates in self.levels[level + 1].items():
+                _merge(tiles.setdefault((column >> 1, row >> 1),
+                                        _empty()), aggregates)
+
+    def _contribution(self, row: int) -> Optional[tuple]:
+        """Return the deepest tile of the bridge at row of the table and the
+        aggregates it adds to each tile containing it, or None if the bridge
+        has no location.
+        """
+
+        lat = self.table.lats[row]
+        lon = self.table.lons[row]
+        if lat != lat or lon != lon:
+            return None
+        bci = self.table.bcis[row]
+        length = self.table.lengths[row]
+        has_bci = bci == bci
+        return (tile_of(self.max_level, lat, lon),
+                (1, int(has_bci), bci if has_bci else 0.0,
+                 int(has_bci and bci <= HIGH_PRIORITY_BCI),
+                 int(has_bci and bci <= MEDIUM_PRIORITY_BCI),
+                 int(has_bci and bci <= LOW_PRIORITY_BCI),
+                 length if length == length else 0.0))
+
+    def _add(self, contribution: Optional[tuple], sign: int) -> None:
+        """Add contribution to (sign 1) or take it out of (sign -1) every
+        tile containing its deepest tile, dropping tiles left empty.
+        """
+
+        if contribution is None:
+            return
+        (column, row), values = contribution
+        for level in range(self.max_level, -1, -1):
+            shift = self.max_level - level
+            key = (column >> shift, row >> shift)
+            tiles = self.levels[level]
+            aggregates = tiles.get(key)
+            if aggregates is None:
+                aggregates = tiles[key] = _empty()
+            for position, value in enumerate(values):
+                aggregates[position] += sign * value
+            if aggregates[COUNT] == 0:
+                del tiles[key]
+
+    def update(self, row: int) -> None:
+        """Bring the pyramid up to date with the bridge at row of the table,
+        which may be new.
+
+        >>> from bridge_functions import THREE_BRIDGES, inspect_bridges
+        >>> from copy import deepcopy
+        >>> table = BridgeTable(deepcopy(THREE_BRIDGES))
+        >>> pyramid = get_tile_pyramid(table)
+        >>> inspect_bridges(table, [3], '09/15/2018', 58.0)
+        >>> pyramid.summary(7, 35, 96).high_priority_count
+        1
+        >>> round(pyramid.summary(0, 0, 0).mean_bci, 2)
+        67.27
+        """
+
+        contribution = self._contribution(row)
+        if row == len(self._contributions):
+            self._contributions.append(None)
+        elif self._contributions[row] == contribution:
+            return
+        self._add(self._contributions[row], -1)
+        self._add(contribution, 1)
+        self._contributions[row] = contribution
+
+    def delete_rows(self, renumbered: list[int]) -> None:
+        """Take the bridges at the rows that renumbered maps to -1 (see
+        bridge_table.renumbering) out of the pyramid.
+
+        >>> from bridge_functions import THREE_BRIDGES
+        >>> table = BridgeTable(list(THREE_BRIDGES))
+        >>> pyramid = get_tile_pyramid(table)
+        >>> table.delete_rows([2])
+        >>> pyramid.summary(0, 0, 0).bridge_count, pyramid.level_summaries(7)
+        (2, {(35, 94): TileSummary(bridge_count=2, mean_bci=71.9, \
+high_priority_count=0, medium_priority_count=0, low_priority_count=2, \
+total_length=126.0)})
+        """
+
+        for contribution, row in zip(self._contributions, renumbered):
+            if row == -1:
+                self._add(contribution, -1)
+        compact(self._contributions, renumbered)
+
+    def summary(self, level: int, column: int, row: int) -> TileSummary:
+        """Return the summary of the tile (column, row) of level."""
+
+        return _summary(self.levels[level].get((column, row)))
+
+    def level_summaries(self, level: int) -> dict[tuple[int, int],
+                                                  TileSummary]:
+        """Return the summary of every tile of level with bridges in it, by
+        (column, row).
+        """
+
+        return {key: _summary(aggregates)
+                for key, aggregates in self.levels[level].items()}
+
+    def region(self, level: int, min_lat: float, min_lon: float,
+               max_lat: float, max_lon: float) -> TileSummary:
+        """Return the summary of the bridges in the tiles of level that
+        overlap the box from (min_lat, min_lon) to (max_lat, max_lon).
+        """
+
+        low_column, low_row = tile_of(level, min_lat, min_lon)
+        high_column, high_row = tile_of(level, max_lat, max_lon)
+        tiles = self.levels[level]
+        if ((high_column - low_column + 1) * (high_row - low_row + 1)
+                > len(tiles)):
+            keys = [(column, row) for column, row in tiles
+                    if low_column <= column <= high_column
+                    and low_row <= row <= high_row]
+        else:
+            keys = [(column, row)
+                    for column in range(low_column, high_column + 1)
+                    for row in range(low_row, high_row + 1)
+                    if (column, row) in tiles]
+        totals = _empty()
+        for key in keys:
+            _merge(totals, tiles[key])
+        return _summary(totals)
+
+
+def get_tile_pyramid(table: BridgeTable) -> TilePyramid:
+    """Return the tile pyramid of table, building it on first use. The
+    pyramid follows later changes to table.
+
+    >>> from bridge_functions import THREE_BRIDGES
+    >>> table = BridgeTable(THREE_BRIDGES)
+    >>> get_tile_pyramid(table) is get_tile_pyramid(table)
+    True
+    """
+
+    if 'tiles' not in table.derived:
+        table.derived['tiles'] = TilePyramid(table)
+        table.listeners.append(table.derived['tiles'].update)
+        table.removers.append(table.derived['tiles'].delete_rows)
+    return table.derived['tiles']
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()